@@ -0,0 +1,121 @@
+"""Measure the throughput of ``trio_typing.channels`` against sending
+and receiving one item at a time.
+
+Each run passes a number of small items from one task to another
+through a memory channel, with a few buffer sizes, either one item per
+``await channel.send()`` and ``await channel.receive()``, or in batches
+with ``send_batch()`` and ``receive_batch()``::
+
+    python bench/channels.py -o results.json
+"""
+
+import argparse
+import datetime
+import json
+import platform
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import trio
+from trio_typing.channels import receive_batch, send_batch
+
+BUFFER_SIZES = (1, 16, 256)
+
+
+async def per_item(num_items: int, buffer_size: int) -> None:
+    send_channel, receive_channel = trio.open_memory_channel[int](buffer_size)
+
+    async def produce() -> None:
+        async with send_channel:
+            for item in range(num_items):
+                await send_channel.send(item)
+
+    async with trio.open_nursery() as nursery:
+        nursery.start_soon(produce)
+        async for _ in receive_channel:
+            pass
+
+
+async def batched(num_items: int, buffer_size: int) -> None:
+    send_channel, receive_channel = trio.open_memory_channel[int](buffer_size)
+
+    async def produce() -> None:
+        async with send_channel:
+            await send_batch(send_channel, range(num_items))
+
+    async with trio.open_nursery() as nursery:
+        nursery.start_soon(produce)
+        while True:
+            try:
+                await receive_batch(receive_channel, max(buffer_size, 1))
+            except trio.EndOfChannel:
+                break
+
+
+CASES = {
+    "per item": per_item,
+    "batched": batched,
+}  # type: Dict[str, Callable[[int, int], Awaitable[None]]]
+
+
+def measure(
+    run: Callable[[int, int], Awaitable[None]],
+    num_items: int,
+    buffer_size: int,
+    repeat: int,
+) -> float:
+    """Return the best time to pass ``num_items`` items through the
+    channel, in seconds.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        trio.run(run, num_items, buffer_size)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("-o", "--output", help="write results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    print("{:>8} {:>10} {:>12} {:>10}".format("buffer", "case", "items/s", "speedup"))
+    results = []  # type: List[Dict[str, Any]]
+    for buffer_size in BUFFER_SIZES:
+        baseline = None  # type: Optional[float]
+        for name, run in CASES.items():
+            seconds = measure(run, args.items, buffer_size, args.repeat)
+            if baseline is None:
+                baseline = seconds
+            print(
+                "{:>8} {:>10} {:>12.0f} {:>9.1f}x".format(
+                    buffer_size, name, args.items / seconds, baseline / seconds
+                )
+            )
+            results.append(
+                {
+                    "case": name,
+                    "buffer_size": buffer_size,
+                    "items": args.items,
+                    "seconds": seconds,
+                }
+            )
+
+    if args.output:
+        report = {
+            "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "trio": getattr(trio, "__version__", None),
+            "results": results,
+        }
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2, sort_keys=True)
+            file.write("\n")
+
+
+if __name__ == "__main__":
+    main()
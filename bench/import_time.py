@@ -0,0 +1,154 @@
+"""Measure how long ``import trio_typing`` takes at runtime.
+
+Each sample imports ``trio_typing`` in a fresh interpreter and reports
+the time spent in the import statement itself (so interpreter startup
+isn't counted), the number of modules it added to ``sys.modules``, and
+whether Trio was among them. Results can be saved as JSON and compared::
+
+    python bench/import_time.py -o before.json
+    # ... change things ...
+    python bench/import_time.py -o after.json
+    python bench/import_time.py --compare before.json after.json
+
+For a per-module breakdown, use ``python -X importtime -c "import
+trio_typing"`` (Python 3.7+).
+"""
+
+import argparse
+import datetime
+import json
+import platform
+import statistics
+import subprocess
+import sys
+from typing import Any, Dict, List, Optional
+
+MEASURE = """\
+import json, sys, time
+before = set(sys.modules)
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    "seconds": elapsed,
+    "new_modules": len(set(sys.modules) - before),
+    "imports_trio": "trio" in sys.modules,
+}}))
+"""
+
+
+def measure_once(module: str) -> Dict[str, Any]:
+    output = subprocess.check_output(
+        [sys.executable, "-c", MEASURE.format(module=module)]
+    )
+    return json.loads(output.decode("utf-8"))
+
+
+def measure(module: str, repeat: int) -> Dict[str, Any]:
+    # The first run warms the filesystem and bytecode caches
+    measure_once(module)
+    samples = [measure_once(module) for _ in range(repeat)]
+    times = [sample["seconds"] for sample in samples]
+    return {
+        "module": module,
+        "repeat": repeat,
+        "min_seconds": min(times),
+        "median_seconds": statistics.median(times),
+        "max_seconds": max(times),
+        "new_modules": samples[-1]["new_modules"],
+        "imports_trio": samples[-1]["imports_trio"],
+    }
+
+
+def versions() -> Dict[str, str]:
+    import trio_typing
+
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "trio_typing": trio_typing.__version__,
+    }
+
+
+ROW_FORMAT = (
+    "{module:>12} {min_seconds:8.4f}s {median_seconds:8.4f}s "
+    "{max_seconds:8.4f}s {new_modules:8d} {imports_trio!s:>7}"
+)
+
+
+def compare(before_path: str, after_path: str) -> None:
+    with open(before_path) as file:
+        before = json.load(file)
+    with open(after_path) as file:
+        after = json.load(file)
+    old = {result["module"]: result for result in before["results"]}
+    print(
+        "{:>12} {:>10} {:>10} {:>8} {:>8} {:>8}".format(
+            "module", "before", "after", "change", "modules", "trio"
+        )
+    )
+    for result in after["results"]:
+        previous = old.get(result["module"])
+        if previous is None:
+            continue
+        old_time, new_time = previous["median_seconds"], result["median_seconds"]
+        print(
+            "{:>12} {:9.4f}s {:9.4f}s {:+7.1%} {:>8} {:>8}".format(
+                result["module"],
+                old_time,
+                new_time,
+                (new_time - old_time) / old_time,
+                "{}->{}".format(previous["new_modules"], result["new_modules"]),
+                "{}->{}".format(previous["imports_trio"], result["imports_trio"]),
+            )
+        )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--modules",
+        default="trio_typing",
+        help="comma-separated modules to time (default: trio_typing)",
+    )
+    parser.add_argument(
+        "-n", "--repeat", type=int, default=20, help="number of samples per module"
+    )
+    parser.add_argument("-o", "--output", help="write results as JSON to this file")
+    parser.add_argument(
+        "--compare",
+        nargs=2,
+        metavar=("BEFORE", "AFTER"),
+        help="compare two result files instead of running anything",
+    )
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    print(
+        "{:>12} {:>9} {:>9} {:>9} {:>8} {:>7}".format(
+            "module", "min", "median", "max", "modules", "trio"
+        )
+    )
+    results = []
+    for module in args.modules.split(","):
+        result = measure(module, args.repeat)
+        print(ROW_FORMAT.format(**result))
+        results.append(result)
+
+    if args.output:
+        report = {
+            "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+            "versions": versions(),
+            "results": results,
+        }
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2, sort_keys=True)
+            file.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,389 @@
+"""Measure how long mypy takes to check Trio programs, with and without
+``trio_typing.plugin``.
+
+This generates synthetic Trio programs of a few different sizes (the
+smallest, ``hello``, is a single hello-world module, so its cold time
+is mostly spent processing the stubs it imports) and typechecks each
+of them several ways:
+
+* ``cold``: with an empty incremental cache
+* ``warm``: again, with the cache left by the cold run and no changes
+* ``incremental``: after editing the body of one function in the module
+  that everything else depends on
+* ``restored`` (only with ``--stub-cache``): with a cache that only has
+  the stubs in it, restored by ``python -m trio_typing.stub_cache`` from
+  an archive built beforehand; the time includes the restore, but not
+  the build
+
+Each run happens in its own subprocess, so the peak memory usage we
+report (the maximum resident set size) belongs to that run alone.
+Results are written as JSON so they can be compared between releases::
+
+    python bench/typecheck.py --sizes small,medium -o before.json
+    # ... upgrade or change things ...
+    python bench/typecheck.py --sizes small,medium -o after.json
+    python bench/typecheck.py --compare before.json after.json
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+# name -> (number of modules, number of start_soon/start calls per module)
+SIZES = {
+    "hello": (1, 0),
+    "tiny": (1, 10),
+    "small": (5, 20),
+    "medium": (20, 50),
+    "large": (50, 100),
+}
+
+PHASES = ("cold", "warm", "incremental")
+
+HELLO_MODULE = """\
+import trio
+
+
+async def main() -> None:
+    print("hello")
+    await trio.sleep(0)
+
+
+trio.run(main)
+"""
+
+MODULE_TEMPLATE = """\
+import trio
+import trio_typing
+from typing import List, Union
+from async_generator import async_generator, yield_, yield_from_
+from trio_typing import TaskStatus, YieldType, SendType
+{imports}
+
+async def worker_{idx}(value: int, label: str) -> None:
+    await trio.sleep(0)
+
+
+async def starter_{idx}(value: int, *, task_status: TaskStatus[int]) -> None:
+    task_status.started(value)
+
+
+@async_generator
+async def numbers_{idx}(limit: int) -> Union[None, YieldType[int], SendType[None]]:
+    for i in range(limit):
+        await yield_(i)
+    await yield_from_(numbers_{idx}(limit - 1))
+    return None
+
+
+async def read_all_{idx}(path: str) -> bytes:
+    async with await trio.open_file(path, "rb") as file:
+        data = await file.read()
+    async with await trio.Path(path).open("rb", 0) as raw:
+        await raw.read()
+    async with await trio.open_file(path) as text:
+        await text.read()
+    return data
+
+
+async def main_{idx}() -> List[int]:
+    results = []  # type: List[int]
+    async with trio.open_nursery() as nursery:
+{calls}
+    async for number in numbers_{idx}(10):
+        results.append(number)
+    return results
+"""
+
+CALL_TEMPLATES = (
+    "        nursery.start_soon(worker_{target}, {n}, {label!r})",
+    "        results.append(await nursery.start(starter_{target}, {n}))",
+)
+
+
+def module_source(idx: int, num_modules: int, num_calls: int) -> str:
+    """Return the source of generated module number ``idx``. Every module
+    but the first imports the first one and spawns some of its tasks, so
+    that editing the first module invalidates everything else.
+    Without any calls, this is the hello-world module.
+    """
+    if num_calls == 0:
+        return HELLO_MODULE
+    imports = "from mod_0 import *" if idx > 0 else ""
+    calls = []
+    for n in range(num_calls):
+        target = idx if idx == 0 or n % 2 else 0
+        calls.append(
+            CALL_TEMPLATES[n % len(CALL_TEMPLATES)].format(
+                target=target, n=n, label="call {}".format(n)
+            )
+        )
+    return MODULE_TEMPLATE.format(idx=idx, imports=imports, calls="\n".join(calls))
+
+
+def generate(directory: str, num_modules: int, num_calls: int) -> List[str]:
+    """Write a synthetic program to ``directory`` and return the paths
+    of its modules.
+    """
+    paths = []
+    for idx in range(num_modules):
+        path = os.path.join(directory, "mod_{}.py".format(idx))
+        with open(path, "w") as file:
+            file.write(module_source(idx, num_modules, num_calls))
+        paths.append(path)
+    return paths
+
+
+def edit_leaf_function(path: str) -> None:
+    """Change the body of a function in ``path`` without changing its
+    signature, like a typical edit during development.
+    """
+    with open(path) as file:
+        source = file.read()
+    source = source.replace("await trio.sleep(0)", "await trio.sleep(0.5)", 1)
+    with open(path, "w") as file:
+        file.write(source)
+
+
+def write_config(directory: str, use_plugin: bool, settings: List[str]) -> str:
+    path = os.path.join(directory, "mypy.ini")
+    with open(path, "w") as file:
+        file.write("[mypy]\n")
+        if use_plugin:
+            file.write("plugins = trio_typing.plugin\n")
+            file.write("[trio-typing]\n")
+            for setting in settings:
+                file.write(setting + "\n")
+    return path
+
+
+def measure_one(args: List[str]) -> Dict[str, Any]:
+    """Run mypy in this process (which should be a fresh subprocess),
+    and return its wall time, peak memory, and number of error lines.
+    """
+    from mypy import api
+
+    start = time.perf_counter()
+    stdout, _, _ = api.run(args)
+    elapsed = time.perf_counter() - start
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        # bytes on macOS, kilobytes everywhere else
+        max_rss //= 1024
+    return {
+        "seconds": elapsed,
+        "max_rss_kb": max_rss,
+        "errors": sum(1 for line in stdout.splitlines() if ": error:" in line),
+    }
+
+
+def run_mypy(
+    directory: str, config: str, paths: List[str], cache_name: str = ".mypy_cache"
+) -> Dict[str, Any]:
+    args = [
+        "--config-file",
+        config,
+        "--cache-dir",
+        os.path.join(directory, cache_name),
+    ] + paths
+    output = subprocess.check_output(
+        [sys.executable, os.path.abspath(__file__), "--measure", json.dumps(args)],
+        cwd=directory,
+    )
+    return json.loads(output.decode("utf-8"))
+
+
+def restore_stub_cache(directory: str, config: str, cache_name: str) -> float:
+    """Build a stub cache archive for ``config``, restore it into a new
+    cache directory, and return how long the restore took.
+    """
+    archive = os.path.join(directory, "stubs.tar.gz")
+    command = [sys.executable, "-m", "trio_typing.stub_cache", "--config-file", config]
+    subprocess.check_call(
+        command + ["build", "-o", archive], cwd=directory, stdout=subprocess.DEVNULL
+    )
+    start = time.perf_counter()
+    subprocess.check_call(
+        command + ["restore", archive, "--cache-dir", cache_name], cwd=directory
+    )
+    return time.perf_counter() - start
+
+
+def bench_size(
+    name: str, use_plugin: bool, settings: List[str], stub_cache: bool = False
+) -> List[Dict[str, Any]]:
+    num_modules, num_calls = SIZES[name]
+    directory = tempfile.mkdtemp(prefix="trio-typing-bench-")
+    try:
+        paths = generate(directory, num_modules, num_calls)
+        config = write_config(directory, use_plugin, settings)
+        results = []
+        phases = PHASES + ("restored",) if stub_cache else PHASES
+        for phase in phases:
+            if phase == "incremental":
+                edit_leaf_function(paths[0])
+            if phase == "restored":
+                restore_seconds = restore_stub_cache(directory, config, "stubs-only")
+                result = run_mypy(directory, config, paths, "stubs-only")
+                result["restore_seconds"] = restore_seconds
+                result["seconds"] += restore_seconds
+            else:
+                result = run_mypy(directory, config, paths)
+            result.update(
+                size=name,
+                modules=num_modules,
+                calls_per_module=num_calls,
+                plugin=use_plugin,
+                phase=phase,
+            )
+            results.append(result)
+        return results
+    finally:
+        shutil.rmtree(directory)
+
+
+def versions() -> Dict[str, str]:
+    import mypy.version
+    import trio_typing
+
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "mypy": mypy.version.__version__,
+        "trio_typing": trio_typing.__version__,
+    }
+
+
+ROW_FORMAT = (
+    "{size:>8} {plugin!s:>7} {phase:>12} {seconds:9.2f}s "
+    "{max_rss_kb:10d}KB {errors:7d}"
+)
+
+
+def format_row(result: Dict[str, Any]) -> str:
+    return ROW_FORMAT.format(**result)
+
+
+def compare(before_path: str, after_path: str) -> None:
+    with open(before_path) as file:
+        before = json.load(file)
+    with open(after_path) as file:
+        after = json.load(file)
+
+    def key(result: Dict[str, Any]) -> Any:
+        return (result["size"], result["plugin"], result["phase"])
+
+    before_versions = before.get("versions", {})
+    for name, value in sorted(after.get("versions", {}).items()):
+        if before_versions.get(name) != value:
+            print("{}: {} -> {}".format(name, before_versions.get(name), value))
+
+    old = {key(result): result for result in before["results"]}
+    print(
+        "{:>8} {:>7} {:>12} {:>10} {:>10} {:>8}".format(
+            "size", "plugin", "phase", "before", "after", "change"
+        )
+    )
+    for result in after["results"]:
+        previous = old.get(key(result))
+        if previous is None:
+            continue
+        change = (result["seconds"] - previous["seconds"]) / previous["seconds"]
+        print(
+            "{:>8} {!s:>7} {:>12} {:9.2f}s {:9.2f}s {:+7.1%}".format(
+                result["size"],
+                result["plugin"],
+                result["phase"],
+                previous["seconds"],
+                result["seconds"],
+                change,
+            )
+        )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--sizes",
+        default="small,medium",
+        help="comma-separated program sizes to check, from: {}".format(
+            ", ".join(SIZES)
+        ),
+    )
+    parser.add_argument(
+        "--plugin",
+        choices=("both", "on", "off"),
+        default="both",
+        help="whether to check with the plugin enabled, disabled, or both",
+    )
+    parser.add_argument(
+        "--setting",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="plugin setting for the [trio-typing] config section; may be repeated",
+    )
+    parser.add_argument(
+        "--stub-cache",
+        action="store_true",
+        help="also check with a prebuilt stub cache restored into an empty cache",
+    )
+    parser.add_argument("-o", "--output", help="write results as JSON to this file")
+    parser.add_argument(
+        "--compare",
+        nargs=2,
+        metavar=("BEFORE", "AFTER"),
+        help="compare two result files instead of running anything",
+    )
+    parser.add_argument("--measure", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.measure is not None:
+        print(json.dumps(measure_one(json.loads(args.measure))))
+        return
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    sizes = args.sizes.split(",")
+    for size in sizes:
+        if size not in SIZES:
+            parser.error("unknown size {!r}".format(size))
+    plugin_settings = {"both": [True, False], "on": [True], "off": [False]}[args.plugin]
+
+    print(
+        "{:>8} {:>7} {:>12} {:>10} {:>12} {:>7}".format(
+            "size", "plugin", "phase", "time", "peak memory", "errors"
+        )
+    )
+    results = []
+    for size in sizes:
+        for use_plugin in plugin_settings:
+            for result in bench_size(size, use_plugin, args.setting, args.stub_cache):
+                print(format_row(result))
+                results.append(result)
+
+    if args.output:
+        report = {
+            "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+            "versions": versions(),
+            "settings": args.setting,
+            "results": results,
+        }
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2, sort_keys=True)
+            file.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Measure the per-call overhead of ``trio_typing.validation``.
+
+Each case times the same operation three ways: on an undecorated
+function, on one decorated with ``@validated`` while validation is
+disabled, and on one decorated while it's enabled. The coroutines are
+driven by hand rather than under ``trio.run()``, so that the numbers
+aren't swamped by the scheduler::
+
+    python bench/validation.py -o results.json
+"""
+
+import argparse
+import datetime
+import json
+import platform
+import timeit
+from typing import Any, Callable, Dict, List, Optional, Union
+
+import trio
+from async_generator import async_generator, yield_
+from trio_typing import TaskStatus, YieldType, SendType
+from trio_typing import validation
+
+MODES = ("undecorated", "disabled", "enabled")
+
+
+class FakeTaskStatus:
+    def started(self, value: Any = None) -> None:
+        pass
+
+
+async def starter(value: int, *, task_status: TaskStatus[int]) -> None:
+    task_status.started(value)
+
+
+async def sender(send_channel: "trio.abc.SendChannel[int]", value: int) -> None:
+    send_channel.send_nowait(value)
+
+
+@async_generator
+async def numbers(limit: int) -> Union[None, YieldType[int], SendType[None]]:
+    for i in range(limit):
+        await yield_(i)
+    return None
+
+
+def drive(coro: Any) -> Any:
+    try:
+        coro.send(None)
+    except StopIteration as ex:
+        return ex.value
+    raise RuntimeError("coroutine blocked")
+
+
+def decorate(fn: Callable[..., Any], mode: str) -> Callable[..., Any]:
+    if mode == "undecorated":
+        return fn
+    validation.enable(mode == "enabled")
+    return validation.validated(fn)
+
+
+def start_case(mode: str) -> Callable[[], None]:
+    fn = decorate(starter, mode)
+    status = FakeTaskStatus()
+
+    def run() -> None:
+        drive(fn(1, task_status=status))
+
+    return run
+
+
+def send_case(mode: str) -> Callable[[], None]:
+    fn = decorate(sender, mode)
+    send_channel, receive_channel = trio.open_memory_channel[int](1)
+
+    def run() -> None:
+        drive(fn(send_channel, 1))
+        receive_channel.receive_nowait()
+
+    return run
+
+
+AGEN_LENGTH = 100
+
+
+def agen_case(mode: str) -> Callable[[], None]:
+    fn = decorate(numbers, mode)
+
+    def run() -> None:
+        gen = fn(AGEN_LENGTH)
+        try:
+            while True:
+                drive(gen.__anext__())
+        except StopAsyncIteration:
+            pass
+
+    return run
+
+
+# name -> (function to build the callable to time, operations per call)
+CASES = {
+    "task_status.started": (start_case, 1),
+    "channel send": (send_case, 1),
+    "agen item": (agen_case, AGEN_LENGTH),
+}
+
+
+def measure(make: Callable[[str], Callable[[], None]], ops: int, mode: str) -> float:
+    """Return the best time per operation, in seconds."""
+    timer = timeit.Timer(make(mode))
+    # warm up caches before autorange() picks the number of loops
+    timer.timeit(number=1000)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=5, number=number)) / number / ops
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-o", "--output", help="write results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    print("{:>20} {:>12} {:>12} {:>12}".format("case", *MODES))
+    results = []  # type: List[Dict[str, Any]]
+    for name, (make, ops) in CASES.items():
+        times = {mode: measure(make, ops, mode) for mode in MODES}
+        print(
+            "{:>20} {:>10.0f}ns {:>10.0f}ns {:>10.0f}ns".format(
+                name, *(times[mode] * 1e9 for mode in MODES)
+            )
+        )
+        results.append(dict(case=name, **times))
+
+    if args.output:
+        report = {
+            "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "results": results,
+        }
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2, sort_keys=True)
+            file.write("\n")
+
+
+if __name__ == "__main__":
+    main()
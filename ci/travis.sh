@@ -53,6 +53,9 @@ if [ "$CHECK_DOCS" = "1" ]; then
 else
     # Actual tests
     pip install -Ur test-requirements.txt
+    if [ -n "$TEST_MYPY_VERSION" ]; then
+        pip install mypy==${TEST_MYPY_VERSION}
+    fi
 
     mkdir empty
     cd empty
@@ -29,12 +29,13 @@ class _ASendable(Protocol[T_contra, T_co]):
         exc_traceback: Optional[TracebackType] = ...,
     ) -> T_co: ...
 
-class Value(Generic[T]):
-    value: T
-    def __init__(self, value: T): ...
-    def unwrap(self) -> T: ...
-    def send(self, gen: Generator[U, T, Any]) -> U: ...
-    async def asend(self, gen: _ASendable[T, U]) -> U: ...
+# (covariant, since Value objects are immutable)
+class Value(Generic[T_co]):
+    value: T_co
+    def __init__(self, value: T_co): ...
+    def unwrap(self) -> T_co: ...
+    def send(self, gen: Generator[U, T_co, Any]) -> U: ...
+    async def asend(self, gen: _ASendable[T_co, U]) -> U: ...
 
 class Error:
     error: BaseException
@@ -19,11 +19,15 @@ setup(
     license="MIT -or- Apache License 2.0",
     packages=["async_generator-stubs", "outcome-stubs", "trio-stubs", "trio_typing"],
     include_package_data=True,
+    entry_points={
+        "console_scripts": ["trio-typing-stub-cache = trio_typing.stub_cache:main"]
+    },
     install_requires=[
         "trio >= 0.11.0",
         # mypy can't be installed on PyPy due to its dependency
-        # on typed-ast
-        "mypy >= 0.660; implementation_name == 'cpython'",
+        # on typed-ast. The plugin uses mypy internals, so this is
+        # the range of releases it's tested with.
+        "mypy >= 0.660, < 0.740; implementation_name == 'cpython'",
         "typing_extensions >= 3.7.2",
         "mypy_extensions >= 0.4.1",
     ],
@@ -25,23 +25,30 @@ from typing import (
 )
 from trio_typing import Nursery, TaskStatus, ArgsForCallable, takes_callable_and_args
 from typing_extensions import Protocol, Literal
-import attr
+import array
+import mmap
 import signal
 import io
 import os
 import pathlib
-import subprocess
 import ssl
 import sys
 import trio
+
+if sys.platform == "win32":
+    # only needed for Process on Windows; mypy doesn't process imports
+    # in blocks that are unreachable on the platform being checked
+    import subprocess
 from . import hazmat as hazmat, socket as socket, abc as abc
 
 T = TypeVar("T")
 T_co = TypeVar("T_co", covariant=True)
 T_contra = TypeVar("T_contra", contravariant=True)
 
-class _Statistics:
-    def __getattr__(self, name: str) -> Any: ...
+# Objects supporting the buffer protocol, which APIs that send or write
+# data accept without copying; the writable ones can also be received into
+_WritableBuffer = Union[bytearray, memoryview, array.array[Any], mmap.mmap]
+_Buffer = Union[bytes, _WritableBuffer]
 
 # Inheriting from this (even outside of stubs) produces a class that
 # mypy thinks is abstract, but the interpreter thinks is concrete.
@@ -134,7 +141,13 @@ class Event:
     def set(self) -> None: ...
     def clear(self) -> None: ...
     async def wait(self) -> None: ...
-    def statistics(self) -> _Statistics: ...
+    def statistics(self) -> trio.hazmat._ParkingLotStatistics: ...
+
+class _CapacityLimiterStatistics:
+    borrowed_tokens: int
+    total_tokens: float
+    borrowers: List[object]
+    tasks_waiting: int
 
 class CapacityLimiter:
     # float here really means Union[int, math.inf] but mypy doesn't
@@ -149,33 +162,42 @@ class CapacityLimiter:
     async def acquire_on_behalf_of(self, borrower: object) -> None: ...
     def release(self) -> None: ...
     def release_on_behalf_of(self, borrower: object) -> None: ...
-    def statistics(self) -> _Statistics: ...
+    def statistics(self) -> _CapacityLimiterStatistics: ...
     async def __aenter__(self) -> None: ...
     async def __aexit__(self, *exc: object) -> bool: ...
 
-class Sempahore:
+class Semaphore:
     value: int
     max_value: Optional[int]
     def __init__(self, initial_value: int, *, max_value: Optional[int] = None): ...
     def acquire_nowait(self) -> None: ...
     async def acquire(self) -> None: ...
     def release(self) -> None: ...
-    def statistics(self) -> _Statistics: ...
+    def statistics(self) -> trio.hazmat._ParkingLotStatistics: ...
     async def __aenter__(self) -> None: ...
     async def __aexit__(self, *exc: object) -> bool: ...
 
+class _LockStatistics:
+    locked: bool
+    owner: Optional[trio.hazmat.Task]
+    tasks_waiting: int
+
 class Lock:
     def locked(self) -> bool: ...
     def acquire_nowait(self) -> None: ...
     async def acquire(self) -> None: ...
     def release(self) -> None: ...
-    def statistics(self) -> _Statistics: ...
+    def statistics(self) -> _LockStatistics: ...
     async def __aenter__(self) -> None: ...
     async def __aexit__(self, *exc: object) -> bool: ...
 
 class StrictFIFOLock(Lock):
     pass
 
+class _ConditionStatistics:
+    tasks_waiting: int
+    lock_statistics: _LockStatistics
+
 class Condition:
     def __init__(self, lock: Optional[Lock] = None) -> None: ...
     def locked(self) -> bool: ...
@@ -185,7 +207,7 @@ class Condition:
     async def wait(self) -> None: ...
     def notify(self, n: int = 1) -> None: ...
     def notify_all(self) -> None: ...
-    def statistics(self) -> _Statistics: ...
+    def statistics(self) -> _ConditionStatistics: ...
     async def __aenter__(self) -> None: ...
     async def __aexit__(self, *exc: object) -> bool: ...
 
@@ -220,25 +242,33 @@ class StapledStream(trio.abc.HalfCloseableStream):
         self, send_stream: trio.abc.SendStream, receive_stream: trio.abc.ReceiveStream
     ) -> None: ...
     async def aclose(self) -> None: ...
-    async def send_all(self, data: Union[bytes, memoryview]) -> None: ...
+    async def send_all(self, data: _Buffer) -> None: ...
     async def wait_send_all_might_not_block(self) -> None: ...
     async def receive_some(self, max_bytes: int) -> bytes: ...
     async def send_eof(self) -> None: ...
 
 # _channel
+class _MemoryChannelStatistics:
+    current_buffer_used: int
+    max_buffer_size: float
+    open_send_channels: int
+    open_receive_channels: int
+    tasks_waiting_send: int
+    tasks_waiting_receive: int
+
 class _MemorySendChannel(trio.abc.SendChannel[T_contra]):
     def send_nowait(self, value: T_contra) -> None: ...
     async def send(self, value: T_contra) -> None: ...
     def clone(self: T) -> T: ...
     async def aclose(self) -> None: ...
-    def statistics(self) -> _Statistics: ...
+    def statistics(self) -> _MemoryChannelStatistics: ...
 
 class _MemoryReceiveChannel(trio.abc.ReceiveChannel[T_co]):
     def receive_nowait(self) -> T_co: ...
     async def receive(self) -> T_co: ...
     def clone(self: T) -> T: ...
     async def aclose(self) -> None: ...
-    def statistics(self) -> _Statistics: ...
+    def statistics(self) -> _MemoryChannelStatistics: ...
 
 # written as a class so you can say open_memory_channel[int](5)
 class open_memory_channel(Tuple[_MemorySendChannel[T], _MemoryReceiveChannel[T]]):
@@ -262,7 +292,7 @@ class SocketStream(trio.abc.HalfCloseableStream):
     @overload
     def getsockopt(self, level: int, optname: int, buflen: int) -> bytes: ...
     async def aclose(self) -> None: ...
-    async def send_all(self, data: Union[bytes, memoryview]) -> None: ...
+    async def send_all(self, data: _Buffer) -> None: ...
     async def wait_send_all_might_not_block(self) -> None: ...
     async def receive_some(self, max_bytes: int) -> bytes: ...
     async def send_eof(self) -> None: ...
@@ -294,15 +324,15 @@ class _AsyncIOBase(trio.abc.AsyncResource):
 
 class _AsyncRawIOBase(_AsyncIOBase):
     async def readall(self) -> bytes: ...
-    async def readinto(self, b: bytearray) -> Optional[int]: ...
-    async def write(self, b: bytes) -> Optional[int]: ...
+    async def readinto(self, b: _WritableBuffer) -> Optional[int]: ...
+    async def write(self, b: _Buffer) -> Optional[int]: ...
     async def read(self, size: int = ...) -> Optional[bytes]: ...
 
 class _AsyncBufferedIOBase(_AsyncIOBase):
     async def detach(self) -> _AsyncRawIOBase: ...
-    async def readinto(self, b: bytearray) -> int: ...
-    async def write(self, b: bytes) -> int: ...
-    async def readinto1(self, b: bytearray) -> int: ...
+    async def readinto(self, b: _WritableBuffer) -> int: ...
+    async def write(self, b: _Buffer) -> int: ...
+    async def readinto1(self, b: _WritableBuffer) -> int: ...
     async def read(self, size: Optional[int] = ...) -> bytes: ...
     async def read1(self, size: int = ...) -> bytes: ...
 
@@ -478,7 +508,7 @@ class SSLStream(trio.abc.Stream):
     async def do_handshake(self) -> None: ...
     async def unwrap(self) -> Tuple[trio.abc.Stream, bytes]: ...
     async def aclose(self) -> None: ...
-    async def send_all(self, data: Union[bytes, memoryview]) -> None: ...
+    async def send_all(self, data: _Buffer) -> None: ...
     async def wait_send_all_might_not_block(self) -> None: ...
     async def receive_some(self, max_bytes: int) -> bytes: ...
 
@@ -56,7 +56,7 @@ class AsyncResource(metaclass=ABCMeta):
 
 class SendStream(AsyncResource):
     @abstractmethod
-    async def send_all(self, data: Union[bytes, memoryview]) -> None: ...
+    async def send_all(self, data: trio._Buffer) -> None: ...
     @abstractmethod
     async def wait_send_all_might_not_block(self) -> None: ...
 
@@ -16,17 +16,27 @@ from typing import (
     Tuple,
 )
 from trio_typing import Nursery, ArgsForCallable, takes_callable_and_args
+from typing_extensions import Literal, Protocol
 import trio
 import outcome
 import contextvars
 import enum
 import select
+import sys
 
 T = TypeVar("T")
 F = TypeVar("F", bound=Callable[..., Any])
 
-class _Statistics:
-    def __getattr__(self, name: str) -> Any: ...
+# What the I/O waiting functions accept: a file descriptor (or socket
+# handle, on Windows), or an object whose fileno() returns one
+class _HasFileno(Protocol):
+    def fileno(self) -> int: ...
+
+_FileDescriptor = Union[int, _HasFileno]
+
+# An abort function is called with a function that raises Cancelled
+# (if the wait can't be cleanly aborted, it can call that later)
+_AbortFunc = Callable[[Callable[[], NoReturn]], Abort]
 
 # _core._ki
 def enable_ki_protection(fn: F) -> F: ...
@@ -44,6 +54,10 @@ class TrioToken:
     ) -> None: ...
 
 # _core._unbounded_queue
+class _UnboundedQueueStatistics:
+    qsize: int
+    tasks_waiting: int
+
 class UnboundedQueue(Generic[T]):
     def __init__(self) -> None: ...
     def qsize(self) -> int: ...
@@ -51,7 +65,7 @@ class UnboundedQueue(Generic[T]):
     def put_nowait(self, obj: T) -> None: ...
     def get_batch_nowait(self) -> Sequence[T]: ...
     async def get_batch(self) -> Sequence[T]: ...
-    def statistics(self) -> _Statistics: ...
+    def statistics(self) -> _UnboundedQueueStatistics: ...
     def __aiter__(self) -> AsyncIterator[Sequence[T]]: ...
 
 # _core._run
@@ -67,10 +81,44 @@ async def checkpoint() -> None: ...
 async def checkpoint_if_cancelled() -> None: ...
 def current_task() -> Task: ...
 def current_root_task() -> Task: ...
-def current_statistics() -> _Statistics: ...
+
+# _core._io_epoll, _core._io_kqueue, _core._io_windows
+class _EpollStatistics:
+    tasks_waiting_read: int
+    tasks_waiting_write: int
+    backend: Literal["epoll"]
+
+class _KqueueStatistics:
+    tasks_waiting: int
+    monitors: int
+    backend: Literal["kqueue"]
+
+class _WindowsStatistics:
+    tasks_waiting_overlapped: int
+    completion_key_monitors: int
+    tasks_waiting_socket_readable: int
+    tasks_waiting_socket_writable: int
+    iocp_backlog: int
+    backend: Literal["windows"]
+
+if sys.platform == "win32":
+    _IOStatistics = _WindowsStatistics
+elif sys.platform == "linux":
+    _IOStatistics = _EpollStatistics
+else:
+    _IOStatistics = _KqueueStatistics
+
+class _RunStatistics:
+    tasks_living: int
+    tasks_runnable: int
+    seconds_to_next_deadline: float
+    io_statistics: _IOStatistics
+    run_sync_soon_queue_size: int
+
+def current_statistics() -> _RunStatistics: ...
 def current_clock() -> trio.abc.Clock: ...
 def current_trio_token() -> TrioToken: ...
-def reschedule(task: Task, next_send: outcome.Outcome[Any] = ...) -> None: ...
+def reschedule(task: Task, next_send: outcome.Outcome[object] = ...) -> None: ...
 @takes_callable_and_args
 def spawn_system_task(
     async_fn: Callable[[ArgsForCallable], Awaitable[None]],
@@ -79,14 +127,14 @@ def spawn_system_task(
 ) -> Task: ...
 def add_instrument(instrument: trio.abc.Instrument) -> None: ...
 def remove_instrument(instrument: trio.abc.Instrument) -> None: ...
-async def wait_socket_readable(sock: trio.socket.SocketType) -> None: ...
-async def wait_socket_writable(sock: trio.socket.SocketType) -> None: ...
-def notify_socket_close(sock: trio.socket.SocketType) -> None: ...
+async def wait_socket_readable(sock: _FileDescriptor) -> None: ...
+async def wait_socket_writable(sock: _FileDescriptor) -> None: ...
+def notify_socket_close(sock: _FileDescriptor) -> None: ...
 
 # unix only
-async def wait_readable(fd: int) -> None: ...
-async def wait_writable(fd: int) -> None: ...
-def notify_fd_close(fd: int) -> None: ...
+async def wait_readable(fd: _FileDescriptor) -> None: ...
+async def wait_writable(fd: _FileDescriptor) -> None: ...
+def notify_fd_close(fd: _FileDescriptor) -> None: ...
 
 # kqueue only
 def current_kqueue() -> select.kqueue: ...
@@ -94,7 +142,7 @@ def monitor_kevent(
     ident: int, filter: int
 ) -> ContextManager[UnboundedQueue[select.kevent]]: ...
 async def wait_kevent(
-    ident: int, filter: int, abort_func: Callable[[Callable[[], NoReturn]], Abort]
+    ident: int, filter: int, abort_func: _AbortFunc
 ) -> select.kevent: ...
 
 # windows only
@@ -115,18 +163,22 @@ class Abort(enum.Enum):
     FAILED = ...
 
 async def cancel_shielded_checkpoint() -> None: ...
-async def wait_task_rescheduled(
-    abort_func: Callable[[Callable[[], NoReturn]], Abort]
-) -> Any: ...
+
+# (returns whatever value the matching reschedule() call sends, which
+# can't be tied to this call's type)
+async def wait_task_rescheduled(abort_func: _AbortFunc) -> Any: ...
 async def permanently_detach_coroutine_object(
     final_outcome: outcome.Outcome[object]
 ) -> Any: ...
-async def temporarily_detach_coroutine_object(
-    abort_func: Callable[[Callable[[], NoReturn]], Abort]
-) -> Any: ...
-async def reattach_detached_coroutine_object(task: Task, yield_value: Any) -> None: ...
+async def temporarily_detach_coroutine_object(abort_func: _AbortFunc) -> Any: ...
+async def reattach_detached_coroutine_object(
+    task: Task, yield_value: object
+) -> None: ...
 
 # _core._parking_lot
+class _ParkingLotStatistics:
+    tasks_waiting: int
+
 class ParkingLot:
     def __len__(self) -> int: ...
     def __bool__(self) -> bool: ...
@@ -135,7 +187,7 @@ class ParkingLot:
     def unpark_all(self) -> Sequence[Task]: ...
     def repark(self, new_lot: ParkingLot, *, count: int = 1) -> None: ...
     def repark_all(self, new_lot: ParkingLot) -> None: ...
-    def statistics(self) -> _Statistics: ...
+    def statistics(self) -> _ParkingLotStatistics: ...
 
 # _core._local
 class _RunVarToken:
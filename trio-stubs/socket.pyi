@@ -440,36 +440,36 @@ class SocketType:
     async def connect(self, address: Union[Tuple[Any, ...], str, bytes]) -> None: ...
     async def recv(self, bufsize: int, flags: int = ...) -> bytes: ...
     async def recv_into(
-        self, buffer: Union[bytearray, memoryview], nbytes: int, flags: int = ...
+        self, buffer: trio._WritableBuffer, nbytes: int, flags: int = ...
     ) -> int: ...
     async def recvfrom(self, bufsize: int, flags: int = ...) -> Tuple[bytes, Any]: ...
     async def recvfrom_into(
-        self, buffer: Union[bytearray, memoryview], nbytes: int, flags: int = ...
+        self, buffer: trio._WritableBuffer, nbytes: int, flags: int = ...
     ) -> Tuple[int, Any]: ...
     async def recvmsg(
         self, bufsize: int, ancbufsize: int = ..., flags: int = ...
     ) -> Tuple[bytes, List[Tuple[int, int, bytes]], int, Any]: ...
     async def recvmsg_into(
         self,
-        buffers: Iterable[Union[bytearray, memoryview]],
+        buffers: Iterable[trio._WritableBuffer],
         ancbufsize: int = ...,
         flags: int = ...,
     ) -> Tuple[int, List[Tuple[int, int, bytes]], int, Any]: ...
-    async def send(self, data: bytes, flags: int = ...) -> int: ...
+    async def send(self, data: trio._Buffer, flags: int = ...) -> int: ...
     async def sendmsg(
         self,
-        buffers: Iterable[Union[bytes, memoryview]],
-        ancdata: Iterable[Tuple[int, int, Union[bytes, memoryview]]] = ...,
+        buffers: Iterable[trio._Buffer],
+        ancdata: Iterable[Tuple[int, int, trio._Buffer]] = ...,
         flags: int = ...,
         address: Union[Tuple[Any, ...], str] = ...,
     ) -> int: ...
     @overload
     async def sendto(
-        self, data: bytes, address: Union[Tuple[Any, ...], str]
+        self, data: trio._Buffer, address: Union[Tuple[Any, ...], str]
     ) -> int: ...
     @overload
     async def sendto(
-        self, data: bytes, flags: int, address: Union[Tuple[Any, ...], str]
+        self, data: trio._Buffer, flags: int, address: Union[Tuple[Any, ...], str]
     ) -> int: ...
     def detach(self) -> int: ...
     def get_inheritable(self) -> bool: ...
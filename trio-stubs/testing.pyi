@@ -54,7 +54,7 @@ class MemorySendStream(trio.abc.SendStream):
     send_all_hook: MemoryStreamHook
     wait_send_all_might_not_block_hook: MemoryStreamHook
     close_hook: MemoryStreamHook
-    async def send_all(self, data: Union[bytes, bytearray, memoryview]) -> None: ...
+    async def send_all(self, data: trio._Buffer) -> None: ...
     async def wait_send_all_might_not_block(self) -> None: ...
     async def aclose(self) -> None: ...
     def close(self) -> None: ...
@@ -68,7 +68,7 @@ class MemoryReceiveStream(trio.abc.ReceiveStream):
     async def receive_some(self, max_bytes: int) -> bytes: ...
     async def aclose(self) -> None: ...
     def close(self) -> None: ...
-    def put_data(self, data: bytes) -> None: ...
+    def put_data(self, data: trio._Buffer) -> None: ...
     def put_eof(self) -> None: ...
 
 def memory_stream_pump(
@@ -1,14 +1,14 @@
 import abc as _abc
 import sys as _sys
+import threading as _threading
 import typing as _t
-import typing_extensions as _tx
-import async_generator as _ag
-import trio as _trio
 from ._version import __version__
 
 __all__ = [
     "ArgsForCallable",
     "takes_callable_and_args",
+    "blocking",
+    "bounded",
     "Nursery",
     "TaskStatus",
     "AsyncGenerator",
@@ -31,38 +31,124 @@ def takes_callable_and_args(fn):
     return fn
 
 
-class Nursery(metaclass=_abc.ABCMeta):
+def blocking(fn):
+    return fn
+
+
+def bounded(value):
+    return value
+
+
+# The ABCs below have private Trio and async_generator types registered
+# as virtual subclasses. We do that when someone asks about their
+# subclasses after the package those types come from has been imported,
+# rather than at import time, so that importing trio_typing (e.g. to use
+# its names in annotations) doesn't import Trio. Until then, nothing can
+# be an instance of those types, so there's nothing to register.
+
+
+def _register_trio():
+    import trio
+
+    Nursery.register(trio._core._run.Nursery)
+    TaskStatus.register(trio._core._run._TaskStatus)
+    TaskStatus.register(type(trio.TASK_STATUS_IGNORED))
+
+
+def _register_async_generator():
+    import async_generator
+
+    CompatAsyncGenerator.register(async_generator._impl.AsyncGenerator)
+
+
+_registrars = [("trio", _register_trio), ("async_generator", _register_async_generator)]
+# The packages whose types have been registered, and the ones that the
+# thread holding _registration_lock is registering (register() itself
+# calls issubclass())
+_registered = set()
+_registering = set()
+_registration_lock = _threading.RLock()
+
+
+def _register_virtual_subclasses():
+    if len(_registered) == len(_registrars):
+        return
+    for package, register in _registrars:
+        if package in _registered or package not in _sys.modules:
+            continue
+        with _registration_lock:
+            if package in _registered or package in _registering:
+                continue
+            _registering.add(package)
+            try:
+                register()
+            except AttributeError:
+                # If the package is still being imported, the classes
+                # might not exist yet; try again later
+                spec = getattr(_sys.modules[package], "__spec__", None)
+                if not getattr(spec, "_initializing", False):
+                    raise
+            else:
+                _registered.add(package)
+            finally:
+                _registering.discard(package)
+
+
+class _RegistersOnFirstUse:
+    """Metaclass mixin that calls _register_virtual_subclasses() before
+    each isinstance() or issubclass() check, until everything is
+    registered.
+    """
+
+    def __instancecheck__(cls, instance):
+        _register_virtual_subclasses()
+        return super().__instancecheck__(instance)
+
+    def __subclasscheck__(cls, subclass):
+        _register_virtual_subclasses()
+        return super().__subclasscheck__(subclass)
+
+
+class _ABCMeta(_RegistersOnFirstUse, _abc.ABCMeta):
     pass
 
 
-Nursery.register(_trio._core._run.Nursery)
+if isinstance(_t.Generic, _abc.ABCMeta):
+    # Python < 3.7: Generic subclasses use typing.GenericMeta
+    class _GenericABCMeta(_RegistersOnFirstUse, type(_t.Generic)):
+        pass
+
+
+else:
+    _GenericABCMeta = _ABCMeta
 
 
-class TaskStatus(_t.Generic[_T], metaclass=_abc.ABCMeta):
+class Nursery(metaclass=_ABCMeta):
     pass
 
 
-TaskStatus.register(_trio._core._run._TaskStatus)
-TaskStatus.register(type(_trio.TASK_STATUS_IGNORED))
+class TaskStatus(_t.Generic[_T], metaclass=_GenericABCMeta):
+    pass
+
 
 if _sys.version_info >= (3, 6):
     from typing import AsyncGenerator
 
 else:
+    import typing_extensions as _tx
 
     class AsyncGenerator(_tx.AsyncIterator[_T_co], _t.Generic[_T_co, _T_contra]):
         pass
 
 
 class CompatAsyncGenerator(
-    AsyncGenerator[_T_co, _T_contra], _t.Generic[_T_co, _T_contra, _T_co2]
+    AsyncGenerator[_T_co, _T_contra],
+    _t.Generic[_T_co, _T_contra, _T_co2],
+    metaclass=_GenericABCMeta,
 ):
     pass
 
 
-CompatAsyncGenerator.register(_ag._impl.AsyncGenerator)
-
-
 class YieldType(_t.Generic[_T_co]):
     pass
 
@@ -22,6 +22,8 @@ __all__ = [
     "TaskStatus",
     "ArgsForCallable",
     "takes_callable_and_args",
+    "blocking",
+    "bounded",
     "AsyncGenerator",
     "CompatAsyncGenerator",
 ]
@@ -37,6 +39,12 @@ class ArgsForCallable:
 def takes_callable_and_args(fn: T) -> T:
     return fn
 
+def blocking(fn: T) -> T:
+    return fn
+
+def bounded(value: T) -> T:
+    return value
+
 class TaskStatus(Protocol[T_contra]):
     def started(self, value: T_contra = ...) -> None: ...
 
@@ -21,6 +21,8 @@ def test_runtime():
     assert isinstance(native_agen(), trio_typing.AsyncGenerator)
     if hasattr(typing, "AsyncGenerator"):
         assert trio_typing.AsyncGenerator is typing.AsyncGenerator
+    items = [1, 2, 3]
+    assert trio_typing.bounded(items) is items
 
     async def task(*, task_status=trio.TASK_STATUS_IGNORED):
         assert isinstance(task_status, trio_typing.TaskStatus)
@@ -31,3 +33,416 @@ def test_runtime():
             assert isinstance(nursery, trio_typing.Nursery)
             nursery.start_soon(task)
             await nursery.start(task)
+
+
+def test_import_does_not_import_trio():
+    import subprocess
+
+    code = (
+        "import sys, trio_typing\n"
+        "assert 'trio' not in sys.modules\n"
+        "assert 'async_generator' not in sys.modules\n"
+        "import trio\n"
+        "assert isinstance(trio.TASK_STATUS_IGNORED, trio_typing.TaskStatus)\n"
+    )
+    subprocess.check_call([sys.executable, "-c", code])
+
+
+def test_abc_checks_do_not_import_trio():
+    import subprocess
+
+    code = (
+        "import collections.abc, sys, trio_typing\n"
+        "assert not isinstance(42, collections.abc.AsyncIterable)\n"
+        "assert not isinstance(42, trio_typing.CompatAsyncGenerator)\n"
+        "assert not issubclass(int, trio_typing.Nursery)\n"
+        "assert 'trio' not in sys.modules\n"
+        "assert 'async_generator' not in sys.modules\n"
+        "import async_generator\n"
+        "@async_generator.async_generator\n"
+        "async def agen():\n"
+        "    pass\n"
+        "assert isinstance(agen(), trio_typing.CompatAsyncGenerator)\n"
+        "assert 'trio' not in sys.modules\n"
+    )
+    subprocess.check_call([sys.executable, "-c", code])
+
+
+def test_registration_errors(monkeypatch):
+    import types
+    import pytest
+
+    def register():
+        raise AttributeError("no such class")
+
+    package = types.ModuleType("fake_package")
+    package.__spec__ = types.SimpleNamespace(_initializing=True)
+    monkeypatch.setitem(sys.modules, "fake_package", package)
+    monkeypatch.setattr(trio_typing, "_registrars", [("fake_package", register)])
+    monkeypatch.setattr(trio_typing, "_registered", set())
+
+    # While the package is being imported, its classes might not exist yet
+    assert not isinstance(42, trio_typing.Nursery)
+    assert trio_typing._registered == set()
+
+    # Once it's imported, they should
+    package.__spec__._initializing = False
+    with pytest.raises(AttributeError, match="no such class"):
+        isinstance(42, trio_typing.Nursery)
+    assert trio_typing._registered == set()
+
+
+def test_validation(monkeypatch):
+    import pytest
+    from trio_typing import validation
+
+    monkeypatch.setattr(validation, "_enabled", False)
+
+    async def unchecked(*, task_status: trio_typing.TaskStatus[int]) -> None:
+        pass
+
+    assert validation.validated(unchecked) is unchecked
+
+    validation.enable()
+
+    @validation.validated
+    async def starter(
+        value, *, task_status: trio_typing.TaskStatus[int] = trio.TASK_STATUS_IGNORED
+    ) -> None:
+        task_status.started(value)
+
+    @validation.validated
+    async def sender(
+        send_channel: "trio.abc.SendChannel[typing.Optional[str]]", value
+    ) -> None:
+        async with send_channel:
+            await send_channel.send(value)
+
+    @validation.validated
+    @async_generator.async_generator
+    async def agen() -> typing.Union[
+        trio_typing.YieldType[int], trio_typing.SendType[str]
+    ]:
+        received = await async_generator.yield_(1)
+        await async_generator.yield_(len(received))
+        await async_generator.yield_("oops")
+
+    async def main():
+        async with trio.open_nursery() as nursery:
+            assert await nursery.start(starter, 42) == 42
+            with pytest.raises(TypeError, match="started.* expected int, got 'x'"):
+                await nursery.start(starter, "x")
+
+        send_channel, receive_channel = trio.open_memory_channel(1)
+        await sender(send_channel.clone(), None)
+        assert await receive_channel.receive() is None
+        with pytest.raises(TypeError, match="expected Union\\[str, NoneType\\]"):
+            await sender(send_channel, 1)
+
+        gen = agen()
+        assert isinstance(gen, trio_typing.CompatAsyncGenerator)
+        assert await gen.asend(None) == 1
+        with pytest.raises(TypeError, match="asend.. expected str, got 5"):
+            await gen.asend(5)
+        assert await gen.asend("abc") == 3
+        with pytest.raises(TypeError, match="yielded 'oops', expected int"):
+            await gen.__anext__()
+        await gen.aclose()
+
+    trio.run(main)
+
+
+def test_statistics_collector():
+    import math
+    import pytest
+    import trio.testing
+    from trio_typing.metrics import StatisticsCollector
+
+    collector = StatisticsCollector()
+    limiter = trio.CapacityLimiter(2)
+    send_channel, receive_channel = trio.open_memory_channel(3)
+    lock = trio.StrictFIFOLock()
+    collector.register("limiter", limiter)
+    collector.register("jobs", send_channel)
+    collector.register("results", receive_channel)
+    collector.register("lock", lock)
+    collector.register("semaphore", trio.Semaphore(1))
+    with pytest.raises(ValueError):
+        collector.register("lock", trio.Lock())
+    with pytest.raises(TypeError):
+        collector.register("other", object())
+    assert "lock" in collector and len(collector) == 5
+
+    async def main():
+        async with limiter:
+            send_channel.send_nowait(1)
+            send_channel.send_nowait(2)
+            async with trio.open_nursery() as nursery:
+                nursery.start_soon(limiter.acquire_on_behalf_of, "other")
+                nursery.start_soon(limiter.acquire)
+                await trio.testing.wait_all_tasks_blocked()
+                await lock.acquire()
+                snapshot = collector.snapshot()
+                nursery.cancel_scope.cancel()
+        return snapshot
+
+    snapshot = trio.run(main)
+    assert snapshot.timestamp > 0
+    assert [tuple(sample) for sample in snapshot.samples] == [
+        ("limiter", "capacity_limiter", 1, 2, 2),
+        ("jobs", "send_channel", 0, 2, 3),
+        ("results", "receive_channel", 0, 2, 3),
+        ("lock", "lock", 0, 1, 1),
+        ("semaphore", "semaphore", 0, 0, math.inf),
+    ]
+    collector.unregister("results")
+    assert len(collector.snapshot().samples) == 4
+
+
+def test_channel_batches():
+    import pytest
+    import trio.testing
+    from trio_typing.channels import receive_batch, send_batch
+
+    async def main():
+        send_channel, receive_channel = trio.open_memory_channel(4)
+        batches = []
+        async with trio.open_nursery() as nursery:
+            nursery.start_soon(send_batch, send_channel, range(10))
+            while sum(map(len, batches)) < 10:
+                batches.append(await receive_batch(receive_channel, 3))
+        assert sum(batches, []) == list(range(10))
+        assert max(map(len, batches)) == 3
+
+        async def send_later(delay, item):
+            await trio.sleep(delay)
+            await send_channel.send(item)
+
+        async with trio.open_nursery() as nursery:
+            send_channel.send_nowait(1)
+            nursery.start_soon(send_later, 0.5, 2)
+            assert await receive_batch(receive_channel, 5, max_wait=1) == [1, 2]
+            send_channel.send_nowait(3)
+            nursery.start_soon(send_later, 0.5, 4)
+            assert await receive_batch(receive_channel, 5, max_wait=0.1) == [3]
+        assert await receive_batch(receive_channel, 5) == [4]
+
+        # Cancellation while waiting for more items doesn't lose them
+        with trio.CancelScope() as scope:
+            send_channel.send_nowait(5)
+            scope.deadline = trio.current_time() + 0.1
+            assert await receive_batch(receive_channel, 5, max_wait=1) == [5]
+            await trio.sleep(0)
+        assert scope.cancelled_caught
+
+        await send_batch(send_channel, [6, 7])
+        await send_channel.aclose()
+        assert await receive_batch(receive_channel, 5) == [6, 7]
+        with pytest.raises(trio.EndOfChannel):
+            await receive_batch(receive_channel, 5)
+        with pytest.raises(ValueError):
+            await receive_batch(receive_channel, 0)
+
+    trio.run(main, clock=trio.testing.MockClock(autojump_threshold=0))
+
+
+def test_instruments():
+    import time
+    import trio.testing
+    from trio_typing.instruments import (
+        Histogram,
+        RunTime,
+        SchedulerLag,
+        SlowSteps,
+        StepTimes,
+    )
+
+    histogram = Histogram([1, 2, 4])
+    for seconds in (0.5, 1, 1.5, 3, 3, 10):
+        histogram.add(seconds)
+    assert list(histogram.buckets()) == [(1, 2), (2, 1), (4, 2), (float("inf"), 1)]
+    assert histogram.count() == 6 and histogram.mean() == 19 / 6
+    assert histogram.percentile(50) == 2
+    assert histogram.percentile(100) == float("inf")
+    assert Histogram().percentile(99) == 0
+
+    step_times = StepTimes()
+    lag = SchedulerLag()
+    run_time = RunTime()
+    slow = []
+    slow_steps = SlowSteps(
+        0.01, lambda task, seconds: slow.append((task.name, seconds))
+    )
+
+    async def hog(event):
+        await trio.testing.wait_all_tasks_blocked()
+        # the waiter is rescheduled now, but can't run until we're done
+        event.set()
+        time.sleep(0.02)
+
+    async def main():
+        event = trio.Event()
+        async with trio.open_nursery() as nursery:
+            for _ in range(3):
+                nursery.start_soon(trio.sleep, 0.01, name="sleeper")
+            nursery.start_soon(event.wait, name="waiter")
+            nursery.start_soon(hog, event, name="hog")
+
+    trio.run(main, instruments=[step_times, lag, run_time, slow_steps])
+
+    assert "sleeper" in step_times.names()
+    # each sleeper steps once to start sleeping and once to wake up
+    assert step_times.histogram("sleeper").count() == 6
+    assert step_times.histogram("hog").percentile(100) >= 0.02
+    assert step_times.total().count() == run_time.steps
+    assert lag.histogram.count() == run_time.steps
+    assert lag.max_seconds >= 0.02
+    assert run_time.io_waits > 0 and run_time.io_wait_seconds > 0
+    assert run_time.running_seconds >= 0.02
+    assert run_time.total_seconds >= run_time.running_seconds + run_time.io_wait_seconds
+    assert [name for name, _ in slow] == ["hog"] and slow[0][1] >= 0.02
+    assert slow_steps.slow_steps == 1
+
+
+def test_native_agen_rewrite():
+    import textwrap
+    from trio_typing.native_agen import rewrite
+
+    source = textwrap.dedent(
+        '''\
+        """Docstring."""
+        from __future__ import print_function
+
+        import async_generator
+        from async_generator import async_generator as compat_agen, yield_, yield_from_
+        from typing import Any, Optional, Union
+        from trio_typing import YieldType, SendType
+
+        @compat_agen
+        async def numbers(limit: int) -> Union[None, YieldType[int]]:
+            for number in range(limit):
+                await yield_(number)
+            return None
+
+        class Echo:
+            @staticmethod
+            @async_generator.async_generator
+            async def echo() -> Optional[
+                Union[YieldType[str], SendType[bytes]]
+            ]:
+                received = await yield_("ready")
+                while received:
+                    print(await yield_(
+                        received.decode()
+                    ))
+
+        @compat_agen
+        async def unannotated():
+            await yield_()
+
+        @compat_agen
+        async def returns_none() -> None:
+            await yield_()
+
+        @compat_agen
+        async def returns_any() -> Any:
+            await yield_()
+
+        @compat_agen
+        async def returns_value() -> Union[str, YieldType[int]]:
+            await yield_(1)
+            return "done"
+
+        @compat_agen
+        async def delegates() -> Union[None, YieldType[int]]:
+            await yield_from_(numbers(10))
+            return None
+        '''
+    )
+    rewritten, skipped = rewrite(source)
+    assert skipped == [
+        (39, "can't rewrite returns_value() because it returns a value"),
+        (44, "can't rewrite delegates() because it uses yield_from_()"),
+    ]
+    assert rewritten == textwrap.dedent(
+        '''\
+        """Docstring."""
+        from __future__ import print_function
+
+        import async_generator
+        from async_generator import async_generator as compat_agen, yield_, yield_from_
+        from typing import Any, Optional, Union, AsyncGenerator
+        from trio_typing import YieldType, SendType
+
+        async def numbers(limit: int) -> AsyncGenerator[int, None]:
+            for number in range(limit):
+                yield number
+            return
+
+        class Echo:
+            @staticmethod
+            async def echo() -> AsyncGenerator[str, bytes]:
+                received = yield "ready"
+                while received:
+                    print((yield received.decode()))
+
+        async def unannotated():
+            yield
+
+        async def returns_none() -> AsyncGenerator[Any, Any]:
+            yield
+
+        async def returns_any() -> AsyncGenerator[Any, Any]:
+            yield
+
+        @compat_agen
+        async def returns_value() -> Union[str, YieldType[int]]:
+            await yield_(1)
+            return "done"
+
+        @compat_agen
+        async def delegates() -> Union[None, YieldType[int]]:
+            await yield_from_(numbers(10))
+            return None
+        '''
+    )
+
+    namespace = {}
+    exec(rewritten, namespace)
+
+    async def main():
+        assert [number async for number in namespace["numbers"](3)] == [0, 1, 2]
+
+    trio.run(main)
+
+    # Names are added to an existing import from typing
+    rewritten, skipped = rewrite(
+        textwrap.dedent(
+            """\
+            from typing import (
+                NoReturn,
+                Union,
+            )
+            from async_generator import async_generator, yield_
+
+            @async_generator
+            async def forever() -> Union[NoReturn, YieldType[int]]:
+                while True:
+                    await yield_(1)
+            """
+        )
+    )
+    assert skipped == []
+    assert rewritten == textwrap.dedent(
+        """\
+        from typing import (
+            NoReturn,
+            Union, AsyncGenerator,
+        )
+        from async_generator import async_generator, yield_
+
+        async def forever() -> AsyncGenerator[int, None]:
+            while True:
+                yield 1
+        """
+    )
@@ -1,5 +1,11 @@
+import atexit
+import hashlib
+import json
 import os
+import shutil
 import sys
+import tempfile
+from typing import Any, Dict, List, Optional, Set
 
 if "trio_typing._tests.datadriven" not in sys.modules:
 
@@ -20,6 +26,38 @@ else:
     from mypy.test.data import DataDrivenTestCase, DataSuite
     from mypy.test.helpers import assert_string_arrays_equal
 
+    # Builds share an incremental cache, so that typeshed and the stubs
+    # are only analyzed once per combination of settings rather than once
+    # per test case. The cache lasts for the test run, unless
+    # TRIO_TYPING_TEST_CACHE names a directory to keep it in. Each
+    # pytest-xdist worker gets its own.
+    temporary_cache_root = None  # type: Optional[str]
+
+    def cache_dir(options: Options, config: str) -> str:
+        root = os.environ.get("TRIO_TYPING_TEST_CACHE")
+        if root is None:
+            global temporary_cache_root
+            if temporary_cache_root is None:
+                temporary_cache_root = tempfile.mkdtemp(prefix="trio-typing-cache-")
+                atexit.register(shutil.rmtree, temporary_cache_root, True)
+            root = temporary_cache_root
+        key = hashlib.sha1(
+            repr((options.python_version, options.platform, config)).encode("utf-8")
+        ).hexdigest()[:12]
+        worker = os.environ.get("PYTEST_XDIST_WORKER", "main")
+        return os.path.join(root, worker, key)
+
+    def revealed_as_errors(errors: List[str]) -> List[str]:
+        """Return mypy's output ``errors``, with the types revealed by
+        ``reveal_type()`` reported as errors, as they are before mypy
+        0.720, rather than notes, so tests can expect the same output
+        from every mypy release we support.
+        """
+        return [
+            line.replace(": note: Revealed type is", ": error: Revealed type is")
+            for line in errors
+        ]
+
     class TrioTestSuite(DataSuite):
         data_prefix = os.path.join(
             os.path.dirname(os.path.realpath(__file__)), "test-data"
@@ -36,14 +74,391 @@ else:
                 options.python_version = (3, 6)
             else:
                 options.python_version = sys.version_info[:2]
+            if testcase.name.endswith("_linux"):
+                options.platform = "linux"
             options.plugins = ["trio_typing.plugin"]
-            # must specify something for config_file, else the plugins don't get loaded
+            # must specify something for config_file, else the plugins don't get
+            # loaded; test cases can provide plugin settings in a [file mypy.ini]
             options.config_file = "/dev/null"
+            config = ""
+            for path, content in testcase.files:
+                if os.path.basename(path) == "mypy.ini":
+                    options.config_file = path
+                    config = content
+                else:
+                    # let the main module import other [file]s
+                    options.mypy_path = [os.path.dirname(path)]
+            options.incremental = True
+            options.cache_dir = cache_dir(options, config)
             result = build.build(
                 sources=[BuildSource("main", None, src)], options=options
             )
             assert_string_arrays_equal(
                 testcase.output,
-                result.errors,
+                revealed_as_errors(result.errors),
                 "Unexpected output from {0.file} line {0.line}".format(testcase),
             )
+
+    def trio_plugin(chained: Any) -> Any:
+        """Return the TrioPlugin that the ChainedPlugin ``chained`` asks
+        for hooks. Compiled mypy wraps it in a WrapperPlugin.
+        """
+        from trio_typing.plugin import TrioPlugin
+
+        (plugin,) = [
+            getattr(plugin, "plugin", plugin)
+            for plugin in getattr(chained, "_plugins")
+            if isinstance(getattr(plugin, "plugin", plugin), TrioPlugin)
+        ]
+        return plugin
+
+    def test_hook_profiler(tmpdir: Any) -> None:
+        report_path = str(tmpdir.join("profile.json"))
+        config_path = str(tmpdir.join("mypy.ini"))
+        with open(config_path, "w") as file:
+            file.write("[trio-typing]\nprofile = {}\n".format(report_path))
+        src = (
+            "import trio\n"
+            "async def child(arg: int) -> None: ...\n"
+            "async def parent() -> None:\n"
+            "    async with trio.open_nursery() as nursery:\n"
+            "        nursery.start_soon(child, 1)\n"
+            "        await trio.open_file('foo', 'rb')\n"
+        )
+        options = Options()
+        options.incremental = False
+        options.plugins = ["trio_typing.plugin"]
+        options.config_file = config_path
+        result = build.build(sources=[BuildSource("main", None, src)], options=options)
+        assert result.errors == []
+
+        plugin = trio_plugin(result.manager.plugin)
+        assert plugin.profiler is not None
+        plugin.profiler.write_report()
+        with open(report_path) as file:
+            report = {entry["name"]: entry for entry in json.load(file)["hooks"]}
+        assert report["open_file_callback"]["calls"] == 1
+        assert report["open_file_callback"]["slowest"][0]["site"] == "main:6"
+        assert report["get_function_hook"]["calls"] > 0
+        assert report["get_method_hook"]["calls"] > 0
+
+    def test_spawn_graph(tmpdir: Any) -> None:
+        graph_path = str(tmpdir.join("spawns.json"))
+        config_path = str(tmpdir.join("mypy.ini"))
+        with open(config_path, "w") as file:
+            file.write("[trio-typing]\nspawn_graph = {}\n".format(graph_path))
+        src = (
+            "import trio\n"
+            "from functools import partial\n"
+            "async def child(arg: int) -> None: ...\n"
+            "async def parent() -> None:\n"
+            "    async with trio.open_nursery() as nursery:\n"
+            "        nursery.start_soon(partial(child, 1))\n"
+            "        for i in range(10):\n"
+            "            nursery.start_soon(child, i)\n"
+            "trio.run(parent)\n"
+        )
+        source_path = str(tmpdir.join("spawner.py"))
+        with open(source_path, "w") as file:
+            file.write(src)
+
+        # The second build has an up-to-date cache, which mustn't stop
+        # its calls from being recorded
+        for _ in range(2):
+            options = Options()
+            options.cache_dir = str(tmpdir.join(".mypy_cache"))
+            options.plugins = ["trio_typing.plugin"]
+            options.config_file = config_path
+            result = build.build(
+                sources=[BuildSource(source_path, "spawner", None)], options=options
+            )
+            assert result.errors == []
+
+            plugin = trio_plugin(result.manager.plugin)
+            assert plugin.spawn_graph is not None
+            plugin.spawn_graph.write()
+            with open(graph_path) as file:
+                graph = json.load(file)
+            assert graph["nodes"] == ["spawner", "spawner.child", "spawner.parent"]
+            assert [
+                (edge["line"], edge["caller"], edge["target"], edge["in_loop"])
+                for edge in graph["edges"]
+            ] == [
+                (6, "spawner.parent", "spawner.child", False),
+                (8, "spawner.parent", "spawner.child", True),
+                (9, "spawner", "spawner.parent", False),
+            ]
+            assert graph["edges"][2]["spawner"] == "trio.run"
+
+    def test_stub_cache(tmpdir: Any) -> None:
+        from mypy.main import process_options
+        from trio_typing.stub_cache import main
+
+        config_path = str(tmpdir.join("mypy.ini"))
+        with open(config_path, "w") as file:
+            file.write("[mypy]\nplugins = trio_typing.plugin\n")
+        archive_path = str(tmpdir.join("stubs.tar.gz"))
+        cache_path = str(tmpdir.join("cache"))
+        assert main(["--config-file", config_path, "build", "-o", archive_path]) == 0
+        assert (
+            main(
+                ["--config-file", config_path, "restore", archive_path]
+                + ["--cache-dir", cache_path]
+            )
+            == 0
+        )
+
+        src = "import trio\nasync def main() -> None: ...\ntrio.run(main)\n"
+        sources, options = process_options(["--config-file", config_path, "-c", src])
+        options.cache_dir = cache_path
+        result = build.build(sources, options)
+        assert result.errors == []
+        assert result.manager.stats["stubs_parsed"] == 0
+        assert result.manager.stats["files_parsed"] == 1
+
+        # Different plugin settings need a different cache
+        with open(config_path, "a") as file:
+            file.write("[trio-typing]\nwarn_blocking_calls = True\n")
+        other_cache_path = str(tmpdir.join("other-cache"))
+        assert (
+            main(
+                ["--config-file", config_path, "restore", archive_path]
+                + ["--cache-dir", other_cache_path]
+            )
+            == 1
+        )
+        assert not os.path.exists(other_cache_path)
+
+    def test_registered_hooks(monkeypatch: Any) -> None:
+        import trio_typing.plugin
+        from mypy.plugin import FunctionContext
+        from mypy.types import Type
+
+        def magic_callback(ctx: FunctionContext) -> Type:
+            return ctx.api.named_generic_type("builtins.bytes", [])
+
+        def register(registry: trio_typing.plugin.HookRegistry) -> None:
+            registry.add_function_hook("__main__.magic", magic_callback)
+
+        monkeypatch.setattr(trio_typing.plugin, "_hook_providers", [register])
+        src = "def magic() -> int: ...\nreveal_type(magic())\n"
+        options = Options()
+        options.incremental = False
+        options.plugins = ["trio_typing.plugin"]
+        options.config_file = "/dev/null"
+        result = build.build(sources=[BuildSource("main", None, src)], options=options)
+        assert revealed_as_errors(result.errors) == [
+            "main:2: error: Revealed type is 'builtins.bytes'"
+        ]
+
+    def test_later_plugins() -> None:
+        from types import SimpleNamespace
+        import pytest
+        from mypy.plugins.default import DefaultPlugin
+
+        options = Options()
+        options.incremental = False
+        options.plugins = ["trio_typing.plugin"]
+        options.config_file = "/dev/null"
+        result = build.build(
+            sources=[BuildSource("main", None, "x = 1\n")], options=options
+        )
+        plugin = trio_plugin(result.manager.plugin)
+        api = SimpleNamespace(plugin=result.manager.plugin)
+        (default,) = plugin.find_later_plugins(api)
+        assert isinstance(default, DefaultPlugin)
+
+        # If mypy stops keeping its plugins where we look, we say so
+        with pytest.warns(RuntimeWarning, match="can't find the mypy plugins"):
+            (default,) = plugin.find_later_plugins(SimpleNamespace(plugin=None))
+        assert isinstance(default, DefaultPlugin)
+
+    def test_config_change_invalidates_cache(tmpdir: Any) -> None:
+        source_path = str(tmpdir.join("spawner.py"))
+        with open(source_path, "w") as file:
+            file.write(
+                "import trio_typing\n"
+                "async def child(a: int, b: int, c: int, d: int) -> None: ...\n"
+                "async def parent(nursery: trio_typing.Nursery) -> None:\n"
+                "    nursery.start_soon(child, 1, 2, 3, 4)\n"
+            )
+
+        def check(exact_arity: bool) -> int:
+            config_path = str(tmpdir.join("mypy.ini"))
+            with open(config_path, "w") as file:
+                file.write("[trio-typing]\nexact_arity = {}\n".format(exact_arity))
+            options = Options()
+            options.cache_dir = str(tmpdir.join(".mypy_cache"))
+            options.plugins = ["trio_typing.plugin"]
+            options.config_file = config_path
+            result = build.build(
+                sources=[BuildSource(source_path, "spawner", None)], options=options
+            )
+            return len(result.errors)
+
+        # four positional arguments are too many without exact_arity
+        assert check(exact_arity=True) == 0
+        assert check(exact_arity=False) > 0
+        assert check(exact_arity=True) == 0
+
+    def test_plugin_module_version(tmpdir: Any) -> None:
+        import trio_typing.plugin
+        from mypy.build import take_module_snapshot
+        from mypy.plugin import Plugin
+
+        def construct(exact_arity: bool) -> trio_typing.plugin.TrioPlugin:
+            config_path = str(tmpdir.join("mypy-{}.ini".format(exact_arity)))
+            with open(config_path, "w") as file:
+                file.write("[trio-typing]\nexact_arity = {}\n".format(exact_arity))
+            options = Options()
+            options.config_file = config_path
+            plugin = trio_typing.plugin.TrioPlugin(options)
+            # Compiled mypy gives us the WrapperPlugin around our plugin
+            return getattr(plugin, "plugin", plugin)
+
+        exact = construct(exact_arity=True)
+        lenient = construct(exact_arity=False)
+        assert exact.cache_version != lenient.cache_version
+        # Constructing a plugin doesn't change the module's globals
+        assert "__version__" not in vars(trio_typing.plugin)
+        if not hasattr(Plugin, "report_config_data"):
+            # mypy snapshots the module right after constructing a plugin
+            snapshot = take_module_snapshot(trio_typing.plugin)
+            assert snapshot.startswith(lenient.cache_version + ":")
+            exact = construct(exact_arity=True)
+            snapshot = take_module_snapshot(trio_typing.plugin)
+            assert snapshot.startswith(exact.cache_version + ":")
+
+    class FineGrainedBuild:
+        """A build that can be updated after editing files, the way the
+        mypy daemon does it.
+        """
+
+        def __init__(
+            self, tmpdir: Any, files: Dict[str, str], config: str = ""
+        ) -> None:
+            from mypy.server.update import FineGrainedBuildManager
+
+            self.tmpdir = tmpdir
+            config_path = str(tmpdir.join("mypy.ini"))
+            with open(config_path, "w") as file:
+                file.write(config)
+            for module, text in files.items():
+                self.write(module, text)
+            options = Options()
+            options.fine_grained_incremental = True
+            options.use_fine_grained_cache = False
+            options.cache_dir = str(tmpdir.join(".mypy_cache"))
+            options.plugins = ["trio_typing.plugin"]
+            options.config_file = config_path
+            sources = [BuildSource(self.path(module), module, None) for module in files]
+            result = build.build(sources=sources, options=options)
+            assert result.errors == []
+            self.manager = FineGrainedBuildManager(result)
+
+        def path(self, module: str) -> str:
+            return str(self.tmpdir.join(module + ".py"))
+
+        def write(self, module: str, text: str) -> None:
+            with open(self.path(module), "w") as file:
+                file.write(text)
+
+        def update(self, module: str, text: str) -> List[str]:
+            self.write(module, text)
+            self.manager.manager.fscache.flush()
+            return self.manager.update([(module, self.path(module))], [])
+
+    AGEN_TEMPLATE = """\
+from typing import Union
+from async_generator import async_generator, yield_
+from trio_typing import YieldType, SendType
+
+@async_generator
+async def numbers() -> Union[None, YieldType[{0}], SendType[None]]:
+    await yield_({0}())
+    return None
+"""
+
+    AGEN_USER = """\
+from typing import Union
+from async_generator import async_generator, yield_, yield_from_
+from trio_typing import YieldType, SendType
+from gen import numbers
+
+@async_generator
+async def relay() -> Union[None, YieldType[int], SendType[None]]:
+    await yield_from_(numbers())
+    return None
+
+@async_generator
+async def count() -> Union[None, YieldType[int], SendType[None]]:
+    await yield_(1)
+    return None
+
+def unrelated() -> int:
+    return 1
+"""
+
+    def test_fine_grained_yield_type(tmpdir: Any, monkeypatch: Any) -> None:
+        import mypy.server.update
+
+        fg_build = FineGrainedBuild(
+            tmpdir, {"gen": AGEN_TEMPLATE.format("int"), "user": AGEN_USER}
+        )
+        # Record the targets (functions and module top levels) rechecked
+        reprocess_nodes = mypy.server.update.reprocess_nodes
+        reprocessed = set()  # type: Set[str]
+
+        def spy(
+            manager: Any, graph: Any, module_id: str, nodeset: Any, *args: Any
+        ) -> Any:
+            reprocessed.update(node.node.fullname() for node in nodeset)
+            return reprocess_nodes(manager, graph, module_id, nodeset, *args)
+
+        monkeypatch.setattr(mypy.server.update, "reprocess_nodes", spy)
+        # Compiled mypy calls reprocess_nodes() directly, not via the module
+        spied = mypy.server.update.__file__.endswith(".py")
+
+        errors = fg_build.update("gen", AGEN_TEMPLATE.format("str"))
+        assert errors == [
+            fg_build.path("user") + ":8: error: Incompatible types (yield_from_ "
+            'argument YieldType "str", local declared YieldType "int")'
+        ]
+        # Only the yield_from_ call site (and the module-level import of
+        # gen.numbers) is rechecked, not the other functions
+        assert reprocessed == ({"user", "user.relay"} if spied else set())
+
+        reprocessed.clear()
+        assert fg_build.update("gen", AGEN_TEMPLATE.format("int")) == []
+        assert reprocessed == ({"user", "user.relay"} if spied else set())
+
+    def test_fine_grained_exact_arity(tmpdir: Any) -> None:
+        lib = (
+            "from typing import Any, Callable\n"
+            "from trio_typing import ArgsForCallable, takes_callable_and_args\n"
+            "{}\n"
+            "def run(fn: Callable[{}, None], *args: {}) -> None: ...\n"
+        )
+        fg_build = FineGrainedBuild(
+            tmpdir,
+            {
+                "lib": lib.format("", "...", "Any"),
+                "user": (
+                    "from lib import run\n"
+                    "def fn(x: int) -> None: ...\n"
+                    "run(fn, 'hi')\n"
+                ),
+            },
+            config="[trio-typing]\nexact_arity = True\n",
+        )
+        errors = fg_build.update(
+            "lib",
+            lib.format(
+                "@takes_callable_and_args", "[ArgsForCallable]", "ArgsForCallable"
+            ),
+        )
+        assert errors == [
+            fg_build.path("user") + ':3: error: Argument 1 to "run" has '
+            'incompatible type "Callable[[int], None]"; expected '
+            '"Callable[[str], None]"'
+        ]
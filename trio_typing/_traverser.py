@@ -0,0 +1,306 @@
+"""A visitor that walks a mypy syntax tree, for the plugin's checks.
+
+This does what mypy's ``TraverserVisitor`` does, without using mypy's
+visitor classes or the ``accept()`` methods of its nodes: in compiled
+mypy releases (0.730 and later), classes that aren't compiled can't
+subclass ``TraverserVisitor``, and passing ``accept()`` a visitor that
+isn't compiled crashes the interpreter. Only the Python 3 syntax that
+Trio code can use is covered.
+"""
+
+import re
+from typing import Any, Callable, Dict, Optional
+from mypy.nodes import (
+    REVEAL_TYPE,
+    AssertStmt,
+    AssignmentStmt,
+    AwaitExpr,
+    Block,
+    CallExpr,
+    CastExpr,
+    ClassDef,
+    ComparisonExpr,
+    ConditionalExpr,
+    Decorator,
+    DelStmt,
+    DictExpr,
+    DictionaryComprehension,
+    ExpressionStmt,
+    ForStmt,
+    FuncDef,
+    FuncItem,
+    GeneratorExpr,
+    IfStmt,
+    IndexExpr,
+    LambdaExpr,
+    ListComprehension,
+    ListExpr,
+    MemberExpr,
+    MypyFile,
+    Node,
+    OpExpr,
+    OperatorAssignmentStmt,
+    OverloadedFuncDef,
+    RaiseStmt,
+    ReturnStmt,
+    RevealExpr,
+    SetComprehension,
+    SetExpr,
+    SliceExpr,
+    StarExpr,
+    SuperExpr,
+    TryStmt,
+    TupleExpr,
+    TypeApplication,
+    UnaryExpr,
+    WhileStmt,
+    WithStmt,
+    YieldExpr,
+    YieldFromExpr,
+)
+
+
+# The name of the visit method for each class of node, like
+# "visit_func_def" for FuncDef, once we've seen one
+_visit_method_names = {}  # type: Dict[type, str]
+
+
+def visit_method_name(cls: type) -> str:
+    try:
+        return _visit_method_names[cls]
+    except KeyError:
+        name = "visit_" + re.sub(r"(?<!^)(?=[A-Z])", "_", cls.__name__).lower()
+        _visit_method_names[cls] = name
+        return name
+
+
+class NodeTraverser:
+    """Visit every node in a tree. Subclasses override the visit
+    methods for the nodes they're interested in, and call the method
+    they override to go on into the node's children. Nodes without a
+    visit method here, like names and literals, have no children.
+    """
+
+    def accept(self, node: Node) -> None:
+        """Visit ``node``, calling the visit method for its class."""
+        method = getattr(
+            self, visit_method_name(type(node)), None
+        )  # type: Optional[Callable[[Any], None]]
+        if method is not None:
+            method(node)
+
+    def visit_mypy_file(self, o: MypyFile) -> None:
+        for defn in o.defs:
+            self.accept(defn)
+
+    def visit_block(self, o: Block) -> None:
+        for stmt in o.body:
+            self.accept(stmt)
+
+    def visit_func(self, o: FuncItem) -> None:
+        for arg in o.arguments or []:
+            if arg.initializer is not None:
+                self.accept(arg.initializer)
+        self.accept(o.body)
+
+    def visit_func_def(self, o: FuncDef) -> None:
+        self.visit_func(o)
+
+    def visit_overloaded_func_def(self, o: OverloadedFuncDef) -> None:
+        for item in o.items:
+            self.accept(item)
+        if o.impl is not None:
+            self.accept(o.impl)
+
+    def visit_class_def(self, o: ClassDef) -> None:
+        for decorator in o.decorators:
+            self.accept(decorator)
+        for base in o.base_type_exprs:
+            self.accept(base)
+        self.accept(o.defs)
+
+    def visit_decorator(self, o: Decorator) -> None:
+        self.accept(o.func)
+        for decorator in o.decorators:
+            self.accept(decorator)
+
+    def visit_expression_stmt(self, o: ExpressionStmt) -> None:
+        self.accept(o.expr)
+
+    def visit_assignment_stmt(self, o: AssignmentStmt) -> None:
+        self.accept(o.rvalue)
+        for lvalue in o.lvalues:
+            self.accept(lvalue)
+
+    def visit_operator_assignment_stmt(self, o: OperatorAssignmentStmt) -> None:
+        self.accept(o.rvalue)
+        self.accept(o.lvalue)
+
+    def visit_while_stmt(self, o: WhileStmt) -> None:
+        self.accept(o.expr)
+        self.accept(o.body)
+        if o.else_body is not None:
+            self.accept(o.else_body)
+
+    def visit_for_stmt(self, o: ForStmt) -> None:
+        self.accept(o.index)
+        self.accept(o.expr)
+        self.accept(o.body)
+        if o.else_body is not None:
+            self.accept(o.else_body)
+
+    def visit_return_stmt(self, o: ReturnStmt) -> None:
+        if o.expr is not None:
+            self.accept(o.expr)
+
+    def visit_assert_stmt(self, o: AssertStmt) -> None:
+        if o.expr is not None:
+            self.accept(o.expr)
+        if o.msg is not None:
+            self.accept(o.msg)
+
+    def visit_del_stmt(self, o: DelStmt) -> None:
+        if o.expr is not None:
+            self.accept(o.expr)
+
+    def visit_if_stmt(self, o: IfStmt) -> None:
+        for expr in o.expr:
+            self.accept(expr)
+        for body in o.body:
+            self.accept(body)
+        if o.else_body is not None:
+            self.accept(o.else_body)
+
+    def visit_raise_stmt(self, o: RaiseStmt) -> None:
+        if o.expr is not None:
+            self.accept(o.expr)
+        if o.from_expr is not None:
+            self.accept(o.from_expr)
+
+    def visit_try_stmt(self, o: TryStmt) -> None:
+        self.accept(o.body)
+        for typ, var, handler in zip(o.types, o.vars, o.handlers):
+            if typ is not None:
+                self.accept(typ)
+            if var is not None:
+                self.accept(var)
+            self.accept(handler)
+        if o.else_body is not None:
+            self.accept(o.else_body)
+        if o.finally_body is not None:
+            self.accept(o.finally_body)
+
+    def visit_with_stmt(self, o: WithStmt) -> None:
+        for expr, target in zip(o.expr, o.target):
+            self.accept(expr)
+            if target is not None:
+                self.accept(target)
+        self.accept(o.body)
+
+    def visit_member_expr(self, o: MemberExpr) -> None:
+        self.accept(o.expr)
+
+    def visit_yield_from_expr(self, o: YieldFromExpr) -> None:
+        self.accept(o.expr)
+
+    def visit_yield_expr(self, o: YieldExpr) -> None:
+        if o.expr is not None:
+            self.accept(o.expr)
+
+    def visit_call_expr(self, o: CallExpr) -> None:
+        for arg in o.args:
+            self.accept(arg)
+        self.accept(o.callee)
+
+    def visit_op_expr(self, o: OpExpr) -> None:
+        self.accept(o.left)
+        self.accept(o.right)
+
+    def visit_comparison_expr(self, o: ComparisonExpr) -> None:
+        for operand in o.operands:
+            self.accept(operand)
+
+    def visit_slice_expr(self, o: SliceExpr) -> None:
+        for index in (o.begin_index, o.end_index, o.stride):
+            if index is not None:
+                self.accept(index)
+
+    def visit_cast_expr(self, o: CastExpr) -> None:
+        self.accept(o.expr)
+
+    def visit_reveal_expr(self, o: RevealExpr) -> None:
+        if o.kind == REVEAL_TYPE and o.expr is not None:
+            self.accept(o.expr)
+
+    def visit_assignment_expr(self, o: Any) -> None:
+        # An AssignmentExpr (``target := value``), in mypy >= 0.730
+        self.accept(o.target)
+        self.accept(o.value)
+
+    def visit_unary_expr(self, o: UnaryExpr) -> None:
+        self.accept(o.expr)
+
+    def visit_list_expr(self, o: ListExpr) -> None:
+        for item in o.items:
+            self.accept(item)
+
+    def visit_tuple_expr(self, o: TupleExpr) -> None:
+        for item in o.items:
+            self.accept(item)
+
+    def visit_dict_expr(self, o: DictExpr) -> None:
+        for key, value in o.items:
+            if key is not None:
+                self.accept(key)
+            self.accept(value)
+
+    def visit_set_expr(self, o: SetExpr) -> None:
+        for item in o.items:
+            self.accept(item)
+
+    def visit_index_expr(self, o: IndexExpr) -> None:
+        self.accept(o.base)
+        self.accept(o.index)
+
+    def visit_generator_expr(self, o: GeneratorExpr) -> None:
+        for index, sequence, conditions in zip(o.indices, o.sequences, o.condlists):
+            self.accept(sequence)
+            self.accept(index)
+            for condition in conditions:
+                self.accept(condition)
+        self.accept(o.left_expr)
+
+    def visit_dictionary_comprehension(self, o: DictionaryComprehension) -> None:
+        for index, sequence, conditions in zip(o.indices, o.sequences, o.condlists):
+            self.accept(sequence)
+            self.accept(index)
+            for condition in conditions:
+                self.accept(condition)
+        self.accept(o.key)
+        self.accept(o.value)
+
+    def visit_list_comprehension(self, o: ListComprehension) -> None:
+        self.accept(o.generator)
+
+    def visit_set_comprehension(self, o: SetComprehension) -> None:
+        self.accept(o.generator)
+
+    def visit_conditional_expr(self, o: ConditionalExpr) -> None:
+        self.accept(o.cond)
+        self.accept(o.if_expr)
+        self.accept(o.else_expr)
+
+    def visit_type_application(self, o: TypeApplication) -> None:
+        self.accept(o.expr)
+
+    def visit_lambda_expr(self, o: LambdaExpr) -> None:
+        self.visit_func(o)
+
+    def visit_star_expr(self, o: StarExpr) -> None:
+        self.accept(o.expr)
+
+    def visit_await_expr(self, o: AwaitExpr) -> None:
+        self.accept(o.expr)
+
+    def visit_super_expr(self, o: SuperExpr) -> None:
+        self.accept(o.call)
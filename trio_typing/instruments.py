@@ -0,0 +1,292 @@
+"""Ready-made :class:`trio.abc.Instrument`\\s for watching how the Trio
+scheduler spends its time, cheap enough to leave enabled in production.
+
+* :class:`StepTimes` keeps a histogram of how long each step of each
+  task (the time from one checkpoint to the next) took, by task name.
+* :class:`SchedulerLag` keeps a histogram of how long tasks waited to
+  run after they were rescheduled.
+* :class:`RunTime` adds up the time the run loop spends running tasks,
+  waiting for I/O, and doing its own work.
+* :class:`SlowSteps` reports steps that take longer than a threshold.
+
+Pass them to :func:`trio.run` or :func:`trio.hazmat.add_instrument`::
+
+    step_times = StepTimes()
+    trio.run(main, instruments=[step_times, SlowSteps(0.05)])
+    for name in step_times.names():
+        print(name, step_times.histogram(name).percentile(99))
+
+Histograms are ``array.array``\\s with a fixed set of buckets,
+allocated the first time a task name is seen, so :class:`StepTimes`
+doesn't allocate anything per step beyond the float that the clock
+returns, and :class:`RunTime` and :class:`SlowSteps` keep running
+totals. :class:`SchedulerLag` is the exception: it has to remember when
+each task was rescheduled, so it keeps a dict entry for each task
+that's waiting to run, which is removed when the task runs.
+``bench/instruments.py`` measures what each one adds to the cost of a
+task step.
+"""
+
+import array
+import logging
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import trio
+
+__all__ = [
+    "DEFAULT_BUCKETS",
+    "Histogram",
+    "StepTimes",
+    "SchedulerLag",
+    "RunTime",
+    "SlowSteps",
+]
+
+# Upper bounds, in seconds, of the histogram buckets: powers of two from
+# about 1 microsecond to about 1 second. Times longer than the last
+# bound go in one more bucket at the end.
+DEFAULT_BUCKETS = tuple(2.0 ** exponent for exponent in range(-20, 1))
+
+Clock = Callable[[], float]
+
+LOGGER = logging.getLogger("trio_typing.instruments")
+
+
+class Histogram:
+    """Counts of times that fell in each of a fixed set of buckets.
+
+    ``counts[i]`` is the number of times no greater than ``bounds[i]``
+    (and greater than ``bounds[i - 1]``); the last count, which has no
+    bound, is the number of times greater than all the bounds.
+    """
+
+    __slots__ = ("bounds", "counts", "total_seconds")
+
+    def __init__(self, bounds: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.bounds = tuple(bounds)
+        self.counts = array.array("Q", bytes(8 * (len(self.bounds) + 1)))
+        self.total_seconds = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.counts[bisect_left(self.bounds, seconds)] += 1
+        self.total_seconds += seconds
+
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def mean(self) -> float:
+        count = self.count()
+        return self.total_seconds / count if count else 0.0
+
+    def percentile(self, percent: float) -> float:
+        """Return the upper bound of the bucket that the given
+        percentile falls in, ``math.inf`` if that's the last bucket,
+        or 0 if the histogram is empty.
+        """
+        target = self.count() * percent / 100
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= target:
+                if index == len(self.bounds):
+                    return float("inf")
+                return self.bounds[index]
+        return 0.0
+
+    def buckets(self) -> Iterator[Tuple[float, int]]:
+        """Yield (upper bound, count) for each bucket, with a bound of
+        ``math.inf`` for the last one.
+        """
+        bounds = self.bounds + (float("inf"),)
+        return zip(bounds, self.counts)
+
+    def merge(self, other: "Histogram") -> None:
+        """Add the counts from ``other``, which must have the same
+        bounds, to this histogram.
+        """
+        if other.bounds != self.bounds:
+            raise ValueError("can't merge histograms with different buckets")
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.total_seconds += other.total_seconds
+
+
+class StepTimes(trio.abc.Instrument):
+    """Keeps a :class:`Histogram` of step times for each task name.
+
+    Tasks with the same name (for example, many copies of the same
+    connection handler) share a histogram, so memory use is bounded by
+    the number of distinct names rather than the number of tasks.
+    """
+
+    def __init__(
+        self,
+        bounds: Sequence[float] = DEFAULT_BUCKETS,
+        clock: Clock = time.perf_counter,
+    ) -> None:
+        self._bounds = tuple(bounds)
+        self._clock = clock
+        self._histograms = {}  # type: Dict[str, Histogram]
+        self._step_started = 0.0
+
+    def before_task_step(self, task: trio.hazmat.Task) -> None:
+        self._step_started = self._clock()
+
+    def after_task_step(self, task: trio.hazmat.Task) -> None:
+        elapsed = self._clock() - self._step_started
+        try:
+            histogram = self._histograms[task.name]
+        except KeyError:
+            histogram = self._histograms[task.name] = Histogram(self._bounds)
+        histogram.counts[bisect_left(histogram.bounds, elapsed)] += 1
+        histogram.total_seconds += elapsed
+
+    def names(self) -> List[str]:
+        """Return the names of all the tasks that have taken a step."""
+        return sorted(self._histograms)
+
+    def histogram(self, name: str) -> Histogram:
+        """Return the histogram of step times for tasks named ``name``.
+        Raises :exc:`KeyError` if no such task has taken a step.
+        """
+        return self._histograms[name]
+
+    def total(self) -> Histogram:
+        """Return a histogram of the step times of all tasks."""
+        total = Histogram(self._bounds)
+        for histogram in self._histograms.values():
+            total.merge(histogram)
+        return total
+
+
+class SchedulerLag(trio.abc.Instrument):
+    """Keeps a :class:`Histogram` of how long tasks waited between being
+    rescheduled and starting to run, which grows when the run loop is
+    overloaded or some task is hogging it.
+
+    The time each task was rescheduled is kept in a dict until the task
+    runs, so unlike the other instruments, this allocates a little
+    memory each time a task is rescheduled.
+    """
+
+    def __init__(
+        self,
+        bounds: Sequence[float] = DEFAULT_BUCKETS,
+        clock: Clock = time.perf_counter,
+    ) -> None:
+        self._clock = clock
+        self._scheduled = {}  # type: Dict[trio.hazmat.Task, float]
+        self.histogram = Histogram(bounds)
+        self.max_seconds = 0.0
+
+    def task_scheduled(self, task: trio.hazmat.Task) -> None:
+        self._scheduled[task] = self._clock()
+
+    def before_task_step(self, task: trio.hazmat.Task) -> None:
+        scheduled = self._scheduled.pop(task, None)
+        if scheduled is None:
+            # We were added while the task was already scheduled
+            return
+        lag = self._clock() - scheduled
+        histogram = self.histogram
+        histogram.counts[bisect_left(histogram.bounds, lag)] += 1
+        histogram.total_seconds += lag
+        if lag > self.max_seconds:
+            self.max_seconds = lag
+
+    def task_exited(self, task: trio.hazmat.Task) -> None:
+        self._scheduled.pop(task, None)
+
+
+class RunTime(trio.abc.Instrument):
+    """Adds up where the run loop's time goes: running task steps
+    (``running_seconds``), waiting for I/O or timeouts
+    (``io_wait_seconds``), and everything else, such as the scheduler's
+    own work and instrument overhead (``other_seconds``).
+    """
+
+    def __init__(self, clock: Clock = time.perf_counter) -> None:
+        self._clock = clock
+        self._run_started = None  # type: Optional[float]
+        self._run_seconds = 0.0
+        self._step_started = 0.0
+        self._io_wait_started = 0.0
+        self.running_seconds = 0.0
+        self.io_wait_seconds = 0.0
+        self.steps = 0
+        self.io_waits = 0
+
+    def before_run(self) -> None:
+        self._run_started = self._clock()
+
+    def after_run(self) -> None:
+        if self._run_started is not None:
+            self._run_seconds += self._clock() - self._run_started
+            self._run_started = None
+
+    def before_task_step(self, task: trio.hazmat.Task) -> None:
+        self._step_started = self._clock()
+
+    def after_task_step(self, task: trio.hazmat.Task) -> None:
+        self.running_seconds += self._clock() - self._step_started
+        self.steps += 1
+
+    def before_io_wait(self, timeout: float) -> None:
+        self._io_wait_started = self._clock()
+
+    def after_io_wait(self, timeout: float) -> None:
+        self.io_wait_seconds += self._clock() - self._io_wait_started
+        self.io_waits += 1
+
+    @property
+    def total_seconds(self) -> float:
+        """The time spent in :func:`trio.run` so far, or since the
+        instrument was added if that was later.
+        """
+        total = self._run_seconds
+        if self._run_started is not None:
+            total += self._clock() - self._run_started
+        return total
+
+    @property
+    def other_seconds(self) -> float:
+        return max(
+            0.0, self.total_seconds - self.running_seconds - self.io_wait_seconds
+        )
+
+
+def _log_slow_step(task: trio.hazmat.Task, seconds: float) -> None:
+    LOGGER.warning(
+        "Task %r ran for %.3f seconds without a checkpoint", task.name, seconds
+    )
+
+
+class SlowSteps(trio.abc.Instrument):
+    """Calls ``callback(task, seconds)`` after each task step that took
+    longer than ``threshold`` seconds, during which no other task could
+    run. By default, logs a warning to the ``trio_typing.instruments``
+    logger.
+    """
+
+    def __init__(
+        self,
+        threshold: float,
+        callback: Callable[[trio.hazmat.Task, float], None] = _log_slow_step,
+        clock: Clock = time.perf_counter,
+    ) -> None:
+        self.threshold = threshold
+        self._callback = callback
+        self._clock = clock
+        self._step_started = 0.0
+        self.slow_steps = 0
+
+    def before_task_step(self, task: trio.hazmat.Task) -> None:
+        self._step_started = self._clock()
+
+    def after_task_step(self, task: trio.hazmat.Task) -> None:
+        elapsed = self._clock() - self._step_started
+        if elapsed > self.threshold:
+            self.slow_steps += 1
+            self._callback(task, elapsed)
@@ -0,0 +1,209 @@
+"""Periodic snapshots of how busy a set of Trio synchronization
+primitives are, for exporting to a metrics system.
+
+Register the primitives you want to watch with a
+:class:`StatisticsCollector`, under names of your choosing, and call
+:meth:`~StatisticsCollector.snapshot` as often as you like::
+
+    collector = StatisticsCollector()
+    collector.register("db-pool", db_limiter)
+    collector.register("jobs", job_send_channel)
+
+    async def export_forever():
+        while True:
+            for sample in collector.snapshot().samples:
+                gauge("waiting", sample.tasks_waiting, name=sample.name)
+                gauge("used", sample.used, name=sample.name)
+            await trio.sleep(10)
+
+Each primitive is reduced to the same three numbers, so that samples
+from different kinds of primitive can be exported alike: the number of
+tasks waiting on it (``tasks_waiting``), how much of it is in use
+(``used``), and how much of it there is (``capacity``, which is
+``math.inf`` if there's no limit). For each kind of primitive these are:
+
+* ``CapacityLimiter``: tasks waiting to acquire it, borrowed tokens,
+  and total tokens.
+* Either end of a memory channel: tasks waiting to send or receive,
+  items in the buffer, and the buffer size.
+* ``trio.hazmat.UnboundedQueue``: tasks waiting for a batch, items
+  queued, and infinity.
+* ``Semaphore``: tasks waiting to acquire it, ``max_value - value``,
+  and ``max_value``; or 0 and infinity if it has no ``max_value``.
+* ``Lock`` and ``Condition``: tasks waiting to acquire the lock or be
+  notified, 1 if the lock is held or 0 if not, and 1.
+* ``Event``: tasks waiting for it, 1 if it's set or 0 if not, and 1.
+* ``trio.hazmat.ParkingLot``: parked tasks, 0, and 0.
+
+Samples are plain named tuples, so ``sample._asdict()`` gives something
+that can be serialized as JSON.
+"""
+
+import math
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Callable, List, NamedTuple, Tuple, Union
+
+import trio
+
+__all__ = ["Sample", "Snapshot", "StatisticsCollector"]
+
+Sample = NamedTuple(
+    "Sample",
+    [
+        ("name", str),
+        ("kind", str),
+        ("tasks_waiting", int),
+        ("used", int),
+        ("capacity", float),
+    ],
+)
+Sample.__doc__ = """The statistics of one registered primitive."""
+
+Snapshot = NamedTuple(
+    "Snapshot", [("timestamp", float), ("samples", Tuple[Sample, ...])]
+)
+Snapshot.__doc__ = """The statistics of every registered primitive, and
+the time (from :func:`time.time`) when they were taken.
+"""
+
+if TYPE_CHECKING:
+    Primitive = Union[
+        trio.CapacityLimiter,
+        trio.Semaphore,
+        trio.Lock,
+        trio.Condition,
+        trio.Event,
+        trio.hazmat.ParkingLot,
+        trio.hazmat.UnboundedQueue[Any],
+        trio._MemorySendChannel[Any],
+        trio._MemoryReceiveChannel[Any],
+    ]
+
+# Takes a primitive, returns (tasks_waiting, used, capacity)
+Reader = Callable[[Any], Tuple[int, int, float]]
+
+
+def _read_capacity_limiter(limiter: trio.CapacityLimiter) -> Tuple[int, int, float]:
+    stats = limiter.statistics()
+    return stats.tasks_waiting, stats.borrowed_tokens, stats.total_tokens
+
+
+def _read_memory_channel(
+    channel: "trio._MemorySendChannel[Any]"
+) -> Tuple[int, int, float]:
+    stats = channel.statistics()
+    return (
+        stats.tasks_waiting_send + stats.tasks_waiting_receive,
+        stats.current_buffer_used,
+        stats.max_buffer_size,
+    )
+
+
+def _read_unbounded_queue(
+    queue: "trio.hazmat.UnboundedQueue[Any]"
+) -> Tuple[int, int, float]:
+    stats = queue.statistics()
+    return stats.tasks_waiting, stats.qsize, math.inf
+
+
+def _read_semaphore(semaphore: trio.Semaphore) -> Tuple[int, int, float]:
+    waiting = semaphore.statistics().tasks_waiting
+    if semaphore.max_value is None:
+        return waiting, 0, math.inf
+    return waiting, semaphore.max_value - semaphore.value, semaphore.max_value
+
+
+def _read_lock(lock: trio.Lock) -> Tuple[int, int, float]:
+    stats = lock.statistics()
+    return stats.tasks_waiting, int(stats.locked), 1
+
+
+def _read_condition(condition: trio.Condition) -> Tuple[int, int, float]:
+    stats = condition.statistics()
+    return stats.tasks_waiting, int(stats.lock_statistics.locked), 1
+
+
+def _read_event(event: trio.Event) -> Tuple[int, int, float]:
+    return event.statistics().tasks_waiting, int(event.is_set()), 1
+
+
+def _read_parking_lot(lot: trio.hazmat.ParkingLot) -> Tuple[int, int, float]:
+    return lot.statistics().tasks_waiting, 0, 0
+
+
+# (class, kind, reader); checked in order, so subclasses come first
+_READERS = [
+    (trio.CapacityLimiter, "capacity_limiter", _read_capacity_limiter),
+    (trio.hazmat.UnboundedQueue, "unbounded_queue", _read_unbounded_queue),
+    (trio.Semaphore, "semaphore", _read_semaphore),
+    (trio.Lock, "lock", _read_lock),
+    (trio.Condition, "condition", _read_condition),
+    (trio.Event, "event", _read_event),
+    (trio.hazmat.ParkingLot, "parking_lot", _read_parking_lot),
+]  # type: List[Tuple[type, str, Reader]]
+
+
+def _reader_for(primitive: object) -> Tuple[str, Reader]:
+    for cls, kind, reader in _READERS:
+        if isinstance(primitive, cls):
+            return kind, reader
+    # The memory channel classes aren't public
+    if isinstance(primitive, (trio.abc.SendChannel, trio.abc.ReceiveChannel)):
+        stats = getattr(primitive, "statistics", lambda: None)()
+        if hasattr(stats, "current_buffer_used"):
+            kind = "send_channel"
+            if isinstance(primitive, trio.abc.ReceiveChannel):
+                kind = "receive_channel"
+            return kind, _read_memory_channel
+    raise TypeError("don't know how to collect statistics from {!r}".format(primitive))
+
+
+class StatisticsCollector:
+    """Takes snapshots of the statistics of a set of named primitives.
+
+    Working out how to read each primitive happens when it's
+    registered, so that taking a snapshot only calls the primitives'
+    ``statistics()`` methods.
+    """
+
+    def __init__(self) -> None:
+        # name -> (primitive, kind, reader)
+        self._primitives = (
+            OrderedDict()
+        )  # type: OrderedDict[str, Tuple[Any, str, Reader]]
+
+    def register(self, name: str, primitive: "Primitive") -> None:
+        """Include ``primitive`` in future snapshots, under ``name``.
+        Raises :exc:`ValueError` if ``name`` is already registered, and
+        :exc:`TypeError` if ``primitive`` isn't one of the supported
+        kinds.
+        """
+        if name in self._primitives:
+            raise ValueError("{!r} is already registered".format(name))
+        kind, reader = _reader_for(primitive)
+        self._primitives[name] = (primitive, kind, reader)
+
+    def unregister(self, name: str) -> None:
+        """Stop including the primitive registered as ``name`` in
+        snapshots. Raises :exc:`KeyError` if there isn't one.
+        """
+        del self._primitives[name]
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._primitives
+
+    def __len__(self) -> int:
+        return len(self._primitives)
+
+    def snapshot(self) -> Snapshot:
+        """Return the current statistics of every registered primitive,
+        in the order they were registered.
+        """
+        return Snapshot(
+            time.time(),
+            tuple(
+                Sample(name, kind, *reader(primitive))
+                for name, (primitive, kind, reader) in self._primitives.items()
+            ),
+        )
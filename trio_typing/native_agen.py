@@ -0,0 +1,463 @@
+"""Rewrite ``@async_generator`` functions as native async generators
+(``yield`` inside ``async def``, which needs Python 3.6 or later)::
+
+    python -m trio_typing.native_agen [--diff] FILE...
+
+A function is rewritten if it yields something, doesn't use
+``yield_from_()``, never returns a value other than None, and isn't
+declared to return anything but None, ``NoReturn`` or ``Any``: the same
+functions that the plugin reports if you turn on its
+``warn_convertible_async_generators`` setting. For each one, this:
+
+* removes the ``@async_generator`` decorator;
+* replaces each ``await yield_(value)`` with ``yield value``, in
+  parentheses unless it's a statement or the right-hand side of an
+  assignment;
+* replaces ``return None`` with ``return``; and
+* replaces a return annotation like ``Union[None, YieldType[Y],
+  SendType[S]]`` with ``AsyncGenerator[Y, S]``, which means the same
+  thing, importing ``AsyncGenerator`` from ``typing`` if nothing in the
+  file already defines it (on the file's first ``from typing import``
+  line, if it has one).
+
+Functions that can't be rewritten are listed, with the reason. Imports
+from ``async_generator`` that are no longer used are left for you to
+remove.
+"""
+
+import argparse
+import ast
+import difflib
+import io
+import sys
+import tokenize
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+__all__ = ["rewrite"]
+
+_CONSTANT_TYPES = tuple(
+    getattr(ast, name) for name in ("Constant", "NameConstant") if hasattr(ast, name)
+)
+
+# The types, besides None, that a function can be declared to return
+# and still be a native async generator, which can't return a value
+_NO_VALUE_NAMES = {"Any", "NoReturn"}
+
+# (start offset, end offset, replacement text)
+Edit = Tuple[int, int, str]
+
+
+class CantRewrite(Exception):
+    pass
+
+
+def _is_none(node: ast.AST) -> bool:
+    return isinstance(node, _CONSTANT_TYPES) and getattr(node, "value", 0) is None
+
+
+def _final_name(node: ast.AST) -> Optional[str]:
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        return node.attr
+    return None
+
+
+def _subscript_items(node: ast.Subscript) -> List[ast.expr]:
+    index = node.slice
+    if isinstance(index, ast.Index):  # Python < 3.9
+        index = index.value  # type: ignore
+    if isinstance(index, ast.Tuple):
+        return list(index.elts)
+    return [index]  # type: ignore
+
+
+class _Source:
+    """The text of a module, with the tokens and offsets we need to
+    find the source of AST nodes (which don't record where they end
+    before Python 3.8).
+    """
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.lines = text.splitlines(True)
+        self.line_starts = [0]
+        for line in self.lines:
+            self.line_starts.append(self.line_starts[-1] + len(line))
+        self.tokens = list(tokenize.generate_tokens(io.StringIO(text).readline))
+        self.token_at = {
+            self.offset(*token.start): index for index, token in enumerate(self.tokens)
+        }  # type: Dict[int, int]
+
+    def offset(self, lineno: int, column: int) -> int:
+        return self.line_starts[lineno - 1] + column
+
+    def node_start(self, node: ast.AST) -> int:
+        # col_offset counts UTF-8 bytes, not characters
+        prefix = self.lines[node.lineno - 1].encode("utf-8")[: node.col_offset]
+        return self.offset(node.lineno, len(prefix.decode("utf-8")))
+
+    def token_end(self, index: int) -> int:
+        return self.offset(*self.tokens[index].end)
+
+    def find_op(self, index: int, op: str) -> int:
+        """Return the index of the first ``op`` token at or after
+        ``index`` that isn't inside brackets.
+        """
+        depth = 0
+        while True:
+            token = self.tokens[index]
+            if token.type == tokenize.OP:
+                if token.string == op and depth == 0:
+                    return index
+                if token.string in "([{":
+                    depth += 1
+                elif token.string in ")]}":
+                    depth -= 1
+            index += 1
+
+    def matching(self, index: int) -> int:
+        """Return the index of the bracket that closes the one at ``index``."""
+        return self.find_op(
+            index + 1, {"(": ")", "[": "]", "{": "}"}[self.tokens[index].string]
+        )
+
+    def brackets(self, node: ast.AST, op: str) -> Tuple[int, int]:
+        """Return the indices of the tokens that open and close the
+        first ``op`` bracket in ``node``, like the parentheses around
+        the arguments of a call.
+        """
+        opening = self.find_op(self.token_at[self.node_start(node)], op)
+        return opening, self.matching(opening)
+
+    def inside(self, opening: int, closing: int) -> str:
+        """Return the text between two tokens."""
+        return self.text[
+            self.token_end(opening) : self.offset(*self.tokens[closing].start)
+        ]
+
+    def expression_end(self, node: ast.AST) -> int:
+        """Return the offset of the end of ``node``, which must be a
+        (possibly dotted) name, None, or a subscript of one.
+        """
+        index = self.token_at[self.node_start(node)]
+        end = index
+        index += 1
+        while self.tokens[index].string in (".", "["):
+            if self.tokens[index].string == ".":
+                end = index + 1
+            else:
+                end = self.matching(index)
+            index = end + 1
+        return self.token_end(end)
+
+
+class _Names:
+    """The local names that a module binds to the parts of
+    ``async_generator`` we care about.
+    """
+
+    def __init__(self, tree: ast.Module) -> None:
+        self.modules = set()  # type: Set[str]
+        self.functions = {}  # type: Dict[str, str]
+        self.bound = set()  # type: Set[str]
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                for alias in node.names:
+                    name = alias.asname or alias.name.partition(".")[0]
+                    self.bound.add(name)
+                    if alias.name == "async_generator":
+                        self.modules.add(name)
+            elif isinstance(node, ast.ImportFrom):
+                for alias in node.names:
+                    name = alias.asname or alias.name
+                    self.bound.add(name)
+                    if node.module == "async_generator":
+                        self.functions[name] = alias.name
+            elif isinstance(
+                node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+            ):
+                self.bound.add(node.name)
+            elif isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store):
+                self.bound.add(node.id)
+
+    def resolve(self, node: ast.AST) -> Optional[str]:
+        """Return which ``async_generator`` function ``node`` refers
+        to, if any.
+        """
+        if isinstance(node, ast.Name):
+            return self.functions.get(node.id)
+        if (
+            isinstance(node, ast.Attribute)
+            and isinstance(node.value, ast.Name)
+            and node.value.id in self.modules
+        ):
+            return node.attr
+        return None
+
+
+def _body_parents(func: ast.AsyncFunctionDef) -> Dict[ast.AST, ast.AST]:
+    """Map each node in the body of ``func`` to its parent, leaving out
+    nested functions and classes.
+    """
+    parents = {
+        statement: func for statement in func.body
+    }  # type: Dict[ast.AST, ast.AST]
+    pending = list(func.body)  # type: List[ast.AST]
+    while pending:
+        node = pending.pop()
+        for child in ast.iter_child_nodes(node):
+            if not isinstance(
+                child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda, ast.ClassDef)
+            ):
+                parents[child] = node
+                pending.append(child)
+    return parents
+
+
+def _union_members(annotation: ast.expr) -> List[ast.expr]:
+    """Return the types that make up the ``Union`` or ``Optional``
+    ``annotation``, including any nested ones, or just ``annotation``
+    if it's something else we understand.
+    """
+    if isinstance(annotation, ast.Subscript) and _final_name(annotation.value) in (
+        "Union",
+        "Optional",
+    ):
+        members = []  # type: List[ast.expr]
+        for item in _subscript_items(annotation):
+            members.extend(_union_members(item))
+        return members
+    if isinstance(annotation, (ast.Name, ast.Attribute, ast.Subscript)) or _is_none(
+        annotation
+    ):
+        return [annotation]
+    raise CantRewrite("its return annotation is too complicated")
+
+
+def _annotation_edit(
+    source: _Source, annotation: ast.expr, typing_names: Set[str]
+) -> Edit:
+    members = _union_members(annotation)
+    parameters = {}  # type: Dict[str, str]
+    for member in members:
+        if isinstance(member, ast.Subscript) and _final_name(member.value) in (
+            "YieldType",
+            "SendType",
+        ):
+            kind = _final_name(member.value) or ""
+            parameters[kind] = source.inside(*source.brackets(member, "[")).strip()
+        elif not _is_none(member) and _final_name(member) not in _NO_VALUE_NAMES:
+            raise CantRewrite("it's declared to return a value")
+    if parameters:
+        yield_type = parameters.get("YieldType", "None")
+        send_type = parameters.get("SendType", "None")
+    else:
+        yield_type = send_type = "Any"
+        typing_names.add("Any")
+    typing_names.add("AsyncGenerator")
+    return (
+        source.node_start(annotation),
+        source.expression_end(annotation),
+        "AsyncGenerator[{}, {}]".format(yield_type, send_type),
+    )
+
+
+def _function_edits(
+    source: _Source,
+    names: _Names,
+    func: ast.AsyncFunctionDef,
+    decorator: ast.expr,
+    typing_names: Set[str],
+) -> List[Edit]:
+    """Return the edits that turn ``func``, which is decorated with
+    ``@async_generator``, into a native async generator. Raises
+    :exc:`CantRewrite` if it can't be one.
+    """
+    edits = []  # type: List[Edit]
+    yields = 0
+    parents = _body_parents(func)
+    for node, parent in parents.items():
+        if isinstance(node, ast.Call):
+            name = names.resolve(node.func)
+            if name == "yield_from_":
+                raise CantRewrite("it uses yield_from_()")
+            if name != "yield_":
+                continue
+            if not isinstance(parent, ast.Await):
+                raise CantRewrite("it calls yield_() without awaiting it")
+            if (
+                node.keywords
+                or len(node.args) > 1
+                or any(isinstance(arg, ast.Starred) for arg in node.args)
+            ):
+                raise CantRewrite("it calls yield_() with unusual arguments")
+            yields += 1
+            await_expr = parent
+            opening, closing = source.brackets(node, "(")
+            value = source.inside(opening, closing).strip()
+            if "\n" in value:
+                replacement = "yield ({})".format(value)
+            else:
+                replacement = "yield " + value if value else "yield"
+            statement = parents.get(await_expr)
+            if not (
+                isinstance(statement, ast.Expr)
+                or isinstance(statement, (ast.Assign, ast.AugAssign, ast.AnnAssign))
+                and statement.value is await_expr
+            ):
+                replacement = "({})".format(replacement)
+            edits.append(
+                (source.node_start(await_expr), source.token_end(closing), replacement)
+            )
+        elif isinstance(node, ast.Return) and node.value is not None:
+            if not _is_none(node.value):
+                raise CantRewrite("it returns a value")
+            edits.append(
+                (source.node_start(node), source.expression_end(node.value), "return")
+            )
+    if not yields:
+        raise CantRewrite("it never yields")
+
+    if func.returns is not None:
+        edits.append(_annotation_edit(source, func.returns, typing_names))
+
+    line = source.lines[decorator.lineno - 1]
+    start = source.node_start(decorator)
+    if line.strip() != "@" + source.text[start : source.expression_end(decorator)]:
+        raise CantRewrite("its decorator isn't on a line of its own")
+    line_start = source.offset(decorator.lineno, 0)
+    edits.append((line_start, line_start + len(line), ""))
+    return edits
+
+
+def _import_edit(source: _Source, tree: ast.Module, names: List[str]) -> Edit:
+    """Return an edit that imports ``names`` from ``typing``: on the
+    first ``from typing import`` line of the module if it has one, or
+    else on a line of its own before the first statement that isn't the
+    docstring or a ``__future__`` import.
+    """
+    for statement in tree.body:
+        if (
+            isinstance(statement, ast.ImportFrom)
+            and statement.module == "typing"
+            and not statement.level
+            and statement.names[0].name != "*"
+        ):
+            # Add the names after the last one imported, which is the
+            # last name token before the end of the statement (ignoring
+            # any closing parenthesis and trailing comma)
+            index = source.token_at[source.node_start(statement)]
+            last = index
+            token = source.tokens[index]
+            while token.type not in (tokenize.NEWLINE, tokenize.ENDMARKER) and (
+                token.string != ";"
+            ):
+                if token.type == tokenize.NAME:
+                    last = index
+                index += 1
+                token = source.tokens[index]
+            end = source.token_end(last)
+            return (end, end, "".join(", " + name for name in names))
+    for statement in tree.body:
+        if (
+            isinstance(statement, ast.Expr)
+            and isinstance(statement.value, getattr(ast, "Str", ast.expr))
+            or (
+                isinstance(statement, ast.ImportFrom)
+                and statement.module == "__future__"
+            )
+        ):
+            continue
+        line_start = source.offset(statement.lineno, 0)
+        break
+    else:
+        line_start = len(source.text)
+    return (line_start, line_start, "from typing import {}\n".format(", ".join(names)))
+
+
+def rewrite(text: str) -> Tuple[str, List[Tuple[int, str]]]:
+    """Rewrite the ``@async_generator`` functions in the module source
+    ``text`` as native async generators. Returns the new source, and a
+    list of (line number of the ``@async_generator`` decorator, reason)
+    for each function that couldn't be rewritten.
+    """
+    source = _Source(text)
+    tree = ast.parse(text)
+    names = _Names(tree)
+    edits = []  # type: List[Edit]
+    skipped = []  # type: List[Tuple[int, str]]
+    typing_names = set()  # type: Set[str]
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.AsyncFunctionDef):
+            continue
+        for decorator in node.decorator_list:
+            if names.resolve(decorator) == "async_generator":
+                break
+        else:
+            continue
+        function_typing_names = set()  # type: Set[str]
+        try:
+            edits.extend(
+                _function_edits(source, names, node, decorator, function_typing_names)
+            )
+        except CantRewrite as ex:
+            skipped.append(
+                (
+                    decorator.lineno,
+                    "can't rewrite {}() because {}".format(node.name, ex),
+                )
+            )
+        else:
+            typing_names |= function_typing_names
+    missing = sorted(typing_names - names.bound)
+    if missing:
+        edits.append(_import_edit(source, tree, missing))
+
+    # Apply the edits from the end, so the offsets of the rest stay valid
+    for start, end, replacement in sorted(edits, reverse=True):
+        text = text[:start] + replacement + text[end:]
+    skipped.sort()
+    return text, skipped
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m trio_typing.native_agen",
+        description=__doc__.split("\n\n")[0].replace("``", ""),
+    )
+    parser.add_argument("files", nargs="+", metavar="FILE")
+    parser.add_argument(
+        "--diff",
+        action="store_true",
+        help="print the changes as a diff instead of changing the files",
+    )
+    args = parser.parse_args(argv)
+
+    for path in args.files:
+        with tokenize.open(path) as file:
+            encoding = file.encoding
+            original = file.read()
+        try:
+            rewritten, skipped = rewrite(original)
+        except SyntaxError as ex:
+            print("{}: {}".format(path, ex), file=sys.stderr)
+            return 1
+        for lineno, reason in skipped:
+            print("{}:{}: {}".format(path, lineno, reason), file=sys.stderr)
+        if rewritten == original:
+            continue
+        if args.diff:
+            sys.stdout.writelines(
+                difflib.unified_diff(
+                    original.splitlines(True), rewritten.splitlines(True), path, path
+                )
+            )
+        else:
+            with open(path, "w", encoding=encoding, newline="") as file:
+                file.write(rewritten)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
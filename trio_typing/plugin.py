@@ -1,18 +1,82 @@
+import atexit
+import configparser
+import hashlib
+import heapq
+import importlib
+import json
+import math
+import os
 import sys
-from typing import Callable, List, Optional, Tuple, cast
-from typing_extensions import Literal
+import time
+import types
+import warnings
+from functools import lru_cache, partial
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    TypeVar,
+    Union,
+    cast,
+)
+from typing_extensions import Final, Literal
 from typing import Type as typing_Type
 from mypy.plugin import Plugin, FunctionContext, MethodContext, CheckerPluginInterface
+from mypy.build import PRI_MED
 from mypy.nodes import (
+    ARG_NAMED,
+    ARG_NAMED_OPT,
+    ARG_OPT,
     ARG_POS,
     ARG_STAR,
+    ARG_STAR2,
     TypeInfo,
+    Block,
+    ClassDef,
+    CallExpr,
+    DictionaryComprehension,
+    EllipsisExpr,
+    FUNC_NO_INFO,
+    ExpressionStmt,
+    GeneratorExpr,
     Context,
+    Decorator,
     FuncDef,
     StrExpr,
     IntExpr,
+    FloatExpr,
+    IndexExpr,
     Expression,
+    AwaitExpr,
+    ForStmt,
+    FuncItem,
+    Node,
+    Statement,
+    WhileStmt,
+    WithStmt,
+    YieldExpr,
+    LambdaExpr,
+    MypyFile,
+    NameExpr,
+    PassStmt,
+    RaiseStmt,
+    ReturnStmt,
+    Import,
+    ImportFrom,
+    ImportAll,
+    TempNode,
+    RefExpr,
+    Var,
 )
+from mypy.options import Options
+from mypy.plugins.default import DefaultPlugin
+from mypy.scope import Scope
 from mypy.types import (
     Type,
     CallableType,
@@ -21,44 +85,960 @@ from mypy.types import (
     TypeVarDef,
     TypeVarType,
     Instance,
+    LiteralType,
     UnionType,
     UninhabitedType,
     AnyType,
     TypeOfAny,
 )
 from mypy.checker import TypeChecker
+from mypy.erasetype import erase_typevars
+from mypy.expandtype import expand_type_by_instance
+from mypy.maptype import map_instance_to_supertype
+from mypy.subtypes import is_subtype
+from ._traverser import NodeTraverser
+from ._version import __version__ as trio_typing_version
+
+
+class _PluginModule(types.ModuleType):
+    """The class of this module, whose ``__version__`` mypy records,
+    along with a hash of this file, to decide whether results cached by
+    an earlier run are still valid.
+
+    Older mypy versions (without ``Plugin.report_config_data()``) have
+    no other way to learn that our settings affect those results, so
+    the version includes a digest of the settings of the plugin that
+    was constructed most recently: mypy reads it right after
+    constructing each plugin.
+    """
+
+    @property
+    def __version__(self) -> str:
+        return _latest_cache_version or trio_typing_version
+
+
+# The cache_version of the most recently constructed TrioPlugin, when
+# mypy needs it for __version__
+_latest_cache_version = None  # type: Optional[str]
+
+sys.modules[__name__].__class__ = _PluginModule
+
+# Name of the section in the mypy config file that holds our settings
+CONFIG_SECTION = "trio-typing"  # type: Final
+
+# Environment variable that enables profiling of the plugin's hooks,
+# overriding the ``profile`` setting in the config file
+PROFILE_ENV_VAR = "TRIO_TYPING_PROFILE"  # type: Final
+
+_IN_WORKER_THREAD = "trio.run_sync_in_worker_thread"  # type: Final
+
+# Functions and methods that block the whole Trio scheduler if they're
+# called from an async function, mapped to what to use instead; checked
+# if warn_blocking_calls is enabled
+DEFAULT_BLOCKING_CALLS = {
+    "time.sleep": "trio.sleep",
+    "builtins.open": "trio.open_file",
+    "io.open": "trio.open_file",
+    "pathlib.Path.open": "trio.Path",
+    "pathlib.Path.read_bytes": "trio.Path",
+    "pathlib.Path.read_text": "trio.Path",
+    "pathlib.Path.write_bytes": "trio.Path",
+    "pathlib.Path.write_text": "trio.Path",
+    "os.system": "trio.Process",
+    "subprocess.call": "trio.Process",
+    "subprocess.check_call": "trio.Process",
+    "subprocess.check_output": "trio.Process",
+    "subprocess.run": "trio.Process",
+    "subprocess.Popen.communicate": "trio.Process",
+    "subprocess.Popen.wait": "trio.Process",
+    "socket.create_connection": "trio.socket",
+    "socket.getaddrinfo": "trio.socket.getaddrinfo",
+    "socket.socket.accept": "trio.socket",
+    "socket.socket.connect": "trio.socket",
+    "socket.socket.recv": "trio.socket",
+    "socket.socket.recv_into": "trio.socket",
+    "socket.socket.recvfrom": "trio.socket",
+    "socket.socket.recvfrom_into": "trio.socket",
+    "socket.socket.send": "trio.socket",
+    "socket.socket.sendall": "trio.socket",
+    "socket.socket.sendto": "trio.socket",
+    "urllib.request.urlopen": _IN_WORKER_THREAD,
+    "requests.request": _IN_WORKER_THREAD,
+    "requests.get": _IN_WORKER_THREAD,
+    "requests.options": _IN_WORKER_THREAD,
+    "requests.head": _IN_WORKER_THREAD,
+    "requests.post": _IN_WORKER_THREAD,
+    "requests.put": _IN_WORKER_THREAD,
+    "requests.patch": _IN_WORKER_THREAD,
+    "requests.delete": _IN_WORKER_THREAD,
+    "requests.api.request": _IN_WORKER_THREAD,
+    "requests.api.get": _IN_WORKER_THREAD,
+    "requests.api.options": _IN_WORKER_THREAD,
+    "requests.api.head": _IN_WORKER_THREAD,
+    "requests.api.post": _IN_WORKER_THREAD,
+    "requests.api.put": _IN_WORKER_THREAD,
+    "requests.api.patch": _IN_WORKER_THREAD,
+    "requests.api.delete": _IN_WORKER_THREAD,
+    "requests.sessions.Session.request": _IN_WORKER_THREAD,
+    "requests.sessions.Session.get": _IN_WORKER_THREAD,
+    "requests.sessions.Session.options": _IN_WORKER_THREAD,
+    "requests.sessions.Session.head": _IN_WORKER_THREAD,
+    "requests.sessions.Session.post": _IN_WORKER_THREAD,
+    "requests.sessions.Session.put": _IN_WORKER_THREAD,
+    "requests.sessions.Session.patch": _IN_WORKER_THREAD,
+    "requests.sessions.Session.delete": _IN_WORKER_THREAD,
+    "requests.sessions.Session.send": _IN_WORKER_THREAD,
+}  # type: Final
+
+
+def parse_blocking_calls(value: str) -> Dict[str, str]:
+    """Parse a ``blocking_calls`` setting: one fully qualified name per
+    line, optionally followed by a colon and what to use instead.
+    """
+    calls = {}  # type: Dict[str, str]
+    for line in value.splitlines():
+        name, _, replacement = line.partition(":")
+        if name.strip():
+            calls[name.strip()] = replacement.strip() or _IN_WORKER_THREAD
+    return calls
+
+
+class PluginConfig:
+    """Settings for the optional parts of the plugin, read from the
+    ``[trio-typing]`` section of the mypy config file.
+    """
+
+    def __init__(self) -> None:
+        # Check each call to a @takes_callable_and_args function against
+        # a signature built for exactly the number of arguments passed,
+        # rather than against a fixed set of overloads
+        self.exact_arity = False
+        # Time each of the plugin's hooks, and write a report to this
+        # path (or to stderr if it's "-") when mypy exits
+        self.profile = None  # type: Optional[str]
+        # Report calls to these functions and methods from inside async
+        # functions
+        self.warn_blocking_calls = False
+        self.blocking_calls = dict(DEFAULT_BLOCKING_CALLS)
+        # Report loops in async functions that can go around without
+        # reaching a checkpoint
+        self.warn_loops_without_checkpoints = False
+        # Report async functions that never await anything
+        self.warn_async_without_await = False
+        # Report @async_generator functions that could be native async
+        # generators instead
+        self.warn_convertible_async_generators = False
+        # Report memory channels and queues that can grow without limit,
+        # except in these modules
+        self.warn_unbounded_buffers = False
+        self.allowed_unbounded_buffer_modules = []  # type: List[str]
+        # Record each call that spawns a task, and write them to this
+        # path as a JSON graph when mypy exits
+        self.spawn_graph = None  # type: Optional[str]
+
+    @classmethod
+    def from_config_file(cls, config_file: Optional[str]) -> "PluginConfig":
+        config = cls()
+        config.profile = os.environ.get(PROFILE_ENV_VAR) or None
+        if config_file is None:
+            return config
+        parser = configparser.ConfigParser()
+        try:
+            parser.read(config_file)
+        except configparser.Error:
+            # mypy will complain about the file itself
+            return config
+        if not parser.has_section(CONFIG_SECTION):
+            return config
+        section = parser[CONFIG_SECTION]
+        config.exact_arity = section.getboolean("exact_arity", fallback=False)
+        config.warn_blocking_calls = section.getboolean(
+            "warn_blocking_calls", fallback=False
+        )
+        config.blocking_calls.update(
+            parse_blocking_calls(section.get("blocking_calls", fallback=""))
+        )
+        for name in section.get("allowed_blocking_calls", fallback="").split():
+            config.blocking_calls.pop(name, None)
+        config.warn_loops_without_checkpoints = section.getboolean(
+            "warn_loops_without_checkpoints", fallback=False
+        )
+        config.warn_async_without_await = section.getboolean(
+            "warn_async_without_await", fallback=False
+        )
+        config.warn_convertible_async_generators = section.getboolean(
+            "warn_convertible_async_generators", fallback=False
+        )
+        config.warn_unbounded_buffers = section.getboolean(
+            "warn_unbounded_buffers", fallback=False
+        )
+        config.allowed_unbounded_buffer_modules = section.get(
+            "allowed_unbounded_buffer_modules", fallback=""
+        ).split()
+        if config.profile is None:
+            config.profile = section.get("profile", fallback=None)
+        config.spawn_graph = section.get("spawn_graph", fallback=None)
+        return config
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Return the settings that can change the plugin's results
+        (which excludes ``profile``), for use in invalidating mypy's
+        cache.
+        """
+        return {
+            "exact_arity": self.exact_arity,
+            "warn_blocking_calls": self.warn_blocking_calls,
+            "blocking_calls": self.blocking_calls,
+            "warn_loops_without_checkpoints": self.warn_loops_without_checkpoints,
+            "warn_async_without_await": self.warn_async_without_await,
+            "warn_convertible_async_generators": (
+                self.warn_convertible_async_generators
+            ),
+            "warn_unbounded_buffers": self.warn_unbounded_buffers,
+            "allowed_unbounded_buffer_modules": self.allowed_unbounded_buffer_modules,
+            "spawn_graph": self.spawn_graph,
+        }
+
+
+def config_digest(config_data: Dict[str, Any]) -> str:
+    encoded = json.dumps(config_data, sort_keys=True).encode("utf-8")
+    return hashlib.sha1(encoded).hexdigest()[:12]
+
+
+HookContext = TypeVar("HookContext", FunctionContext, MethodContext)
+
+
+class HookStats:
+    """Timings for one of the plugin's callbacks, collected by
+    :class:`HookProfiler`.
+    """
+
+    def __init__(self, name: str, num_slowest: int) -> None:
+        self.name = name
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.num_slowest = num_slowest
+        # min-heap of (seconds, "path:line") for the slowest calls
+        self.slowest = []  # type: List[Tuple[float, str]]
+
+    def record(self, elapsed: float, site: str) -> None:
+        self.calls += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+        if len(self.slowest) < self.num_slowest:
+            heapq.heappush(self.slowest, (elapsed, site))
+        elif elapsed > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (elapsed, site))
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "calls": self.calls,
+            "total_seconds": self.total,
+            "max_seconds": self.max,
+            "slowest": [
+                {"seconds": elapsed, "site": site}
+                for elapsed, site in sorted(self.slowest, reverse=True)
+            ],
+        }
+
+
+class HookProfiler:
+    """Time every callback that the plugin hands to mypy, and the hook
+    lookups themselves, and write a report when mypy exits.
+
+    The report is JSON if ``output`` ends in ``.json``, and a text
+    table otherwise; an ``output`` of ``-`` writes the table to stderr.
+    """
+
+    def __init__(self, output: str, num_slowest: int = 5) -> None:
+        self.output = output
+        self.num_slowest = num_slowest
+        self.stats = {}  # type: Dict[str, HookStats]
+        atexit.register(self.write_report)
+
+    def _stats_for(self, name: str) -> HookStats:
+        try:
+            return self.stats[name]
+        except KeyError:
+            stats = self.stats[name] = HookStats(name, self.num_slowest)
+            return stats
+
+    def time_lookup(
+        self,
+        name: str,
+        lookup: Callable[[str], Optional[Callable[[HookContext], Type]]],
+        fullname: str,
+    ) -> Optional[Callable[[HookContext], Type]]:
+        """Call ``lookup(fullname)``, a hook lookup like
+        ``get_function_hook``, recording the time it took under ``name``;
+        if it returns a callback, return a profiled version of it.
+        """
+        start = time.perf_counter()
+        callback = lookup(fullname)
+        self._stats_for(name).record(time.perf_counter() - start, fullname)
+        if callback is None:
+            return None
+        return self.wrap(callback)
+
+    def wrap(
+        self, callback: Callable[[HookContext], Type]
+    ) -> Callable[[HookContext], Type]:
+        inner = getattr(callback, "func", callback)  # unwrap partial()
+        stats = self._stats_for(getattr(inner, "__name__", repr(inner)))
+
+        def profiled_callback(ctx: HookContext) -> Type:
+            start = time.perf_counter()
+            try:
+                return callback(ctx)
+            finally:
+                elapsed = time.perf_counter() - start
+                path = getattr(ctx.api, "path", "<unknown>")
+                stats.record(elapsed, "{}:{}".format(path, ctx.context.line))
+
+        return profiled_callback
+
+    def report(self) -> List[Dict[str, Any]]:
+        """Return the statistics for every hook, most expensive first."""
+        return [
+            stats.as_dict()
+            for stats in sorted(
+                self.stats.values(), key=lambda stats: stats.total, reverse=True
+            )
+        ]
+
+    def format_report(self) -> str:
+        lines = [
+            "{:<44} {:>8} {:>11} {:>10} {:>10}".format(
+                "trio_typing.plugin hook",
+                "calls",
+                "total (ms)",
+                "mean (us)",
+                "max (us)",
+            )
+        ]
+        for entry in self.report():
+            lines.append(
+                "{:<44} {:>8} {:>11.2f} {:>10.1f} {:>10.1f}".format(
+                    entry["name"],
+                    entry["calls"],
+                    entry["total_seconds"] * 1e3,
+                    entry["total_seconds"] * 1e6 / max(entry["calls"], 1),
+                    entry["max_seconds"] * 1e6,
+                )
+            )
+            for slow in entry["slowest"]:
+                lines.append(
+                    "    {:>8.1f} us  {}".format(slow["seconds"] * 1e6, slow["site"])
+                )
+        return "\n".join(lines) + "\n"
+
+    def write_report(self) -> None:
+        if self.output == "-":
+            sys.stderr.write(self.format_report())
+        elif self.output.endswith(".json"):
+            with open(self.output, "w") as file:
+                json.dump({"hooks": self.report()}, file, indent=2)
+                file.write("\n")
+        else:
+            with open(self.output, "w") as file:
+                file.write(self.format_report())
+
+
+# Functions and methods that spawn a task to run the callable they're
+# passed as their first argument; recorded if spawn_graph is set
+SPAWN_FUNCTIONS = (
+    "trio.run",
+    "trio.hazmat.spawn_system_task",
+    "trio.BlockingTrioPortal.run",
+    "trio_typing.Nursery.start_soon",
+    "trio_typing.Nursery.start",
+)  # type: Final
+
+
+class LoopCallFinder(NodeTraverser):
+    """Find the calls in a function body (or module) that can run more
+    than once because they're inside a loop or comprehension. Nested
+    functions and lambdas are skipped.
+    """
+
+    def __init__(self) -> None:
+        self.calls = set()  # type: Set[CallExpr]
+        self.loop_depth = 0
+
+    def in_loop(self, parts: List[Node]) -> None:
+        self.loop_depth += 1
+        for part in parts:
+            self.accept(part)
+        self.loop_depth -= 1
+
+    def visit_while_stmt(self, stmt: WhileStmt) -> None:
+        self.in_loop([stmt.expr, stmt.body])
+        if stmt.else_body is not None:
+            self.accept(stmt.else_body)
+
+    def visit_for_stmt(self, stmt: ForStmt) -> None:
+        self.accept(stmt.expr)
+        self.in_loop([stmt.index, stmt.body])
+        if stmt.else_body is not None:
+            self.accept(stmt.else_body)
+
+    def visit_generator_expr(self, expr: GeneratorExpr) -> None:
+        # (the first iterable is evaluated once, before the loop starts)
+        self.accept(expr.sequences[0])
+        parts = [expr.left_expr]  # type: List[Node]
+        parts.extend(expr.indices)
+        parts.extend(expr.sequences[1:])
+        parts.extend(cond for conds in expr.condlists for cond in conds)
+        self.in_loop(parts)
+
+    def visit_dictionary_comprehension(self, expr: DictionaryComprehension) -> None:
+        self.accept(expr.sequences[0])
+        parts = [expr.key, expr.value]  # type: List[Node]
+        parts.extend(expr.indices)
+        parts.extend(expr.sequences[1:])
+        parts.extend(cond for conds in expr.condlists for cond in conds)
+        self.in_loop(parts)
+
+    def visit_call_expr(self, expr: CallExpr) -> None:
+        if self.loop_depth:
+            self.calls.add(expr)
+        super().visit_call_expr(expr)
+
+    def visit_func_def(self, defn: FuncDef) -> None:
+        pass
+
+    def visit_lambda_expr(self, expr: LambdaExpr) -> None:
+        pass
+
+
+@lru_cache(maxsize=64)
+def calls_in_loops(body: Node) -> FrozenSet[CallExpr]:
+    finder = LoopCallFinder()
+    finder.accept(body)
+    return frozenset(finder.calls)
+
+
+def spawned_function(expr: Expression, checker: TypeChecker) -> Optional[str]:
+    """Return the fully qualified name of the function that the
+    callable argument ``expr`` of a spawning call refers to, looking
+    through ``functools.partial()``, or None if we can't tell.
+    """
+    if (
+        isinstance(expr, CallExpr)
+        and isinstance(expr.callee, RefExpr)
+        and expr.callee.fullname == "functools.partial"
+        and expr.args
+    ):
+        expr = expr.args[0]
+    typ = checker.type_map.get(expr)
+    if isinstance(typ, CallableType) and isinstance(typ.definition, FuncItem):
+        # (this also works for bound methods, whose MemberExprs don't
+        # have a fullname)
+        return typ.definition.fullname() or typ.definition.name()
+    if isinstance(expr, RefExpr) and expr.fullname:
+        return expr.fullname
+    return None
+
+
+class SpawnGraph:
+    """Record the calls that spawn tasks (to the functions and methods
+    in SPAWN_FUNCTIONS) in the modules that mypy checks, and write them
+    to ``output`` as JSON when mypy exits.
+
+    Each edge of the graph goes from the function containing a call
+    (or the module, for calls at module level) to the function that the
+    call spawns, and says where the call is and whether it's in a loop.
+    """
+
+    def __init__(self, output: str) -> None:
+        self.output = output
+        # (path, line, column) -> edge; mypy can run a hook more than
+        # once for the same call
+        self.edges = {}  # type: Dict[Tuple[str, int, int], Dict[str, Any]]
+        atexit.register(self.write)
+
+    def wrap(
+        self, spawner: str, hook: Optional[Callable[[HookContext], Type]]
+    ) -> Callable[[Any], Type]:
+        return partial(self.record, spawner, hook)
+
+    def record(
+        self,
+        spawner: str,
+        hook: Optional[Callable[[HookContext], Type]],
+        ctx: HookContext,
+    ) -> Type:
+        checker = cast(TypeChecker, ctx.api)
+        if ctx.args and ctx.args[0]:
+            func = checker.scope.top_non_lambda_function()
+            if isinstance(func, FuncDef):
+                caller = func.fullname() or func.name()
+                body = func.body  # type: Node
+            else:
+                caller = checker.tree.fullname()
+                body = checker.tree
+            site = (checker.path, ctx.context.line, ctx.context.column)
+            self.edges[site] = {
+                "caller": caller,
+                "target": spawned_function(ctx.args[0][0], checker),
+                "spawner": spawner,
+                "path": site[0],
+                "line": site[1],
+                "column": site[2],
+                "in_loop": ctx.context in calls_in_loops(body),
+            }
+        if hook is not None:
+            return hook(ctx)
+        return ctx.default_return_type
+
+    def as_dict(self) -> Dict[str, Any]:
+        edges = [self.edges[site] for site in sorted(self.edges)]
+        nodes = {edge["caller"] for edge in edges}
+        nodes.update(edge["target"] for edge in edges if edge["target"] is not None)
+        return {"nodes": sorted(nodes), "edges": edges}
+
+    def write(self) -> None:
+        with open(self.output, "w") as file:
+            json.dump(self.as_dict(), file, indent=2)
+            file.write("\n")
+
+
+FunctionHook = Callable[[FunctionContext], Type]
+MethodHook = Callable[[MethodContext], Type]
+# Either kind of hook
+AnyHook = Callable[[Any], Type]
+
+# Entry point group for other packages to add hooks to the registry
+HOOKS_ENTRY_POINT_GROUP = "trio_typing.plugin_hooks"  # type: Final
+
+
+class HookRegistry:
+    """The hooks that :class:`TrioPlugin` provides, keyed by the fully
+    qualified name of the function or method they apply to.
+
+    Libraries in the Trio ecosystem can add their own hooks here,
+    instead of shipping a separate mypy plugin (which mypy would have
+    to consult for every name it looks up), by declaring an entry point
+    in the ``trio_typing.plugin_hooks`` group. The entry point should
+    refer to a function that takes the registry as its only argument::
+
+        # setup.py
+        entry_points={
+            "trio_typing.plugin_hooks": ["mylib = mylib._mypy:register_hooks"]
+        }
+
+        # mylib/_mypy.py
+        def register_hooks(registry: trio_typing.plugin.HookRegistry) -> None:
+            registry.add_function_hook("mylib.open_thing", open_thing_callback)
+    """
+
+    def __init__(self) -> None:
+        self.function_hooks = {}  # type: Dict[str, FunctionHook]
+        self.method_hooks = {}  # type: Dict[str, MethodHook]
+
+    def add_function_hook(self, fullname: str, hook: FunctionHook) -> None:
+        """Use ``hook`` as the ``get_function_hook()`` callback for calls
+        to the function, or instantiations of the class, named ``fullname``.
+        """
+        self.function_hooks[fullname] = hook
+
+    def add_method_hook(self, fullname: str, hook: MethodHook) -> None:
+        """Use ``hook`` as the ``get_method_hook()`` callback for calls to
+        the method named ``fullname`` (``"module.Class.method"``).
+        """
+        self.method_hooks[fullname] = hook
+
+
+def builtin_hooks(config: PluginConfig) -> HookRegistry:
+    """Return a registry containing the hooks that this module provides,
+    as configured by ``config``.
+    """
+    registry = HookRegistry()
+    registry.add_function_hook(
+        "contextlib.asynccontextmanager", args_invariant_decorator_callback
+    )
+    registry.add_function_hook(
+        "async_generator.asynccontextmanager", args_invariant_decorator_callback
+    )
+    registry.add_function_hook("trio.open_file", open_file_callback)
+    registry.add_function_hook("trio.wrap_file", wrap_file_callback)
+    registry.add_function_hook(
+        "trio_typing.takes_callable_and_args",
+        takes_callable_and_args_lenient_callback
+        if config.exact_arity
+        else takes_callable_and_args_callback,
+    )
+    registry.add_function_hook(
+        "async_generator.async_generator",
+        convertible_async_generator_callback
+        if config.warn_convertible_async_generators
+        else async_generator_callback,
+    )
+    registry.add_function_hook("trio_typing.blocking", blocking_decorator_callback)
+    registry.add_function_hook("async_generator.yield_", yield_callback)
+    registry.add_function_hook("async_generator.yield_from_", yield_from_callback)
+    registry.add_method_hook("trio_typing.TaskStatus.started", started_callback)
+    registry.add_method_hook("trio.Path.open", open_method_callback)
+    if config.warn_unbounded_buffers:
+        for fullname in UNBOUNDED_BUFFER_CLASSES:
+            registry.add_function_hook(
+                fullname,
+                partial(
+                    unbounded_buffer_callback,
+                    fullname,
+                    config.allowed_unbounded_buffer_modules,
+                ),
+            )
+    return registry
+
+
+_hook_providers = None  # type: Optional[List[Callable[[HookRegistry], None]]]
+
+
+def registered_hook_providers() -> List[Callable[[HookRegistry], None]]:
+    """Return the functions registered under the ``trio_typing.plugin_hooks``
+    entry point group. These are loaded once per process.
+    """
+    global _hook_providers
+    if _hook_providers is None:
+        try:
+            metadata = importlib.import_module("importlib.metadata")  # type: Any
+        except ImportError:  # Python < 3.8
+            import pkg_resources
+
+            entry_points = list(
+                pkg_resources.iter_entry_points(HOOKS_ENTRY_POINT_GROUP)
+            )  # type: List[Any]
+        else:
+            all_entry_points = metadata.entry_points()
+            if hasattr(all_entry_points, "select"):
+                entry_points = list(
+                    all_entry_points.select(group=HOOKS_ENTRY_POINT_GROUP)
+                )
+            else:  # Python < 3.10
+                entry_points = list(all_entry_points.get(HOOKS_ENTRY_POINT_GROUP, []))
+        _hook_providers = [entry_point.load() for entry_point in entry_points]
+    return _hook_providers
+
+
+# Modules that import any of these packages get a dependency on
+# trio_typing, since the types our hooks construct live there
+HOOKED_PACKAGES = ("trio", "async_generator")  # type: Final
+
+
+def imported_modules(file: MypyFile) -> List[str]:
+    modules = []  # type: List[str]
+    for imp in file.imports:
+        if isinstance(imp, Import):
+            modules.extend(module for module, _ in imp.ids)
+        elif isinstance(imp, (ImportFrom, ImportAll)):
+            modules.append(imp.id)
+    return modules
 
 
 class TrioPlugin(Plugin):
+    def __init__(self, options: Options) -> None:
+        super().__init__(options)
+        self.config = PluginConfig.from_config_file(options.config_file)
+        self.registry = builtin_hooks(self.config)
+        providers = registered_hook_providers()
+        for register in providers:
+            register(self.registry)
+        # Everything that affects our results, besides the code in this file
+        self.config_data = {
+            "version": trio_typing_version,
+            "settings": self.config.as_dict(),
+            "hook_providers": sorted(
+                "{}.{}".format(register.__module__, register.__qualname__)
+                for register in providers
+            ),
+        }  # type: Dict[str, Any]
+        if self.config.spawn_graph:
+            # mypy doesn't run our hooks for modules whose results it
+            # takes from its cache, so their calls would be missing from
+            # the graph; a value that's different every run makes it
+            # check everything. That includes typeshed, which makes every
+            # run as slow as a cold one, but mypy < 0.740 has no way to
+            # invalidate only some modules (see the README)
+            self.config_data["spawn_graph_run"] = os.urandom(8).hex()
+        self.cache_version = "{} config={}".format(
+            trio_typing_version, config_digest(self.config_data)
+        )
+        if not hasattr(Plugin, "report_config_data"):
+            global _latest_cache_version
+            _latest_cache_version = self.cache_version
+        # For each @takes_callable_and_args function or method, the
+        # decorated type that we last saw (which changes if the mypy
+        # daemon reprocesses it) and its definition
+        self._callable_and_args_functions = {}  # type: Dict[str, Tuple[Type, FuncDef]]
+        # Names that lookup_decorated() found weren't decorated functions
+        self._undecorated = set()  # type: Set[str]
+        # The plugins that mypy asks for hooks after this one, and the
+        # hooks they have, for the hooks of ours that only look at calls
+        self._later_plugins = None  # type: Optional[List[Plugin]]
+        self._later_hooks = {}  # type: Dict[Tuple[str, str], Optional[AnyHook]]
+        self.profiler = None  # type: Optional[HookProfiler]
+        if self.config.profile:
+            self.profiler = HookProfiler(self.config.profile)
+        checks = []  # type: List[Callable[[TypeChecker, FuncDef], None]]
+        if self.config.warn_loops_without_checkpoints:
+            checks.append(check_loops)
+        if self.config.warn_async_without_await:
+            checks.append(check_async_without_await)
+        if self.config.warn_unbounded_buffers:
+            checks.append(
+                partial(
+                    check_subscripted_buffer_calls,
+                    self.config.allowed_unbounded_buffer_modules,
+                )
+            )
+        self.module_checker = None  # type: Optional[ModuleChecker]
+        if checks:
+            self.module_checker = ModuleChecker(checks)
+        self.spawn_graph = None  # type: Optional[SpawnGraph]
+        if self.config.spawn_graph:
+            self.spawn_graph = SpawnGraph(self.config.spawn_graph)
+
+    def report_config_data(self, ctx: Any) -> Any:
+        """Tell mypy (in versions that ask) what, besides this file,
+        its cached results depend on.
+        """
+        return self.config_data
+
+    def get_additional_deps(self, file: MypyFile) -> List[Tuple[int, str, int]]:
+        """Make sure trio_typing is part of the build, and a dependency,
+        for every module that uses a package we have hooks for (in mypy
+        versions that ask).
+        """
+        for module in imported_modules(file):
+            if module.partition(".")[0] in HOOKED_PACKAGES:
+                return [(PRI_MED, "trio_typing", -1)]
+        return []
+
     def get_function_hook(
         self, fullname: str
     ) -> Optional[Callable[[FunctionContext], Type]]:
-        if fullname in (
-            "contextlib.asynccontextmanager",
-            "async_generator.asynccontextmanager",
-        ):
-            return args_invariant_decorator_callback
-        if fullname == "trio.open_file":
-            return open_file_callback
-        if fullname == "trio_typing.takes_callable_and_args":
-            return takes_callable_and_args_callback
-        if fullname == "async_generator.async_generator":
-            return async_generator_callback
-        if fullname == "async_generator.yield_":
-            return yield_callback
-        if fullname == "async_generator.yield_from_":
-            return yield_from_callback
-        return None
+        if self.profiler is not None:
+            return self.profiler.time_lookup(
+                "get_function_hook", self.find_function_hook, fullname
+            )
+        return self.find_function_hook(fullname)
 
     def get_method_hook(
         self, fullname: str
     ) -> Optional[Callable[[MethodContext], Type]]:
-        if fullname == "trio_typing.TaskStatus.started":
-            return started_callback
-        if fullname == "trio.Path.open":
-            return open_method_callback
+        if self.profiler is not None:
+            return self.profiler.time_lookup(
+                "get_method_hook", self.find_method_hook, fullname
+            )
+        return self.find_method_hook(fullname)
+
+    def find_function_hook(
+        self, fullname: str
+    ) -> Optional[Callable[[FunctionContext], Type]]:
+        if fullname in MARKING_DECORATORS:
+            # mypy is checking a function with one of these decorators,
+            # which the mypy daemon might be rechecking because it was
+            # just added, so forget which functions weren't decorated
+            self._undecorated.clear()
+        hook = self.registry.function_hooks.get(fullname)
+        if hook is None:
+            node = self.lookup_decorated(fullname)
+            defn = self.callable_and_args_definition(fullname, node)
+            if defn is not None:
+                hook = partial(
+                    exact_arity_function_callback
+                    if self.config.exact_arity
+                    else callable_and_args_function_callback,
+                    defn,
+                )
+            else:
+                hook = self.blocking_call_hook("function", fullname, node)
+        if self.module_checker is not None:
+            if hook is not None:
+                hook = self.module_checker.wrap(hook)
+            else:
+                hook = self.observer(
+                    "function", fullname, self.module_checker.check_module
+                )
+        if self.spawn_graph is not None and fullname in SPAWN_FUNCTIONS:
+            hook = self.spawn_graph.wrap(fullname, hook)
+        return hook
+
+    def find_method_hook(
+        self, fullname: str
+    ) -> Optional[Callable[[MethodContext], Type]]:
+        hook = self.registry.method_hooks.get(fullname)
+        if hook is None:
+            node = self.lookup_decorated(fullname)
+            defn = self.callable_and_args_definition(fullname, node)
+            if defn is not None:
+                hook = partial(
+                    exact_arity_method_callback
+                    if self.config.exact_arity
+                    else callable_and_args_method_callback,
+                    defn,
+                )
+            else:
+                hook = self.blocking_call_hook("method", fullname, node)
+        if self.module_checker is not None:
+            if hook is not None:
+                hook = self.module_checker.wrap(hook)
+            else:
+                hook = self.observer(
+                    "method", fullname, self.module_checker.check_module
+                )
+        if self.spawn_graph is not None and fullname in SPAWN_FUNCTIONS:
+            hook = self.spawn_graph.wrap(fullname, hook)
+        return hook
+
+    def blocking_call_hook(
+        self, kind: str, fullname: str, node: Optional[Decorator]
+    ) -> Optional[AnyHook]:
+        """Return a hook that reports calls to the function or method
+        (``kind``) named ``fullname``, whose node is ``node`` if it's
+        decorated, from async functions, if it blocks; or None if it
+        doesn't.
+        """
+        replacement = None  # type: Optional[str]
+        if node is not None and is_marked_blocking(node):
+            replacement = _IN_WORKER_THREAD
+        elif self.config.warn_blocking_calls:
+            replacement = self.config.blocking_calls.get(fullname)
+        if replacement is None:
+            return None
+        return self.observer(
+            kind, fullname, partial(check_blocking_call, fullname, replacement)
+        )
+
+    def observer(
+        self, kind: str, fullname: str, observe: Callable[[HookContext], None]
+    ) -> AnyHook:
+        """Return a hook for calls to the function or method (``kind``)
+        named ``fullname`` that passes each call to ``observe``, then
+        returns whatever the hook that a later plugin (like mypy's
+        default one) has for ``fullname`` would. That way, looking at a
+        call doesn't stop it from being handled as it would be without us.
+        """
+        return partial(self.observe_call, kind, fullname, observe)
+
+    def observe_call(
+        self,
+        kind: str,
+        fullname: str,
+        observe: Callable[[HookContext], None],
+        ctx: HookContext,
+    ) -> Type:
+        observe(ctx)
+        hook = self.later_hook(kind, fullname, ctx.api)
+        if hook is not None:
+            return hook(ctx)
+        return ctx.default_return_type
+
+    def later_hook(
+        self, kind: str, fullname: str, api: CheckerPluginInterface
+    ) -> Optional[AnyHook]:
+        """Return the hook for the function or method (``kind``) named
+        ``fullname`` that mypy would use if we didn't have one.
+        """
+        key = (kind, fullname)
+        if key in self._later_hooks:
+            return self._later_hooks[key]
+        if self._later_plugins is None:
+            self._later_plugins = self.find_later_plugins(api)
+        hook = None  # type: Optional[AnyHook]
+        for plugin in self._later_plugins:
+            if kind == "function":
+                hook = plugin.get_function_hook(fullname)
+            else:
+                hook = plugin.get_method_hook(fullname)
+            if hook is not None:
+                break
+        self._later_hooks[key] = hook
+        return hook
+
+    def find_later_plugins(self, api: CheckerPluginInterface) -> List[Plugin]:
+        """Return the plugins that mypy asks for hooks after us.
+
+        mypy asks each plugin in turn, ending with its default plugin,
+        and uses the first hook it gets. The plugins are in the private
+        ``_plugins`` attribute of the ``ChainedPlugin`` that ``api``
+        checks with, in every mypy release we support; compiled releases
+        wrap plugins like us in a ``WrapperPlugin`` whose ``plugin`` is
+        us. If we can't find ourselves there, we warn and use mypy's
+        default plugin on its own, which leaves out the hooks of any
+        plugins listed after us.
+        """
+        chained = getattr(api, "plugin", None)
+        plugins = getattr(chained, "_plugins", None)
+        if isinstance(plugins, list):
+            for index, plugin in enumerate(plugins):
+                if plugin is self or getattr(plugin, "plugin", None) is self:
+                    return plugins[index + 1 :]
+        warnings.warn(
+            "trio_typing can't find the mypy plugins configured after it "
+            "(in {!r}); calls it observes will only get mypy's default "
+            "plugin's hooks".format(chained),
+            RuntimeWarning,
+        )
+        return [DefaultPlugin(self.options)]
+
+    def lookup_decorated(self, fullname: str) -> Optional[Decorator]:
+        """Return the node for the function or method named ``fullname``
+        if it's decorated, or None otherwise.
+        """
+        if fullname in self._undecorated:
+            return None
+        node = None
+        owner_name, _, name = fullname.rpartition(".")
+        owner = self.lookup_fully_qualified(owner_name) if owner_name else None
+        if owner is not None and isinstance(owner.node, TypeInfo):
+            # A method, possibly inherited from a base class
+            member = owner.node.get(name)
+            node = member.node if member is not None else None
+        elif owner_name:
+            symbol = self.lookup_fully_qualified(fullname)
+            node = symbol.node if symbol is not None else None
+        if isinstance(node, Decorator):
+            return node
+        self._undecorated.add(fullname)
         return None
 
+    def callable_and_args_definition(
+        self, fullname: str, node: Optional[Decorator]
+    ) -> Optional[FuncDef]:
+        """Return the definition of the decorated function or method
+        ``node``, named ``fullname``, if it was decorated with
+        ``@takes_callable_and_args``, or None otherwise.
+        """
+        if node is None:
+            return None
+        cached = self._callable_and_args_functions.get(fullname)
+        if cached is not None and cached[0] is node.var.type:
+            return cached[1]
+
+        # The decorated type is a plain callable in exact_arity mode
+        # (from takes_callable_and_args_lenient_callback), and overloads
+        # otherwise
+        decorated_class = (
+            CallableType if self.config.exact_arity else Overloaded
+        )  # type: typing_Type[Type]
+        defn = None  # type: Optional[FuncDef]
+        if (
+            isinstance(node.func.type, CallableType)
+            and isinstance(node.var.type, decorated_class)
+            and any(
+                kind == ARG_STAR and is_args_for_callable(typ)
+                for kind, typ in zip(node.func.type.arg_kinds, node.func.type.arg_types)
+            )
+        ):
+            defn = node.func
+            self._callable_and_args_functions[fullname] = (node.var.type, defn)
+        return defn
+
 
 def args_invariant_decorator_callback(ctx: FunctionContext) -> Type:
     """Infer a better return type for @asynccontextmanager,
@@ -81,56 +1061,175 @@ def args_invariant_decorator_callback(ctx: FunctionContext) -> Type:
     return ctx.default_return_type
 
 
+try:
+    # mypy >= 0.730
+    _typeops = importlib.import_module("mypy.typeops")
+    _make_simplified_union = getattr(
+        _typeops, "make_simplified_union"
+    )  # type: Callable[[List[Type], int, int], Type]
+    _bind_self = getattr(_typeops, "bind_self")  # type: Callable[..., Type]
+except ImportError:
+    _make_simplified_union = getattr(UnionType, "make_simplified_union")
+    _bind_self = getattr(importlib.import_module("mypy.checkmember"), "bind_self")
+
+
+def make_simplified_union(items: List[Type], line: int = -1, column: int = -1) -> Type:
+    """Return the union of ``items``, with any item that's a subtype of
+    another removed, on every supported mypy version.
+    """
+    if len(items) == 1:
+        return items[0]
+    return _make_simplified_union(items, line, column)
+
+
+def bind_self(
+    method: CallableType, original_type: Type, is_classmethod: bool = False
+) -> CallableType:
+    """Return ``method`` without its first argument, which is bound to
+    ``original_type``, on every supported mypy version.
+    """
+    return cast(CallableType, _bind_self(method, original_type, is_classmethod))
+
+
+def instance_literal_value(typ: Instance) -> Optional[LiteralType]:
+    """Return the literal value that mypy knows an instance type has
+    (like the value of a ``Final`` constant), if any. This is
+    ``last_known_value`` in mypy >= 0.700, and ``final_value`` before.
+    """
+    value = getattr(typ, "last_known_value", None)
+    if value is None:
+        value = getattr(typ, "final_value", None)
+    return cast(Optional[LiteralType], value)
+
+
+def format_type_bare(checker: TypeChecker, typ: Type) -> str:
+    """Return ``typ`` the way mypy shows types in its messages, without
+    quotes. This is a method of the checker's message builder before
+    mypy 0.730, and a function in ``mypy.messages`` since.
+    """
+    format_bare = getattr(checker.msg, "format_bare", None)
+    if format_bare is None:
+        format_bare = getattr(
+            importlib.import_module("mypy.messages"), "format_type_bare"
+        )
+    return cast(str, format_bare(typ))
+
+
+def literal_type_values(typ: Optional[Type]) -> Optional[List[object]]:
+    """Return the values that an expression of type ``typ`` can have,
+    if it's a literal type (like ``Literal["rb"]``), the type of a
+    ``Final`` constant, or a union of those; otherwise return None.
+    """
+    if isinstance(typ, LiteralType):
+        return [typ.value]
+    if isinstance(typ, Instance):
+        value = instance_literal_value(typ)
+        return None if value is None else [value.value]
+    if isinstance(typ, UnionType):
+        values = []  # type: List[object]
+        for item in typ.items:
+            item_values = literal_type_values(item)
+            if item_values is None:
+                return None
+            values.extend(item_values)
+        return values
+    return None
+
+
+def literal_values(expr: Expression, typ: Optional[Type]) -> Optional[List[object]]:
+    """Return the values that the argument ``expr``, of type ``typ``,
+    can have if they're known statically, or None if they aren't.
+    ``typ`` may be None if the argument's type isn't available, in
+    which case we go by the declaration of any variable it names.
+    """
+    if isinstance(expr, (StrExpr, IntExpr)):
+        return [expr.value]
+    if typ is None and isinstance(expr, RefExpr) and isinstance(expr.node, Var):
+        if expr.node.final_value is not None:
+            return [expr.node.final_value]
+        typ = expr.node.type
+    return literal_type_values(typ)
+
+
 def open_return_type(
-    api: CheckerPluginInterface, args: List[List[Expression]]
+    api: CheckerPluginInterface,
+    args: List[List[Expression]],
+    arg_types: Optional[List[List[Type]]] = None,
 ) -> Optional[Type]:
-    def return_type(word: Literal["Text", "Buffered", "Raw"]) -> Type:
-        return api.named_generic_type(
-            "typing.Awaitable",
-            [api.named_generic_type("trio._Async{}IOBase".format(word), [])],
-        )
-
-    if len(args) < 2 or len(args[1]) == 0:
-        # If mode is unspecified, the default is text
-        return return_type("Text")
-
-    if len(args[1]) == 1:
-        # Mode was specified
-        mode_arg = args[1][0]
-        if isinstance(mode_arg, StrExpr):
-            # Mode is a string constant
-            if "b" not in mode_arg.value:
-                # If there's no "b" in it, it's a text mode
-                return return_type("Text")
-            # Otherwise it's binary -- determine whether buffered or not
-            if len(args) >= 3 and len(args[2]) == 1:
-                # Buffering was specified
-                buffering_arg = args[2][0]
-                if isinstance(buffering_arg, IntExpr):
-                    # Buffering is a constant -- zero means
-                    # unbuffered, otherwise buffered
-                    if buffering_arg.value == 0:
-                        return return_type("Raw")
-                    return return_type("Buffered")
-                # Not a constant, so we're not sure which it is.
-                options = [
-                    api.named_generic_type("trio._AsyncRawIOBase", []),
-                    api.named_generic_type("trio._AsyncBufferedIOBase", []),
-                ]  # type: List[Type]
-                return api.named_generic_type(
-                    "typing.Awaitable", [UnionType.make_simplified_union(options)]
-                )
-            else:
-                # Buffering is default if not specified
-                return return_type("Buffered")
+    """Return the type of file that a call to ``open()`` with arguments
+    ``args`` (grouped by formal parameter: file, mode, buffering,
+    ...) returns, or None if the mode isn't known. ``arg_types`` are
+    the types of the arguments, if available.
+    """
+
+    def argument_values(index: int, default: object) -> Optional[List[object]]:
+        if len(args) <= index or len(args[index]) == 0:
+            return [default]
+        if len(args[index]) > 1:
+            return None
+        typ = None
+        if arg_types is not None and len(arg_types[index]) == 1:
+            typ = arg_types[index][0]
+        return literal_values(args[index][0], typ)
+
+    # If mode is unspecified, the default is text
+    modes = argument_values(1, "r")
+    if modes is None:
+        # Mode wasn't a constant or we couldn't make sense of it
+        return None
+    # If buffering isn't a constant, we're not sure whether binary
+    # modes are buffered or not
+    bufferings = argument_values(2, -1)
+
+    words = set()  # type: Set[str]
+    for mode in modes:
+        if not isinstance(mode, str):
+            return None
+        if "b" not in mode:
+            # If there's no "b" in it, it's a text mode
+            words.add("Text")
+        elif bufferings is None:
+            words.update(("Raw", "Buffered"))
+        else:
+            # Zero means unbuffered, anything else buffered
+            words.update("Raw" if value == 0 else "Buffered" for value in bufferings)
+
+    options = [
+        api.named_generic_type("trio._Async{}IOBase".format(word), [])
+        for word in ("Raw", "Buffered", "Text")
+        if word in words
+    ]  # type: List[Type]
+    return make_simplified_union(options)
 
-    # Mode wasn't a constant or we couldn't make sense of it
-    return None
+
+def open_call_args(call: CallExpr) -> Optional[List[List[Expression]]]:
+    """Group the arguments of the ``open()`` call ``call`` by formal
+    parameter, as mypy does for the calls that plugin hooks see, for
+    the parameters that :func:`open_return_type` cares about. Returns
+    None if the call uses ``*args`` or ``**kwargs``.
+    """
+    formals = ["file", "mode", "buffering"]
+    args = [[] for _ in formals]  # type: List[List[Expression]]
+    for position, (arg, kind, name) in enumerate(
+        zip(call.args, call.arg_kinds, call.arg_names)
+    ):
+        if kind == ARG_POS:
+            index = position
+        elif kind == ARG_NAMED and name is not None:
+            index = formals.index(name) if name in formals else len(formals)
+        else:
+            return None
+        if index < len(formals):
+            args[index].append(arg)
+    return args
 
 
 def open_file_callback(ctx: FunctionContext) -> Type:
     """Infer a better return type for trio.open_file()."""
-    return open_return_type(ctx.api, ctx.args) or ctx.default_return_type
+    file_type = open_return_type(ctx.api, ctx.args, ctx.arg_types)
+    if file_type is None:
+        return ctx.default_return_type
+    return ctx.api.named_generic_type("typing.Awaitable", [file_type])
 
 
 def open_method_callback(ctx: MethodContext) -> Type:
@@ -139,7 +1238,33 @@ def open_method_callback(ctx: MethodContext) -> Type:
     # Path.open() doesn't take the first (filename) argument of open_file(),
     # so we need to shift by one.
     args_with_path = cast(List[List[Expression]], [[]]) + ctx.args
-    return open_return_type(ctx.api, args_with_path) or ctx.default_return_type
+    arg_types_with_path = cast(List[List[Type]], [[]]) + ctx.arg_types
+    file_type = open_return_type(ctx.api, args_with_path, arg_types_with_path)
+    if file_type is None:
+        return ctx.default_return_type
+    return ctx.api.named_generic_type("typing.Awaitable", [file_type])
+
+
+def wrap_file_callback(ctx: FunctionContext) -> Type:
+    """Infer a better return type for trio.wrap_file() when it's
+    wrapping the result of a call to the synchronous open(). The
+    typeshed stubs for open() don't look at the buffering argument, so
+    without this, unbuffered binary files would be wrapped as buffered
+    ones.
+    """
+    if len(ctx.args) == 1 and len(ctx.args[0]) == 1:
+        call = ctx.args[0][0]
+        if (
+            isinstance(call, CallExpr)
+            and isinstance(call.callee, RefExpr)
+            and call.callee.fullname in ("builtins.open", "io.open")
+        ):
+            args = open_call_args(call)
+            if args is not None:
+                file_type = open_return_type(ctx.api, args)
+                if file_type is not None:
+                    return file_type
+    return ctx.default_return_type
 
 
 def decode_agen_types_from_return_type(
@@ -164,10 +1289,9 @@ def decode_agen_types_from_return_type(
     is inferred as ``NoReturn``.
     """
 
+    arms = [original_async_return_type]  # type: Sequence[Type]
     if isinstance(original_async_return_type, UnionType):
         arms = original_async_return_type.items
-    else:
-        arms = [original_async_return_type]
     yield_type = None  # type: Optional[Type]
     send_type = None  # type: Optional[Type]
     other_arms = []  # type: List[Type]
@@ -221,9 +1345,7 @@ def decode_agen_types_from_return_type(
         return (
             yield_type,
             send_type,
-            UnionType.make_simplified_union(
-                other_arms, ctx.context.line, ctx.context.column
-            ),
+            make_simplified_union(other_arms, ctx.context.line, ctx.context.column),
         )
 
 
@@ -267,14 +1389,616 @@ def async_generator_callback(ctx: FunctionContext) -> Type:
     return new_return_type
 
 
+class CompatYieldFinder(NodeTraverser):
+    """Find what stops an @async_generator function from being written
+    as a native async generator: ``yield_from_()`` calls, which have no
+    native equivalent, and ``return`` statements with a value other
+    than None, which native async generators can't have. Nested
+    functions and lambdas are skipped.
+    """
+
+    def __init__(self) -> None:
+        self.yields = 0
+        self.yield_froms = 0
+        self.value_returns = 0
+
+    def visit_call_expr(self, expr: CallExpr) -> None:
+        if isinstance(expr.callee, RefExpr):
+            if expr.callee.fullname == "async_generator.yield_":
+                self.yields += 1
+            elif expr.callee.fullname == "async_generator.yield_from_":
+                self.yield_froms += 1
+        super().visit_call_expr(expr)
+
+    def visit_return_stmt(self, stmt: ReturnStmt) -> None:
+        if stmt.expr is not None and not (
+            isinstance(stmt.expr, NameExpr) and stmt.expr.fullname == "builtins.None"
+        ):
+            self.value_returns += 1
+        super().visit_return_stmt(stmt)
+
+    def visit_func_def(self, defn: FuncDef) -> None:
+        pass
+
+    def visit_lambda_expr(self, expr: LambdaExpr) -> None:
+        pass
+
+
+def convertible_async_generator_callback(ctx: FunctionContext) -> Type:
+    """Handle @async_generator, and also report decorated functions
+    that could be native async generators (``yield`` inside ``async
+    def``, Python 3.6+), which avoid the overhead of the compatibility
+    layer on every yield. That's the case if the function yields
+    something, doesn't use ``yield_from_()``, never returns a value
+    other than None, and isn't declared to return anything but None,
+    NoReturn or Any (which includes having no annotation). The
+    ``trio_typing.native_agen`` codemod rewrites the same functions.
+    """
+    decorated_type = async_generator_callback(ctx)
+    checker = cast(TypeChecker, ctx.api)
+    if (
+        checker.options.python_version < (3, 6)
+        or not isinstance(ctx.context, Decorator)
+        or not ctx.context.func.is_coroutine
+        or not isinstance(decorated_type, CallableType)
+        or not isinstance(decorated_type.ret_type, Instance)
+        or len(decorated_type.ret_type.args) != 3
+    ):
+        return decorated_type
+    yield_type, send_type, return_type = decorated_type.ret_type.args
+    if not isinstance(return_type, (NoneTyp, UninhabitedType, AnyType)):
+        return decorated_type
+
+    finder = CompatYieldFinder()
+    finder.accept(ctx.context.func.body)
+    if finder.yields and not finder.yield_froms and not finder.value_returns:
+        ctx.api.fail(
+            '@async_generator function "{}" could be a native async generator '
+            'returning "AsyncGenerator[{}, {}]"; "python -m '
+            'trio_typing.native_agen" can convert it'.format(
+                ctx.context.func.name(),
+                format_type_bare(checker, yield_type),
+                format_type_bare(checker, send_type),
+            ),
+            ctx.context.func,
+        )
+    return decorated_type
+
+
+def enclosing_function(ctx: HookContext) -> Optional[FuncItem]:
+    """Return the function (or lambda) that contains the call described
+    by ``ctx``, or None if it's at module or class level.
+    """
+    return cast(TypeChecker, ctx.api).scope.top_function()
+
+
+class LambdaCallCollector(NodeTraverser):
+    def __init__(self) -> None:
+        self.calls = set()  # type: Set[CallExpr]
+        self.lambda_depth = 0
+
+    def visit_lambda_expr(self, expr: LambdaExpr) -> None:
+        self.lambda_depth += 1
+        super().visit_lambda_expr(expr)
+        self.lambda_depth -= 1
+
+    def visit_call_expr(self, expr: CallExpr) -> None:
+        if self.lambda_depth:
+            self.calls.add(expr)
+        super().visit_call_expr(expr)
+
+
+@lru_cache(maxsize=64)
+def calls_in_lambdas(body: Block) -> FrozenSet[CallExpr]:
+    """Return the calls in ``body`` that are inside a lambda. (mypy
+    checks the body of a lambda whose type it can't infer from context
+    as part of the enclosing function.)
+    """
+    collector = LambdaCallCollector()
+    collector.accept(body)
+    return frozenset(collector.calls)
+
+
+# Decorators that change how we check calls to the functions they
+# decorate
+MARKING_DECORATORS = (
+    "trio_typing.takes_callable_and_args",
+    "trio_typing.blocking",
+)  # type: Final
+
+# Key in the def_extras of the type of a function decorated with
+# @trio_typing.blocking that marks it as such; unlike the decorators of
+# a function, its type (and def_extras) are kept in mypy's cache
+BLOCKING_MARK = "trio_typing.blocking"  # type: Final
+
+
+def blocking_decorator_callback(ctx: FunctionContext) -> Type:
+    """Mark the type of a function decorated with @trio_typing.blocking,
+    so that calls to it from async functions can be reported.
+    """
+    if ctx.arg_types and ctx.arg_types[0]:
+        fn_type = ctx.arg_types[0][0]
+        if isinstance(fn_type, CallableType):
+            def_extras = dict(fn_type.def_extras)
+            def_extras[BLOCKING_MARK] = True
+            return fn_type.copy_modified(def_extras=def_extras)
+    return ctx.default_return_type
+
+
+def is_marked_blocking(node: Decorator) -> bool:
+    return isinstance(node.var.type, CallableType) and bool(
+        node.var.type.def_extras.get(BLOCKING_MARK)
+    )
+
+
+def check_blocking_call(fullname: str, replacement: str, ctx: HookContext) -> None:
+    """Report a call to a function that blocks the Trio scheduler, if
+    it's made directly from an async function.
+    """
+    enclosing_func = enclosing_function(ctx)
+    if (
+        isinstance(enclosing_func, FuncDef)
+        and enclosing_func.is_coroutine
+        and ctx.context not in calls_in_lambdas(enclosing_func.body)
+    ):
+        ctx.api.fail(
+            'Blocking call to "{}" in async function; use "{}" instead'.format(
+                fullname, replacement
+            ),
+            ctx.context,
+        )
+
+
+# The function that marks a loop as not needing a checkpoint, when
+# it's called on the loop's iterable or condition
+BOUNDED_LOOP_MARKER = "trio_typing.bounded"  # type: Final
+
+
+class UncheckedLoopFinder(NodeTraverser):
+    """Find the loops in a function body that can go around without
+    reaching a checkpoint: an ``await``, ``async for``, or ``async with``.
+    (A ``yield`` also counts, since it hands control back to the caller.)
+    Nested functions and lambdas are skipped.
+    """
+
+    def __init__(self) -> None:
+        self.loops = []  # type: List[Statement]
+        # For each loop we're inside: [the loop, whether it has a checkpoint]
+        self.stack = []  # type: List[List[Any]]
+
+    def checkpoint(self) -> None:
+        for frame in self.stack:
+            frame[1] = True
+
+    def check_loop(self, loop: Statement, parts: List[Node]) -> None:
+        frame = [loop, False]
+        self.stack.append(frame)
+        for part in parts:
+            self.accept(part)
+        self.stack.pop()
+        if not frame[1]:
+            self.loops.append(loop)
+
+    def visit_while_stmt(self, stmt: WhileStmt) -> None:
+        self.check_loop(stmt, [stmt.expr, stmt.body])
+        if stmt.else_body is not None:
+            self.accept(stmt.else_body)
+
+    def visit_for_stmt(self, stmt: ForStmt) -> None:
+        if stmt.is_async:
+            self.checkpoint()
+            super().visit_for_stmt(stmt)
+            return
+        self.accept(stmt.expr)
+        self.check_loop(stmt, [stmt.index, stmt.body])
+        if stmt.else_body is not None:
+            self.accept(stmt.else_body)
+
+    def visit_with_stmt(self, stmt: WithStmt) -> None:
+        if stmt.is_async:
+            self.checkpoint()
+        super().visit_with_stmt(stmt)
+
+    def visit_await_expr(self, expr: AwaitExpr) -> None:
+        self.checkpoint()
+        super().visit_await_expr(expr)
+
+    def visit_yield_expr(self, expr: YieldExpr) -> None:
+        self.checkpoint()
+        super().visit_yield_expr(expr)
+
+    def visit_func_def(self, defn: FuncDef) -> None:
+        pass
+
+    def visit_lambda_expr(self, expr: LambdaExpr) -> None:
+        pass
+
+
+@lru_cache(maxsize=64)
+def unchecked_loops(body: Block) -> Tuple[Statement, ...]:
+    finder = UncheckedLoopFinder()
+    finder.accept(body)
+    return tuple(finder.loops)
+
+
+def is_marked_bounded(loop: Statement) -> bool:
+    """Return whether ``loop`` iterates over, or (for a ``while`` loop)
+    tests, the result of ``trio_typing.bounded()``. Unlike a comment,
+    that's part of the tree mypy gives us, so it works however mypy got
+    the module's source.
+    """
+    if not isinstance(loop, (ForStmt, WhileStmt)):
+        return False
+    expr = loop.expr
+    return (
+        isinstance(expr, CallExpr)
+        and isinstance(expr.callee, RefExpr)
+        and expr.callee.fullname == BOUNDED_LOOP_MARKER
+    )
+
+
+def check_loops(checker: TypeChecker, func: FuncDef) -> None:
+    """Report loops in async functions that never reach a checkpoint,
+    which starve other tasks and can't be cancelled.
+    """
+    if not func.is_coroutine:
+        return
+    for loop in unchecked_loops(func.body):
+        if not is_marked_bounded(loop):
+            checker.fail(
+                "Loop in async function has no checkpoint (await, "
+                "async for, or async with); wrap what it iterates over "
+                "or tests in trio_typing.bounded() if it always finishes "
+                "quickly",
+                loop,
+            )
+
+
+class AwaitFinder(NodeTraverser):
+    """Find out whether a function body contains an ``await``, ``async
+    for``, or ``async with``, outside of nested functions and lambdas.
+    """
+
+    def __init__(self) -> None:
+        self.found = False
+
+    def visit_await_expr(self, expr: AwaitExpr) -> None:
+        self.found = True
+
+    def visit_for_stmt(self, stmt: ForStmt) -> None:
+        self.found = self.found or stmt.is_async
+        super().visit_for_stmt(stmt)
+
+    def visit_with_stmt(self, stmt: WithStmt) -> None:
+        self.found = self.found or stmt.is_async
+        super().visit_with_stmt(stmt)
+
+    def visit_generator_expr(self, expr: GeneratorExpr) -> None:
+        self.found = self.found or any(expr.is_async)
+        super().visit_generator_expr(expr)
+
+    def visit_dictionary_comprehension(self, expr: DictionaryComprehension) -> None:
+        self.found = self.found or any(expr.is_async)
+        super().visit_dictionary_comprehension(expr)
+
+    def visit_func_def(self, defn: FuncDef) -> None:
+        pass
+
+    def visit_lambda_expr(self, expr: LambdaExpr) -> None:
+        pass
+
+
+@lru_cache(maxsize=64)
+def awaits_anything(body: Block) -> bool:
+    finder = AwaitFinder()
+    finder.accept(body)
+    return finder.found
+
+
+def is_stub_body(body: Block) -> bool:
+    """Return whether ``body`` is that of a placeholder function: empty
+    apart from a docstring, ``pass``, ``...``, or ``raise
+    NotImplementedError``.
+    """
+    statements = body.body
+    if (
+        statements
+        and isinstance(statements[0], ExpressionStmt)
+        and isinstance(statements[0].expr, StrExpr)
+    ):
+        statements = statements[1:]
+    if not statements:
+        return True
+    if len(statements) > 1:
+        return False
+    statement = statements[0]
+    if isinstance(statement, RaiseStmt):
+        exc = statement.expr
+        if isinstance(exc, CallExpr):
+            exc = exc.callee
+        return (
+            isinstance(exc, RefExpr) and exc.fullname == "builtins.NotImplementedError"
+        )
+    return isinstance(statement, PassStmt) or (
+        isinstance(statement, ExpressionStmt)
+        and isinstance(statement.expr, EllipsisExpr)
+    )
+
+
+def overrides_base_method(func: FuncDef) -> bool:
+    """Return whether ``func`` is a method that overrides one in a base
+    class (other than object), or is declared in a protocol.
+    """
+    info = func.info
+    if info is FUNC_NO_INFO:
+        return False
+    if info.is_protocol:
+        return True
+    return any(
+        func.name() in base.names
+        for base in info.mro[1:]
+        if base.fullname() != "builtins.object"
+    )
+
+
+def check_async_without_await(checker: TypeChecker, func: FuncDef) -> None:
+    """Report async functions that never await anything: they could be
+    regular functions, and save creating and running a coroutine each
+    time they're called.
+    """
+    if (
+        not func.is_coroutine
+        or func.is_async_generator
+        or func.is_abstract
+        or is_stub_body(func.body)
+        or overrides_base_method(func)
+        or awaits_anything(func.body)
+    ):
+        return
+    checker.fail(
+        'Async function "{}" never awaits anything (no await, async for, '
+        "or async with); it could be a regular function".format(func.name()),
+        func,
+    )
+
+
+class FunctionCheckRunner(NodeTraverser):
+    """Run each of ``checks`` on every function in a module, with
+    the errors it reports attributed to that function (so the mypy
+    daemon forgets them when it rechecks the function).
+    """
+
+    def __init__(
+        self, checker: TypeChecker, checks: List[Callable[[TypeChecker, FuncDef], None]]
+    ) -> None:
+        self.checker = checker
+        self.checks = checks
+        self.scope = Scope()
+        self.scope.enter_file(checker.tree.fullname())
+
+    def visit_func_def(self, defn: FuncDef) -> None:
+        with self.scope.function_scope(defn):
+            for check in self.checks:
+                check(self.checker, defn)
+            super().visit_func_def(defn)
+
+    def visit_class_def(self, defn: ClassDef) -> None:
+        with self.scope.class_scope(defn.info):
+            super().visit_class_def(defn)
+
+    def run(self) -> None:
+        errors = self.checker.errors
+        saved_scope = errors.scope
+        errors.scope = self.scope
+        try:
+            self.accept(self.checker.tree)
+        finally:
+            errors.scope = saved_scope
+
+
+class ModuleChecker:
+    """Run checks that look at whole functions, like check_loops(), on
+    every function in a module.
+
+    mypy has no hook that runs for each module or function it checks,
+    so we do this the first time it checks a call in the module. That
+    means looking at every call, so the hooks for the ones we don't
+    handle pass them on to the plugins after us.
+    """
+
+    def __init__(self, checks: List[Callable[[TypeChecker, FuncDef], None]]) -> None:
+        self.checks = checks
+        # The module we last checked, and the binder of the typechecking
+        # pass we checked it in; mypy's daemon makes a new binder each
+        # time it rechecks something, and needs the errors again
+        self.last_checked = None  # type: Optional[Tuple[MypyFile, Any]]
+
+    def wrap(self, hook: Callable[[HookContext], Type]) -> AnyHook:
+        return partial(self.check_and_call, hook)
+
+    def check_and_call(
+        self, hook: Callable[[HookContext], Type], ctx: HookContext
+    ) -> Type:
+        self.check_module(ctx)
+        return hook(ctx)
+
+    def check_module(self, ctx: HookContext) -> None:
+        checker = cast(TypeChecker, ctx.api)
+        if checker.msg.errors is not checker.errors or checker.msg.disable_count:
+            # mypy is trying something out (like one item of an
+            # overloaded function that the call is an argument to), and
+            # will throw away whatever we report
+            return
+        key = (checker.tree, checker.binder)
+        if (
+            self.last_checked is None
+            or self.last_checked[0] is not key[0]
+            or self.last_checked[1] is not key[1]
+        ):
+            self.last_checked = key
+            if not checker.tree.is_stub:
+                FunctionCheckRunner(checker, self.checks).run()
+
+
+# Classes whose instances can buffer any number of items, unless they're
+# given a finite max_buffer_size; reported if warn_unbounded_buffers is
+# enabled
+UNBOUNDED_BUFFER_CLASSES = (
+    "trio.open_memory_channel",
+    "trio.hazmat.UnboundedQueue",
+)  # type: Final
+
+
+def constant_buffer_size(expr: Expression, typ: Optional[Type]) -> Optional[float]:
+    """Return the largest value that the buffer size argument ``expr``,
+    of type ``typ`` (if known), can have: it can be a number,
+    ``math.inf``, ``float("inf")``, or a ``Final`` or ``Literal`` number.
+    Return None if it's not a constant.
+    """
+    if isinstance(expr, (IntExpr, FloatExpr)):
+        return float(expr.value)
+    if isinstance(expr, RefExpr) and expr.fullname == "math.inf":
+        return math.inf
+    if (
+        isinstance(expr, CallExpr)
+        and isinstance(expr.callee, RefExpr)
+        and expr.callee.fullname == "builtins.float"
+        and len(expr.args) == 1
+        and isinstance(expr.args[0], StrExpr)
+    ):
+        try:
+            return float(expr.args[0].value)
+        except ValueError:
+            return None
+    values = literal_values(expr, typ)
+    if values and all(isinstance(value, (int, float)) for value in values):
+        return max(float(cast(float, value)) for value in values)
+    return None
+
+
+def is_allowed_module(module: str, patterns: List[str]) -> bool:
+    """Return whether ``module`` matches one of ``patterns``, which are
+    module names, or ``package.*`` for a package and all its submodules
+    (as in mypy's per-module config sections).
+    """
+    for pattern in patterns:
+        if pattern.endswith(".*"):
+            package = pattern[:-2]
+            if module == package or module.startswith(package + "."):
+                return True
+        elif module == pattern:
+            return True
+    return False
+
+
+def unbounded_buffer_error(
+    fullname: str, size_expr: Optional[Expression], size_type: Optional[Type]
+) -> Optional[str]:
+    """Return the error to report for creating an instance of
+    ``fullname``, one of UNBOUNDED_BUFFER_CLASSES, with a buffer size
+    of ``size_expr``, or None if there's nothing wrong with it.
+    """
+    if fullname == "trio.hazmat.UnboundedQueue":
+        return (
+            "UnboundedQueue can grow without limit; use a memory channel "
+            "with a finite buffer size to get backpressure"
+        )
+    if size_expr is None:
+        # mypy will complain about the missing argument
+        return None
+    size = constant_buffer_size(size_expr, size_type)
+    if size is None:
+        return (
+            "Memory channel buffer size is not a constant, so the buffer "
+            "might grow without limit; use a finite constant to get backpressure"
+        )
+    if size == math.inf:
+        return (
+            "Memory channel buffer size is {}, so the buffer can grow "
+            "without limit; use a finite constant to get backpressure".format(size)
+        )
+    return None
+
+
+def unbounded_buffer_callback(
+    fullname: str, allowed_modules: List[str], ctx: FunctionContext
+) -> Type:
+    """Report creating an open_memory_channel with an infinite or
+    non-constant buffer size, or an UnboundedQueue, outside
+    ``allowed_modules``.
+    """
+    checker = cast(TypeChecker, ctx.api)
+    if not is_allowed_module(checker.tree.fullname(), allowed_modules):
+        size_expr = size_type = None
+        if ctx.args and len(ctx.args[0]) == 1:
+            size_expr = ctx.args[0][0]
+            size_type = ctx.arg_types[0][0]
+        message = unbounded_buffer_error(fullname, size_expr, size_type)
+        if message is not None:
+            ctx.api.fail(message, ctx.context)
+    return ctx.default_return_type
+
+
+class SubscriptedCallFinder(NodeTraverser):
+    """Find calls like ``open_memory_channel[int](size)`` to the classes
+    in UNBOUNDED_BUFFER_CLASSES, which mypy doesn't look up hooks for
+    because the callee is a type application rather than a name.
+    Nested functions are skipped.
+    """
+
+    def __init__(self) -> None:
+        self.calls = []  # type: List[CallExpr]
+
+    def visit_call_expr(self, expr: CallExpr) -> None:
+        if (
+            isinstance(expr.callee, IndexExpr)
+            and isinstance(expr.callee.base, RefExpr)
+            and expr.callee.base.fullname in UNBOUNDED_BUFFER_CLASSES
+        ):
+            self.calls.append(expr)
+        super().visit_call_expr(expr)
+
+    def visit_func_def(self, defn: FuncDef) -> None:
+        pass
+
+
+@lru_cache(maxsize=64)
+def subscripted_buffer_calls(body: Block) -> Tuple[CallExpr, ...]:
+    finder = SubscriptedCallFinder()
+    finder.accept(body)
+    return tuple(finder.calls)
+
+
+def check_subscripted_buffer_calls(
+    allowed_modules: List[str], checker: TypeChecker, func: FuncDef
+) -> None:
+    """Do what unbounded_buffer_callback() does, for the calls in
+    ``func`` that it doesn't see.
+    """
+    if is_allowed_module(checker.tree.fullname(), allowed_modules):
+        return
+    for call in subscripted_buffer_calls(func.body):
+        size_expr = None
+        for arg, kind, name in zip(call.args, call.arg_kinds, call.arg_names):
+            if kind == ARG_POS or name == "max_buffer_size":
+                size_expr = arg
+                break
+        message = unbounded_buffer_error(
+            cast(RefExpr, cast(IndexExpr, call.callee).base).fullname or "",
+            size_expr,
+            None,
+        )
+        if message is not None:
+            checker.fail(message, call)
+
+
 def decode_enclosing_agen_types(ctx: FunctionContext) -> Tuple[Type, Type]:
     """Return the yield and send types that would be returned by
     decode_agen_types_from_return_type() for the function that's
     currently being typechecked, i.e., the function that contains the
     call described in ``ctx``.
     """
-    private_api = cast(TypeChecker, ctx.api)
-    enclosing_func = private_api.scope.top_function()
+    enclosing_func = enclosing_function(ctx)
     if (
         enclosing_func is None
         or not isinstance(enclosing_func, FuncDef)
@@ -446,119 +2170,16 @@ def takes_callable_and_args_callback(ctx: FunctionContext) -> Type:
 
     """
     try:
-        if (
-            not ctx.arg_types
-            or len(ctx.arg_types[0]) != 1
-            or not isinstance(ctx.arg_types[0][0], CallableType)
-            or not isinstance(ctx.default_return_type, CallableType)
-        ):
-            raise ValueError("must be used as a decorator")
-
-        fn_type = ctx.arg_types[0][0]  # type: CallableType
-        callable_idx = -1  # index in function arguments of the callable
-        callable_args_idx = -1  # index in callable arguments of the StarArgs
-        args_idx = -1  # index in function arguments of the StarArgs
-
-        for idx, (kind, ty) in enumerate(zip(fn_type.arg_kinds, fn_type.arg_types)):
-            if (
-                isinstance(ty, Instance)
-                and ty.type.fullname() == "trio_typing.ArgsForCallable"
-            ):
-                if kind != ARG_STAR:
-                    raise ValueError(
-                        "ArgsForCallable must be used with a *args argument "
-                        "in the decorated function"
-                    )
-                assert args_idx == -1
-                args_idx = idx
-            elif isinstance(ty, CallableType) and kind == ARG_POS:
-                for idx_, (kind_, ty_) in enumerate(zip(ty.arg_kinds, ty.arg_types)):
-                    if (
-                        isinstance(ty_, Instance)
-                        and ty_.type.fullname() == "trio_typing.ArgsForCallable"
-                    ):
-                        if kind != ARG_POS:
-                            raise ValueError(
-                                "ArgsForCallable must be used with a positional "
-                                "argument in the callable type that the decorated "
-                                "function takes"
-                            )
-                        if callable_idx != -1:
-                            raise ValueError(
-                                "ArgsForCallable may only be used once as the type "
-                                "of an argument to a callable type that the "
-                                "decorated function takes"
-                            )
-                        callable_idx = idx
-                        callable_args_idx = idx_
-        if args_idx == -1:
-            raise ValueError(
-                "decorated function must take *args with type "
-                "trio_typing.ArgsForCallable"
-            )
-        if callable_idx == -1:
-            raise ValueError(
-                "decorated function must take a callable that has an "
-                "argument of type trio_typing.ArgsForCallable"
-            )
-
-        expanded_fns = []  # type: List[CallableType]
-        type_var_defs = []  # type: List[TypeVarDef]
-        type_var_types = []  # type: List[Type]
-        for arg_idx in range(1, 5):
-            callable_ty = cast(CallableType, fn_type.arg_types[callable_idx])
-            arg_types = list(fn_type.arg_types)
-            arg_types[callable_idx] = callable_ty.copy_modified(
-                arg_types=(
-                    callable_ty.arg_types[:callable_args_idx]
-                    + type_var_types
-                    + callable_ty.arg_types[callable_args_idx + 1 :]
-                ),
-                arg_kinds=(
-                    callable_ty.arg_kinds[:callable_args_idx]
-                    + ([ARG_POS] * len(type_var_types))
-                    + callable_ty.arg_kinds[callable_args_idx + 1 :]
-                ),
-                arg_names=(
-                    callable_ty.arg_names[:callable_args_idx]
-                    + ([None] * len(type_var_types))
-                    + callable_ty.arg_names[callable_args_idx + 1 :]
-                ),
-                variables=(callable_ty.variables + type_var_defs),
-            )
-            expanded_fns.append(
-                fn_type.copy_modified(
-                    arg_types=(
-                        arg_types[:args_idx]
-                        + type_var_types
-                        + arg_types[args_idx + 1 :]
-                    ),
-                    arg_kinds=(
-                        fn_type.arg_kinds[:args_idx]
-                        + ([ARG_POS] * len(type_var_types))
-                        + fn_type.arg_kinds[args_idx + 1 :]
-                    ),
-                    arg_names=(
-                        fn_type.arg_names[:args_idx]
-                        + ([None] * len(type_var_types))
-                        + fn_type.arg_names[args_idx + 1 :]
-                    ),
-                    variables=(fn_type.variables + type_var_defs),
+        fn_type = decorated_function_type(ctx)
+        indices = find_callable_and_args(fn_type)
+        return Overloaded(
+            [
+                expand_callable_and_args(
+                    fn_type, indices, num_args, ctx.api, ctx.context
                 )
-            )
-            type_var_defs.append(
-                TypeVarDef(
-                    "__T{}".format(arg_idx),
-                    "__T{}".format(arg_idx),
-                    -len(fn_type.variables) - arg_idx - 1,
-                    [],
-                    ctx.api.named_generic_type("builtins.object", []),
-                )
-            )
-            type_var_types.append(
-                TypeVarType(type_var_defs[-1], ctx.context.line, ctx.context.column)
-            )
-        return Overloaded(expanded_fns)
+                for num_args in range(4)
+            ]
+        )
 
     except ValueError as ex:
         ctx.api.fail(
@@ -567,5 +2188,404 @@ def takes_callable_and_args_callback(ctx: FunctionContext) -> Type:
         return ctx.default_return_type
 
 
+def takes_callable_and_args_lenient_callback(ctx: FunctionContext) -> Type:
+    """Handle @takes_callable_and_args in exact_arity mode.
+
+    The decorated function gets a lenient signature, which accepts any
+    callable with the right return type and any positional arguments;
+    each call to it is then checked against a signature with exactly as
+    many positional arguments as the call passes, by :func:`exact_arity_function_callback` or
+    :func:`exact_arity_method_callback`. This avoids overload matching
+    at every call site and has no limit on the number of arguments.
+    """
+    try:
+        fn_type = decorated_function_type(ctx)
+        callable_idx, _, args_idx = find_callable_and_args(fn_type)
+        arg_types = list(fn_type.arg_types)
+        arg_types[callable_idx] = lenient_callable_type(
+            cast(CallableType, arg_types[callable_idx])
+        )
+        # object rather than Any, so the arguments' types are inferred
+        # without a type context, as they would be for a TypeVar
+        arg_types[args_idx] = ctx.api.named_generic_type("builtins.object", [])
+        return fn_type.copy_modified(arg_types=arg_types)
+
+    except ValueError as ex:
+        ctx.api.fail(
+            "invalid use of @takes_callable_and_args: {}".format(ex), ctx.context
+        )
+        return ctx.default_return_type
+
+
+def decorated_function_type(ctx: FunctionContext) -> CallableType:
+    """Return the type of the function that the decorator call described
+    by ``ctx`` is being applied to, or raise ValueError.
+    """
+    if (
+        not ctx.arg_types
+        or len(ctx.arg_types[0]) != 1
+        or not isinstance(ctx.arg_types[0][0], CallableType)
+        or not isinstance(ctx.default_return_type, CallableType)
+    ):
+        raise ValueError("must be used as a decorator")
+    return ctx.arg_types[0][0]
+
+
+def is_args_for_callable(typ: Type) -> bool:
+    return isinstance(typ, Instance) and typ.type.fullname() == (
+        "trio_typing.ArgsForCallable"
+    )
+
+
+def find_callable_and_args(fn_type: CallableType) -> Tuple[int, int, int]:
+    """Locate the uses of ``ArgsForCallable`` in the signature ``fn_type``
+    of a function decorated with ``@takes_callable_and_args``.
+
+    Return a tuple ``(callable_idx, callable_args_idx, args_idx)``:
+    the index in the function arguments of the callable, the index in
+    the callable's arguments of the ``ArgsForCallable`` placeholder,
+    and the index in the function arguments of the ``*args``.
+    Raise ValueError if the signature doesn't have the expected form.
+    """
+    callable_idx = -1
+    callable_args_idx = -1
+    args_idx = -1
+
+    for idx, (kind, ty) in enumerate(zip(fn_type.arg_kinds, fn_type.arg_types)):
+        if is_args_for_callable(ty):
+            if kind != ARG_STAR:
+                raise ValueError(
+                    "ArgsForCallable must be used with a *args argument "
+                    "in the decorated function"
+                )
+            assert args_idx == -1
+            args_idx = idx
+        elif isinstance(ty, CallableType) and kind == ARG_POS:
+            for idx_, (kind_, ty_) in enumerate(zip(ty.arg_kinds, ty.arg_types)):
+                if is_args_for_callable(ty_):
+                    if kind != ARG_POS:
+                        raise ValueError(
+                            "ArgsForCallable must be used with a positional "
+                            "argument in the callable type that the decorated "
+                            "function takes"
+                        )
+                    if callable_idx != -1:
+                        raise ValueError(
+                            "ArgsForCallable may only be used once as the type "
+                            "of an argument to a callable type that the "
+                            "decorated function takes"
+                        )
+                    callable_idx = idx
+                    callable_args_idx = idx_
+    if args_idx == -1:
+        raise ValueError(
+            "decorated function must take *args with type "
+            "trio_typing.ArgsForCallable"
+        )
+    if callable_idx == -1:
+        raise ValueError(
+            "decorated function must take a callable that has an "
+            "argument of type trio_typing.ArgsForCallable"
+        )
+    return callable_idx, callable_args_idx, args_idx
+
+
+def expand_callable_and_args(
+    fn_type: CallableType,
+    indices: Tuple[int, int, int],
+    num_args: int,
+    api: CheckerPluginInterface,
+    context: Context,
+) -> CallableType:
+    """Return the signature of the ``@takes_callable_and_args`` function
+    ``fn_type`` when called with ``num_args`` positional arguments
+    for the callable. ``indices`` is the result of
+    :func:`find_callable_and_args` for ``fn_type``.
+    """
+    callable_idx, callable_args_idx, args_idx = indices
+    type_var_defs = []  # type: List[TypeVarDef]
+    type_var_types = []  # type: List[Type]
+    for arg_idx in range(1, num_args + 1):
+        type_var_defs.append(
+            TypeVarDef(
+                "__T{}".format(arg_idx),
+                "__T{}".format(arg_idx),
+                -len(fn_type.variables) - arg_idx - 1,
+                [],
+                api.named_generic_type("builtins.object", []),
+            )
+        )
+        type_var_types.append(
+            TypeVarType(type_var_defs[-1], context.line, context.column)
+        )
+
+    callable_ty = cast(CallableType, fn_type.arg_types[callable_idx])
+    arg_types = list(fn_type.arg_types)
+    arg_types[callable_idx] = callable_ty.copy_modified(
+        arg_types=(
+            callable_ty.arg_types[:callable_args_idx]
+            + type_var_types
+            + callable_ty.arg_types[callable_args_idx + 1 :]
+        ),
+        arg_kinds=(
+            callable_ty.arg_kinds[:callable_args_idx]
+            + ([ARG_POS] * len(type_var_types))
+            + callable_ty.arg_kinds[callable_args_idx + 1 :]
+        ),
+        arg_names=(
+            callable_ty.arg_names[:callable_args_idx]
+            + ([None] * len(type_var_types))
+            + callable_ty.arg_names[callable_args_idx + 1 :]
+        ),
+        variables=(callable_ty.variables + type_var_defs),
+    )
+    return fn_type.copy_modified(
+        arg_types=(arg_types[:args_idx] + type_var_types + arg_types[args_idx + 1 :]),
+        arg_kinds=(
+            fn_type.arg_kinds[:args_idx]
+            + ([ARG_POS] * len(type_var_types))
+            + fn_type.arg_kinds[args_idx + 1 :]
+        ),
+        arg_names=(
+            fn_type.arg_names[:args_idx]
+            + ([None] * len(type_var_types))
+            + fn_type.arg_names[args_idx + 1 :]
+        ),
+        variables=(fn_type.variables + type_var_defs),
+    )
+
+
+def lenient_callable_type(callable_ty: CallableType) -> CallableType:
+    """Return a version of ``callable_ty`` that accepts any arguments,
+    for use as the declared type of the callable argument of a
+    ``@takes_callable_and_args`` function in exact_arity mode.
+    """
+    return callable_ty.copy_modified(
+        arg_types=[AnyType(TypeOfAny.special_form)] * 2,
+        arg_kinds=[ARG_STAR, ARG_STAR2],
+        arg_names=[None, None],
+        is_ellipsis_args=True,
+    )
+
+
+def bound_method_signature(defn: FuncDef, ctx: MethodContext) -> CallableType:
+    """Return the undecorated signature of the method ``defn``, as
+    seen by the method call described by ``ctx``.
+    """
+    signature = cast(CallableType, defn.type)
+    if not defn.is_static:
+        signature = bind_self(signature, ctx.type, is_classmethod=defn.is_class)
+    if isinstance(ctx.type, Instance):
+        signature = cast(
+            CallableType,
+            expand_type_by_instance(
+                signature, map_instance_to_supertype(ctx.type, defn.info)
+            ),
+        )
+    return signature
+
+
+def callable_and_args_function_callback(defn: FuncDef, ctx: FunctionContext) -> Type:
+    """Check a call to the @takes_callable_and_args function ``defn``
+    that passes a ``functools.partial()`` as the callable.
+    """
+    return check_callable_and_args_call(cast(CallableType, defn.type), ctx, True)
+
+
+def callable_and_args_method_callback(defn: FuncDef, ctx: MethodContext) -> Type:
+    """Check a call to the @takes_callable_and_args method ``defn``
+    that passes a ``functools.partial()`` as the callable.
+    """
+    return check_callable_and_args_call(bound_method_signature(defn, ctx), ctx, True)
+
+
+def exact_arity_function_callback(defn: FuncDef, ctx: FunctionContext) -> Type:
+    """Check a call to the @takes_callable_and_args function ``defn``
+    in exact_arity mode.
+    """
+    return check_callable_and_args_call(cast(CallableType, defn.type), ctx, False)
+
+
+def exact_arity_method_callback(defn: FuncDef, ctx: MethodContext) -> Type:
+    """Check a call to the @takes_callable_and_args method ``defn``
+    in exact_arity mode.
+    """
+    return check_callable_and_args_call(bound_method_signature(defn, ctx), ctx, False)
+
+
+def partial_callable_type(
+    expr: Expression, api: CheckerPluginInterface
+) -> Optional[CallableType]:
+    """If ``expr`` is a call ``functools.partial(fn, ...)``, check the
+    arguments it binds against ``fn`` and return the signature of the
+    partial: what's left of ``fn``'s signature. Otherwise, or if we
+    can't work that out, return None.
+
+    mypy's own type for a partial accepts any arguments at all (its
+    ``__call__`` takes ``*args: Any, **kwargs: Any``), and doesn't check
+    the ones it binds.
+    """
+    if not (
+        isinstance(expr, CallExpr)
+        and isinstance(expr.callee, RefExpr)
+        and expr.callee.fullname == "functools.partial"
+        and expr.args
+        and expr.arg_kinds[0] == ARG_POS
+    ):
+        return None
+    checker = cast(TypeChecker, api)
+    fn_type = checker.type_map.get(expr.args[0])
+    if not isinstance(fn_type, CallableType):
+        return None
+    kinds = expr.arg_kinds[1:]
+    names = expr.arg_names[1:]
+
+    # Check the bound arguments against a version of fn's signature in
+    # which every argument is optional
+    actuals = []  # type: List[Expression]
+    for arg in expr.args[1:]:
+        actual = TempNode(checker.type_map.get(arg, AnyType(TypeOfAny.special_form)))
+        actual.set_line(arg)
+        actuals.append(actual)
+    optional_kinds = {ARG_POS: ARG_OPT, ARG_NAMED: ARG_NAMED_OPT}
+    # (error messages refer to keyword arguments by looking them up in
+    # the call, so it needs to look like a call to fn)
+    bound_call = CallExpr(expr.args[0], expr.args[1:], kinds, names)
+    bound_call.set_line(expr)
+    checker.expr_checker.check_call(
+        fn_type.copy_modified(
+            arg_kinds=[optional_kinds.get(kind, kind) for kind in fn_type.arg_kinds]
+        ),
+        actuals,
+        kinds,
+        bound_call,
+        names,
+    )
+    if any(kind in (ARG_STAR, ARG_STAR2) for kind in kinds):
+        # We don't know how many arguments *args or **kwargs bind
+        return None
+
+    # Positional arguments are bound from the left. Arguments bound by
+    # keyword can still be passed by keyword, and any positional
+    # arguments after them can only be passed by keyword.
+    num_positional = kinds.count(ARG_POS)
+    keywords = {name for kind, name in zip(kinds, names) if kind == ARG_NAMED}
+    keyword_only = False
+    # (type, kind, name) of each remaining argument; the ones bound by
+    # keyword go last (but before any **kwargs), since mypy matches up
+    # the arguments of two callable types by position when inferring
+    # type variables, as for the task_status argument of nursery.start()
+    arguments = []  # type: List[Tuple[Type, int, Optional[str]]]
+    bound_by_keyword = []  # type: List[Tuple[Type, int, Optional[str]]]
+    for typ, kind, name in zip(fn_type.arg_types, fn_type.arg_kinds, fn_type.arg_names):
+        if kind in (ARG_POS, ARG_OPT) and num_positional:
+            num_positional -= 1
+        elif kind == ARG_STAR:
+            num_positional = 0
+            if not keyword_only:
+                arguments.append((typ, kind, name))
+        elif kind == ARG_STAR2:
+            bound_by_keyword.append((typ, kind, name))
+        elif name in keywords:
+            keyword_only = keyword_only or kind in (ARG_POS, ARG_OPT)
+            bound_by_keyword.insert(0, (typ, ARG_NAMED_OPT, name))
+        elif keyword_only and kind in (ARG_POS, ARG_OPT):
+            kind = ARG_NAMED if kind == ARG_POS else ARG_NAMED_OPT
+            arguments.append((typ, kind, name))
+        else:
+            arguments.append((typ, kind, name))
+    if num_positional:
+        # Too many positional arguments, which we just reported
+        return None
+    arguments.extend(bound_by_keyword)
+    return fn_type.copy_modified(
+        arg_types=[typ for typ, _, _ in arguments],
+        arg_kinds=[kind for _, kind, _ in arguments],
+        arg_names=[name for _, _, name in arguments],
+    )
+
+
+def check_callable_and_args_call(
+    signature: CallableType, ctx: Union[FunctionContext, MethodContext], expanded: bool
+) -> Type:
+    """Check the call described by ``ctx``, to a @takes_callable_and_args
+    function with the undecorated signature ``signature``, against the
+    signature it takes on for the number of positional arguments passed,
+    and return the resulting return type.
+
+    This is how every call is checked in exact_arity mode, where
+    ``ctx`` describes a call to the lenient signature. Otherwise
+    (``expanded``), ``ctx`` describes a call to the overload for the
+    number of arguments passed, and mypy has already checked it, so
+    we only check again if the callable is a ``functools.partial()``:
+    we check against the partial's real signature rather than mypy's
+    type for it, which takes any arguments.
+    """
+    try:
+        indices = find_callable_and_args(signature)
+    except ValueError:
+        # Already reported when the decorator was applied
+        return ctx.default_return_type
+
+    callable_idx, _, args_idx = indices
+    if expanded:
+        # One formal for each positional argument passed
+        num_args = len(ctx.arg_types) - len(signature.arg_types) + 1
+        arg_kinds = ctx.arg_kinds[args_idx : args_idx + num_args]
+    else:
+        num_args = len(ctx.arg_types[args_idx])
+        arg_kinds = [ctx.arg_kinds[args_idx]]
+    if (
+        num_args < 0
+        or len(ctx.arg_types[callable_idx]) != 1
+        or any(kind != ARG_POS for kinds in arg_kinds for kind in kinds)
+    ):
+        # Callable not passed, or passed along with *args whose length
+        # we don't know -- stick with the lenient signature
+        return ctx.default_return_type
+
+    callable_type = partial_callable_type(
+        ctx.args[callable_idx][0], ctx.api
+    )  # type: Optional[Type]
+    if callable_type is None:
+        if expanded:
+            return ctx.default_return_type
+        callable_type = ctx.arg_types[callable_idx][0]
+        callable_ty = cast(CallableType, signature.arg_types[callable_idx])
+        if not is_subtype(
+            callable_type, erase_typevars(lenient_callable_type(callable_ty))
+        ):
+            # mypy already complained about this when checking the call
+            # against the lenient signature
+            return ctx.default_return_type
+
+    exact_type = expand_callable_and_args(
+        signature, indices, num_args, ctx.api, ctx.context
+    )
+    actuals = []  # type: List[Expression]
+    actual_kinds = []  # type: List[int]
+    actual_names = []  # type: List[Optional[str]]
+    for formal_idx, formal_types in enumerate(ctx.arg_types):
+        formal_names = ctx.arg_names[formal_idx]
+        for actual_idx, actual_type in enumerate(formal_types):
+            # Use the already-inferred types rather than the original
+            # expressions, so we don't typecheck the arguments again
+            actual = TempNode(
+                callable_type if formal_idx == callable_idx else actual_type
+            )
+            actual.set_line(ctx.args[formal_idx][actual_idx])
+            actuals.append(actual)
+            actual_kinds.append(ctx.arg_kinds[formal_idx][actual_idx])
+            actual_names.append(
+                formal_names[actual_idx] if actual_idx < len(formal_names) else None
+            )
+
+    private_api = cast(TypeChecker, ctx.api)
+    result_type, _ = private_api.expr_checker.check_call(
+        exact_type, actuals, actual_kinds, ctx.context, actual_names
+    )
+    return result_type
+
+
 def plugin(version: str) -> typing_Type[Plugin]:
     return TrioPlugin
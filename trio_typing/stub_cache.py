@@ -0,0 +1,224 @@
+"""Build and restore a prebuilt mypy cache for Trio's stubs.
+
+Most of the time mypy spends on a cold run of a small Trio program goes
+to analyzing typeshed and the stubs for Trio, outcome, and
+async_generator, which are the same for every project that uses the
+same versions of everything. This builds an incremental cache of just
+those modules once, stores it in an archive, and unpacks it into a
+project's cache directory before checking::
+
+    python -m trio_typing.stub_cache key
+    python -m trio_typing.stub_cache build -o stubs.tar.gz
+    python -m trio_typing.stub_cache restore stubs.tar.gz
+
+The archive is only restored if it was built for the same cache key,
+which covers the versions of mypy and trio-typing, the Python version
+and platform being checked for, and the mypy and ``[trio-typing]``
+settings from your config file. mypy notices that the stubs have moved
+(to wherever they're installed on this machine) and checks their
+contents, not their paths, so the archive can be built in one
+environment and restored in another.
+"""
+
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+__all__ = ["cache_key"]
+
+# The module that the cache is built by checking; everything it imports,
+# directly or not, ends up in the archive
+STUB_PROGRAM = (
+    "import async_generator\n"
+    "import outcome\n"
+    "import trio\n"
+    "import trio.abc\n"
+    "import trio.hazmat\n"
+    "import trio.socket\n"
+    "import trio.testing\n"
+    "import trio_typing\n"
+)
+
+METADATA_NAME = "trio-typing-stub-cache.json"
+
+
+def mypy_options(config_file: Optional[str]) -> Tuple[List[Any], Any]:
+    """Return the build sources for checking :data:`STUB_PROGRAM`, and
+    the mypy options from ``config_file`` (or wherever mypy would find
+    its config by default, if that's None).
+    """
+    from mypy.main import process_options
+
+    args = [] if config_file is None else ["--config-file", config_file]
+    return process_options(args + ["-c", STUB_PROGRAM])
+
+
+def cache_key(options: Any) -> str:
+    """Return the key that a stub cache built with the given mypy
+    options is stored under. A cache can be used only by builds with
+    the same key.
+    """
+    import mypy.version
+    from ._version import __version__
+    from .plugin import PluginConfig
+
+    settings = {
+        "options": options.select_options_affecting_cache(),
+        "per_module_options": options.per_module_options,
+        "trio_typing": PluginConfig.from_config_file(options.config_file).as_dict(),
+    }
+    encoded = json.dumps(settings, sort_keys=True, default=repr).encode("utf-8")
+    return "mypy-{}-trio-typing-{}-py{}.{}-{}-{}".format(
+        mypy.version.__version__,
+        __version__,
+        options.python_version[0],
+        options.python_version[1],
+        options.platform,
+        hashlib.sha1(encoded).hexdigest()[:12],
+    )
+
+
+@contextlib.contextmanager
+def temporary_directory() -> Iterator[str]:
+    directory = tempfile.mkdtemp(prefix="trio-typing-stub-cache-")
+    try:
+        yield directory
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def build_archive(config_file: Optional[str], output: Optional[str]) -> int:
+    from mypy import build
+
+    sources, options = mypy_options(config_file)
+    if options.sqlite_cache:
+        print("the SQLite cache (sqlite_cache = True) isn't supported", file=sys.stderr)
+        return 1
+    key = cache_key(options)
+    if output is None:
+        output = "trio-typing-stub-cache-{}.tar.gz".format(key)
+
+    with temporary_directory() as cache_dir:
+        options.incremental = True
+        options.cache_dir = cache_dir
+        result = build.build(sources, options)
+        if result.errors:
+            for line in result.errors:
+                print(line, file=sys.stderr)
+            return 1
+        # The program itself isn't part of the cache
+        version_dir = os.path.join(cache_dir, "{}.{}".format(*options.python_version))
+        for name in os.listdir(version_dir):
+            if name.startswith("__main__."):
+                os.remove(os.path.join(version_dir, name))
+
+        metadata = json.dumps({"key": key}, sort_keys=True).encode("utf-8")
+        metadata_path = os.path.join(cache_dir, METADATA_NAME)
+        with open(metadata_path, "wb") as file:
+            file.write(metadata)
+        with tarfile.open(output, "w:gz") as archive:
+            archive.add(metadata_path, arcname=METADATA_NAME)
+            for name in sorted(os.listdir(cache_dir)):
+                if name != METADATA_NAME:
+                    archive.add(os.path.join(cache_dir, name), arcname=name)
+
+    print(output)
+    return 0
+
+
+def is_safe_member(member: tarfile.TarInfo) -> bool:
+    parts = member.name.split("/")
+    return (
+        (member.isfile() or member.isdir())
+        and not os.path.isabs(member.name)
+        and ".." not in parts
+    )
+
+
+def restore_archive(
+    path: str, config_file: Optional[str], cache_dir: Optional[str]
+) -> int:
+    _, options = mypy_options(config_file)
+    key = cache_key(options)
+    if cache_dir is None:
+        cache_dir = options.cache_dir
+
+    with tarfile.open(path, "r:gz") as archive:
+        try:
+            metadata_file = archive.extractfile(METADATA_NAME)
+        except KeyError:
+            metadata_file = None
+        if metadata_file is None:
+            print("{}: not a stub cache archive".format(path), file=sys.stderr)
+            return 1
+        encoded = metadata_file.read().decode("utf-8")
+        metadata = json.loads(encoded)  # type: Dict[str, Any]
+        if metadata.get("key") != key:
+            print(
+                "{}: built for {}, but this environment needs {}; "
+                "not restoring".format(path, metadata.get("key"), key),
+                file=sys.stderr,
+            )
+            return 1
+        members = []  # type: List[tarfile.TarInfo]
+        for member in archive.getmembers():
+            if member.name == METADATA_NAME:
+                continue
+            if not is_safe_member(member):
+                print(
+                    "{}: refusing to extract {!r}".format(path, member.name),
+                    file=sys.stderr,
+                )
+                return 1
+            members.append(member)
+        # This keeps the files' modification times, which mypy compares
+        # with the ones it recorded for them
+        archive.extractall(cache_dir, members)
+    return 0
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m trio_typing.stub_cache", description=__doc__.split("\n\n")[0]
+    )
+    parser.add_argument(
+        "--config-file",
+        help="mypy config file to use (default: wherever mypy would look)",
+    )
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND")
+    commands.required = True
+    commands.add_parser("key", help="print the cache key for this environment")
+    build_parser = commands.add_parser("build", help="build a stub cache archive")
+    build_parser.add_argument(
+        "-o",
+        "--output",
+        help="where to write the archive "
+        "(default: trio-typing-stub-cache-KEY.tar.gz)",
+    )
+    restore_parser = commands.add_parser(
+        "restore", help="unpack a stub cache archive into mypy's cache directory"
+    )
+    restore_parser.add_argument("archive")
+    restore_parser.add_argument(
+        "--cache-dir", help="mypy cache directory (default: the one mypy would use)"
+    )
+    args = parser.parse_args(argv)
+
+    if args.command == "key":
+        _, options = mypy_options(args.config_file)
+        print(cache_key(options))
+        return 0
+    if args.command == "build":
+        return build_archive(args.config_file, args.output)
+    return restore_archive(args.archive, args.config_file, args.cache_dir)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,394 @@
+"""Opt-in runtime checks for some of the things that trio_typing's mypy
+plugin checks statically, for use in testing or staging environments.
+
+Decorate a function with :func:`validated` to check, when it's called:
+
+* values passed to ``task_status.started()``, if it takes a parameter
+  annotated as ``TaskStatus[T]``
+* values sent on any channel passed in a parameter annotated as
+  ``trio.abc.SendChannel[T]`` or ``trio.MemorySendChannel[T]`` (such as
+  one end of an ``open_memory_channel[T]()``)
+* values yielded by an async generator, and values sent into it with
+  ``asend()``, if it's annotated as returning ``CompatAsyncGenerator[Y,
+  S, R]``, ``Union[..., YieldType[Y], SendType[S]]`` (for
+  ``@async_generator``), ``AsyncGenerator[Y, S]``, or
+  ``AsyncIterator[Y]``
+
+Type checks are shallow: a value passes if it's an instance of the
+annotated class (``List[int]`` accepts any list), or of one member of a
+``Union``. ``Any``, type variables, and other types that can't be
+checked with ``isinstance()`` accept everything. A failed check raises
+:exc:`TypeError`.
+
+The annotations are inspected once, when the function is decorated.
+Validation is off unless the ``TRIO_TYPING_VALIDATE`` environment
+variable is set to something other than ``0``, or :func:`enable` has
+been called, at that time; when it's off, :func:`validated` returns the
+function unchanged, so leaving the decorator in production code costs
+nothing per call.
+"""
+
+import collections.abc
+import inspect
+import os
+import typing
+from functools import partial, wraps
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar, cast
+
+import trio
+from . import CompatAsyncGenerator, SendType, TaskStatus, YieldType
+
+__all__ = ["validated", "enable", "is_enabled", "VALIDATE_ENV_VAR"]
+
+# Environment variable that turns validation on for functions decorated
+# with @validated
+VALIDATE_ENV_VAR = "TRIO_TYPING_VALIDATE"
+
+_enabled = os.environ.get(VALIDATE_ENV_VAR, "0") not in ("", "0")
+
+F = TypeVar("F", bound=Callable[..., Any])
+Check = Callable[[Any], bool]
+Wrapper = Callable[[Any], Any]
+
+
+def enable(enabled: bool = True) -> None:
+    """Turn validation on or off for functions decorated from now on.
+    Functions that have already been decorated aren't affected.
+    """
+    global _enabled
+    _enabled = enabled
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def _origin(tp: Any) -> Any:
+    """Return the class (or special form, like Union) that the
+    subscripted generic ``tp`` was made from, or None if ``tp`` isn't
+    subscripted.
+    """
+    origin = getattr(tp, "__origin__", None)
+    # Python 3.6: typing.List[int].__origin__ is typing.List, whose
+    # __extra__ is the runtime class
+    return getattr(origin, "__extra__", None) or origin
+
+
+def _type_name(tp: Any) -> str:
+    if tp is None or tp is type(None):
+        return "None"
+    if isinstance(tp, type) and getattr(tp, "__origin__", None) is None:
+        return tp.__qualname__
+    return repr(tp).replace("typing.", "")
+
+
+def _is_none(value: Any) -> bool:
+    return value is None
+
+
+_checks = {}  # type: Dict[Any, Optional[Check]]
+
+
+def type_check(tp: Any) -> Optional[Check]:
+    """Return a function that tells whether a value matches the type
+    annotation ``tp``, or None if every value does (or we can't tell).
+    The result is cached, so each annotation is only examined once.
+    """
+    try:
+        return _checks[tp]
+    except KeyError:
+        check = _checks[tp] = _compile_check(tp)
+        return check
+    except TypeError:
+        # unhashable annotation
+        return _compile_check(tp)
+
+
+def _compile_check(tp: Any) -> Optional[Check]:
+    if tp is None or tp is type(None):
+        return _is_none
+    if tp is Any or tp is object or type(tp) is TypeVar:
+        return None
+    origin = _origin(tp)
+    if origin is typing.Union:
+        checks = [type_check(arg) for arg in tp.__args__]
+        if None in checks:
+            return None
+        return lambda value: any(check(value) for check in cast(List[Check], checks))
+    if origin is not None:
+        tp = origin
+    if isinstance(tp, type):
+        return lambda value: isinstance(value, tp)
+    return None
+
+
+class _CheckedTaskStatus:
+    __slots__ = ("_status", "_check", "_expected", "_where")
+
+    def __init__(self, status: Any, check: Check, expected: str, where: str) -> None:
+        self._status = status
+        self._check = check
+        self._expected = expected
+        self._where = where
+
+    def started(self, value: Any = None) -> None:
+        if not self._check(value):
+            raise TypeError(
+                "{}: task_status.started() expected {}, got {!r}".format(
+                    self._where, self._expected, value
+                )
+            )
+        self._status.started(value)
+
+
+TaskStatus.register(_CheckedTaskStatus)
+
+
+class _CheckedSendChannel(trio.abc.SendChannel[Any]):
+    def __init__(
+        self,
+        channel: trio.abc.SendChannel[Any],
+        check: Check,
+        expected: str,
+        where: str,
+    ) -> None:
+        self._channel = channel
+        self._check = check
+        self._expected = expected
+        self._where = where
+
+    def _validate(self, value: Any) -> None:
+        if not self._check(value):
+            raise TypeError(
+                "{}: channel send expected {}, got {!r}".format(
+                    self._where, self._expected, value
+                )
+            )
+
+    def send_nowait(self, value: Any) -> None:
+        self._validate(value)
+        self._channel.send_nowait(value)
+
+    async def send(self, value: Any) -> None:
+        self._validate(value)
+        await self._channel.send(value)
+
+    def clone(self) -> "_CheckedSendChannel":
+        return _CheckedSendChannel(
+            self._channel.clone(), self._check, self._expected, self._where
+        )
+
+    async def aclose(self) -> None:
+        await self._channel.aclose()
+
+    def __getattr__(self, name: str) -> Any:
+        # statistics(), etc
+        return getattr(self._channel, name)
+
+
+class _CheckedAsyncGenerator:
+    __slots__ = (
+        "_agen",
+        "_check_yield",
+        "_check_send",
+        "_expected_yield",
+        "_expected_send",
+        "_where",
+        "_started",
+    )
+
+    def __init__(
+        self,
+        agen: Any,
+        check_yield: Optional[Check],
+        check_send: Optional[Check],
+        expected_yield: str,
+        expected_send: str,
+        where: str,
+    ) -> None:
+        self._agen = agen
+        self._check_yield = check_yield
+        self._check_send = check_send
+        self._expected_yield = expected_yield
+        self._expected_send = expected_send
+        self._where = where
+        self._started = False
+
+    def _validate_yield(self, value: Any) -> Any:
+        if self._check_yield is not None and not self._check_yield(value):
+            raise TypeError(
+                "{}: async generator yielded {!r}, expected {}".format(
+                    self._where, value, self._expected_yield
+                )
+            )
+        return value
+
+    def __aiter__(self) -> "_CheckedAsyncGenerator":
+        return self
+
+    async def __anext__(self) -> Any:
+        self._started = True
+        return self._validate_yield(await self._agen.__anext__())
+
+    async def asend(self, value: Any) -> Any:
+        # The first asend() must send None to start the generator
+        if self._started and self._check_send is not None:
+            if not self._check_send(value):
+                raise TypeError(
+                    "{}: asend() expected {}, got {!r}".format(
+                        self._where, self._expected_send, value
+                    )
+                )
+        self._started = True
+        return self._validate_yield(await self._agen.asend(value))
+
+    async def athrow(self, *args: Any) -> Any:
+        return self._validate_yield(await self._agen.athrow(*args))
+
+    async def aclose(self) -> None:
+        await self._agen.aclose()
+
+    def __getattr__(self, name: str) -> Any:
+        # ag_running, ag_frame, etc
+        return getattr(self._agen, name)
+
+
+CompatAsyncGenerator.register(_CheckedAsyncGenerator)
+
+
+def _type_hints(fn: Callable[..., Any]) -> Dict[str, Any]:
+    try:
+        return typing.get_type_hints(fn)
+    except Exception:
+        # Forward references that can't be resolved yet: use whatever
+        # annotations aren't strings
+        return {
+            name: hint
+            for name, hint in getattr(fn, "__annotations__", {}).items()
+            if not isinstance(hint, str)
+        }
+
+
+def _argument_wrapper(hint: Any, where: str) -> Optional[Wrapper]:
+    """Return a function that wraps an argument annotated with ``hint``
+    to check what's done with it, or None if it doesn't need checking.
+    """
+    origin = _origin(hint)
+    if not isinstance(origin, type) or not getattr(hint, "__args__", None):
+        return None
+    arg = hint.__args__[0]
+    check = type_check(arg)
+    if check is None:
+        return None
+    expected = _type_name(arg)
+    if origin is TaskStatus:
+        return partial(_CheckedTaskStatus, check=check, expected=expected, where=where)
+    if issubclass(origin, trio.abc.SendChannel):
+        return partial(_CheckedSendChannel, check=check, expected=expected, where=where)
+    return None
+
+
+def _agen_types(hint: Any) -> Optional[Tuple[Any, Any]]:
+    """Return the yield and send types from the return annotation of an
+    async generator function, or None if it doesn't describe one.
+    """
+    origin = _origin(hint)
+    args = getattr(hint, "__args__", None) or ()
+    if origin is typing.Union:
+        yield_type = send_type = Any  # type: Any
+        found = False
+        for member in args:
+            member_origin = _origin(member)
+            if member_origin is YieldType:
+                yield_type, found = member.__args__[0], True
+            elif member_origin is SendType:
+                send_type, found = member.__args__[0], True
+        return (yield_type, send_type) if found else None
+    if not isinstance(origin, type) or not args:
+        return None
+    if issubclass(origin, collections.abc.AsyncGenerator):
+        return args[0], args[1]
+    if issubclass(origin, collections.abc.AsyncIterable):
+        return args[0], Any
+    return None
+
+
+def _result_wrapper(hint: Any, where: str) -> Optional[Wrapper]:
+    types = _agen_types(hint)
+    if types is None:
+        return None
+    check_yield, check_send = type_check(types[0]), type_check(types[1])
+    if check_yield is None and check_send is None:
+        return None
+    expected_yield, expected_send = _type_name(types[0]), _type_name(types[1])
+    return partial(
+        _CheckedAsyncGenerator,
+        check_yield=check_yield,
+        check_send=check_send,
+        expected_yield=expected_yield,
+        expected_send=expected_send,
+        where=where,
+    )
+
+
+def validated(fn: F) -> F:
+    """Decorator that checks, at runtime, the values that ``fn`` reports
+    through its ``TaskStatus``, sends on its ``SendChannel`` arguments,
+    and yields or receives if it's an async generator, against its
+    annotations. Does nothing unless validation is enabled; see the
+    module documentation.
+    """
+    if not _enabled:
+        return fn
+
+    where = getattr(fn, "__qualname__", repr(fn))
+    hints = _type_hints(fn)
+    # (position, keyword, wrapper) for each parameter that needs wrapping
+    arg_wrappers = []  # type: List[Tuple[Optional[int], Optional[str], Wrapper]]
+    for index, param in enumerate(inspect.signature(fn).parameters.values()):
+        wrapper = _argument_wrapper(hints.get(param.name), where)
+        if wrapper is None:
+            continue
+        position = None  # type: Optional[int]
+        keyword = None  # type: Optional[str]
+        if param.kind in (param.POSITIONAL_ONLY, param.POSITIONAL_OR_KEYWORD):
+            position = index
+        if param.kind in (param.POSITIONAL_OR_KEYWORD, param.KEYWORD_ONLY):
+            keyword = param.name
+        arg_wrappers.append((position, keyword, wrapper))
+
+    result_wrapper = None  # type: Optional[Wrapper]
+    if not inspect.iscoroutinefunction(fn):
+        # Native async generator functions, and @async_generator ones,
+        # which are synchronous functions that return an async generator
+        result_wrapper = _result_wrapper(hints.get("return"), where)
+
+    if not arg_wrappers and result_wrapper is None:
+        return fn
+
+    def wrap_args(args: Tuple[Any, ...], kwargs: Dict[str, Any]) -> Tuple[Any, ...]:
+        for position, keyword, wrapper in arg_wrappers:
+            if keyword is not None and keyword in kwargs:
+                kwargs[keyword] = wrapper(kwargs[keyword])
+            elif position is not None and position < len(args):
+                args = (
+                    args[:position] + (wrapper(args[position]),) + args[position + 1 :]
+                )
+        return args
+
+    if inspect.iscoroutinefunction(fn):
+
+        @wraps(fn)
+        async def validated_coroutine_function(*args: Any, **kwargs: Any) -> Any:
+            return await fn(*wrap_args(args, kwargs), **kwargs)
+
+        return cast(F, validated_coroutine_function)
+
+    @wraps(fn)
+    def validated_function(*args: Any, **kwargs: Any) -> Any:
+        result = fn(*wrap_args(args, kwargs), **kwargs)
+        if result_wrapper is not None:
+            return result_wrapper(result)
+        return result
+
+    return cast(F, validated_function)